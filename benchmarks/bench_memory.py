@@ -0,0 +1,62 @@
+"""
+Memory benchmark: DataFrame sheets vs compact Spectrum objects.
+
+    python benchmarks/bench_memory.py [--sheets 40] [--peaks 20000]
+
+Reports the resident size of a loaded workbook held as filtered DataFrames
+(as load_data returns it) and as float64/float32 Spectrum objects, plus the
+bytes allocated by one "normalized plot" click: the old path (rescaled
+DataFrame copy) against the app's (DataFrame of views on the sheet's
+Spectrum, the live S/N cut, and a scale factor).
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from spectra.loading import normalization_scale, normalize  # noqa: E402
+from spectra.readers import MIN_SN, filter_sheet, sn_filter  # noqa: E402
+from spectra.spectrum import Spectrum  # noqa: E402
+from synthetic import synthetic_spectrum  # noqa: E402
+
+
+def alloc_bytes(fn) -> int:
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sheets", type=int, default=40)
+    parser.add_argument("--peaks", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = {f"S{i}": filter_sheet(f"S{i}", synthetic_spectrum(args.peaks, rng)) for i in range(args.sheets)}
+    df_bytes = sum(int(df.memory_usage(deep=True).sum()) for df in frames.values())
+    print(f"{args.sheets} sheets x {args.peaks} raw peaks")
+    print(f"  DataFrames (load_data):   {df_bytes / 1e6:8.1f} MB")
+    for precision in ("float64", "float32"):
+        spectra = [Spectrum.from_frame(n, df, precision) for n, df in frames.items()]
+        sp_bytes = sum(s.nbytes for s in spectra)
+        print(f"  Spectrum ({precision}):      {sp_bytes / 1e6:8.1f} MB  ({df_bytes / sp_bytes:.1f}x smaller)")
+
+    df = frames["S0"]
+    # The app keeps every peak of a sheet (LazyWorkbook(min_sn=None)) and applies the S/N cut on each draw.
+    spectrum = Spectrum.from_frame("S0", filter_sheet("S0", synthetic_spectrum(args.peaks, rng), None))
+    old = alloc_bytes(lambda: normalize(df.copy()))
+    app = alloc_bytes(lambda: normalization_scale(sn_filter(spectrum.frame(), MIN_SN)))
+    print("Per normalized-plot click, one sheet")
+    print(f"  old (copy + rescale):     {old / 1e3:8.1f} kB")
+    print(f"  app (view + S/N + scale): {app / 1e3:8.1f} kB")
+
+
+if __name__ == "__main__":
+    main()
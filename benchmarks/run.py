@@ -0,0 +1,175 @@
+"""
+Stage benchmarks for the matcher, loader and renderer.
+
+    python benchmarks/run.py                        # 1k, 10k, 100k, 1M peaks
+    python benchmarks/run.py --sizes 1000 10000 --repeat 5
+    python benchmarks/run.py --compare benchmarks/results/<earlier>.json
+
+Each stage is timed (best of --repeat runs) and its peak Python allocation is
+measured with tracemalloc in a separate run. Results are written as JSON to
+benchmarks/results/ (or --out) so runs can be compared with --compare.
+
+Stages:
+    match       compare_dfs(sample, blank) on filtered sheets
+    dual        dual_compare(sample, blank)
+    load        load_data on a synthetic 3-sheet .xlsx (cache disabled)
+    load_cached load_data again with the sheet cache warm
+    render      draw_spectrum + tight_layout + SVG to memory (Agg)
+    render_dual draw_dual_spectrum, likewise
+
+Writing .xlsx files is slow and Excel caps sheets at ~1M rows, so the load
+stages only run up to --max-load-peaks.
+"""
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from matplotlib.figure import Figure  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from spectra import compare_dfs, dual_compare, load_data  # noqa: E402
+from spectra.plotting import FIGSIZE, draw_dual_spectrum, draw_spectrum  # noqa: E402
+from spectra.readers import filter_sheet  # noqa: E402
+from synthetic import synthetic_batch, write_workbook  # noqa: E402
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+STAGES = ("match", "dual", "load", "load_cached", "render", "render_dual")
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"best_s": min(times), "median_s": float(np.median(times)), "peak_bytes": peak}
+
+
+def render(df: pd.DataFrame) -> None:
+    fig = Figure(figsize=FIGSIZE)
+    draw_spectrum(fig.add_subplot(), df, "benchmark", 10)
+    fig.tight_layout()
+    fig.savefig(io.BytesIO(), format="svg")
+
+
+def render_dual(up: pd.DataFrame, down: pd.DataFrame) -> None:
+    fig = Figure(figsize=FIGSIZE)
+    draw_dual_spectrum(fig.add_subplot(), up, down, "benchmark", 10)
+    fig.tight_layout()
+    fig.savefig(io.BytesIO(), format="svg")
+
+
+def run_size(n: int, stages: List[str], repeat: int, max_load_peaks: int, workdir: str) -> Dict[str, Dict]:
+    raw = synthetic_batch(["Blank", "Sample1", "Sample2"], n, seed=n)
+    sheets = {name: filter_sheet(name, df) for name, df in raw.items()}
+    blank, sample = sheets["Blank"], sheets["Sample1"]
+    results: Dict[str, Dict] = {}
+
+    if "match" in stages:
+        results["match"] = measure(lambda: compare_dfs(sample, blank), repeat)
+    if "dual" in stages:
+        results["dual"] = measure(lambda: dual_compare(sample, blank), repeat)
+    if ("load" in stages or "load_cached" in stages) and n <= max_load_peaks:
+        path = write_workbook(os.path.join(workdir, f"synthetic_{n}.xlsx"), raw)
+        if "load" in stages:
+            results["load"] = measure(lambda: load_data(6, path, use_cache=False), max(1, repeat // 2))
+        if "load_cached" in stages:
+            load_data(6, path)
+            results["load_cached"] = measure(lambda: load_data(6, path), repeat)
+    if "render" in stages:
+        results["render"] = measure(lambda: render(sample), max(1, repeat // 2))
+    if "render_dual" in stages:
+        up, down = dual_compare(sample, blank)
+        results["render_dual"] = measure(lambda: render_dual(up, down), max(1, repeat // 2))
+
+    for stage in results.values():
+        stage["peaks"] = n
+        stage["filtered_peaks"] = len(sample)
+    return results
+
+
+def environment() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                                text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "matplotlib": matplotlib.__version__,
+    }
+
+
+def print_table(results: Dict[str, Dict[str, Dict]], baseline: Optional[Dict] = None) -> None:
+    print(f"{'peaks':>9} {'stage':<12} {'best':>10} {'peak mem':>10}" + ("  vs baseline" if baseline else ""))
+    for size, stages in results.items():
+        for stage, r in stages.items():
+            line = f"{size:>9} {stage:<12} {r['best_s'] * 1e3:>8.1f}ms {r['peak_bytes'] / 1e6:>8.1f}MB"
+            old = (baseline or {}).get(size, {}).get(stage)
+            if old:
+                line += f"  {old['best_s'] / r['best_s']:5.2f}x time, {old['peak_bytes'] / max(r['peak_bytes'], 1):5.2f}x mem"
+            print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark matcher, loader and renderer on synthetic spectra")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="raw peaks per sheet")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-load-peaks", type=int, default=100_000,
+                        help="largest size for which an .xlsx is written and loaded (default: 100000)")
+    parser.add_argument("--out", help="result JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict[str, Dict]] = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in args.sizes:
+            print(f"running {n} peaks ...", file=sys.stderr)
+            results[str(n)] = run_size(n, args.stages, args.repeat, args.max_load_peaks, workdir)
+
+    env = environment()
+    out = args.out or os.path.join(HERE, "results", env["timestamp"].replace(":", "") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as fh:
+        json.dump({"environment": env, "results": results}, fh, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)["results"]
+    print_table(results, baseline)
+    print(f"results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""
+SPECTRA CORE
+------------
+Non-GUI building blocks shared by the Qt app (spectra_app_NEWGUI.py) and the
+batch command line (python -m spectra).
+"""
+from .alignment import PeakMatrix, align
+from .background import BackgroundDB
+from .families import PeakFamilies, family_subtract, group_families
+from .incremental import LiveMatch
+from .loading import REQUIRED_COLUMNS, load_data, normalize
+from .matching import PeakIndex, compare_dfs, dual_compare, dual_subtract, fold_change_subtract, multi_subtract
+from .recalibration import Recalibration, fit_drift, recalibrate
+from .spectrum import Spectrum
+from .store import SpectrumStore
+from .tables import TableWriter
+from .workbook import LazyWorkbook
+
+__all__ = [
+    "BackgroundDB",
+    "REQUIRED_COLUMNS",
+    "LazyWorkbook",
+    "LiveMatch",
+    "PeakFamilies",
+    "PeakIndex",
+    "PeakMatrix",
+    "Recalibration",
+    "Spectrum",
+    "SpectrumStore",
+    "TableWriter",
+    "align",
+    "compare_dfs",
+    "dual_compare",
+    "dual_subtract",
+    "family_subtract",
+    "fit_drift",
+    "fold_change_subtract",
+    "group_families",
+    "load_data",
+    "multi_subtract",
+    "normalize",
+    "recalibrate",
+]
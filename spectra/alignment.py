@@ -0,0 +1,204 @@
+"""
+Batch alignment of many spectra into one peak matrix.
+
+align pools the peaks of every sheet and sorts them by m/z once. In that
+order, consecutive peaks belong to the same feature when they would match
+(their half widths overlap and they are within ``ppm_tol``, as in
+spectra.matching). Chaining can make a feature grow wider than any two of
+its peaks would match, so a feature spanning more than twice ``ppm_tol`` is
+split at its widest gap until none is. Each feature gets a consensus m/z
+(intensity-weighted mean) and one value per sample that has it.
+
+PeakMatrix keeps only the present values, row by row (CSR layout without
+scipy), so 30 sheets of 100k peaks stay a few MB. Blank, presence and
+replicate filters are per-feature reductions over that layout, so each one
+is a single vectorized pass over the whole batch instead of pairwise
+compare_dfs calls.
+"""
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import stage
+from .matching import _half_widths
+
+
+def _starts(mz: np.ndarray, half_width: np.ndarray, ppm_tol: float) -> np.ndarray:
+    # True where a peak does not match the one before it in m/z order.
+    gap = np.diff(mz)
+    linked = (gap <= half_width[1:] + half_width[:-1]) & (gap / ((mz[1:] + mz[:-1]) / 2) * 1e6 <= ppm_tol)
+    return np.r_[True, ~linked]
+
+
+def _split_wide(mz: np.ndarray, starts: np.ndarray, max_span_ppm: float) -> np.ndarray:
+    # Split every feature wider than max_span_ppm at its largest gap, one pass per level of splitting.
+    gap = np.r_[0.0, np.diff(mz)]
+    while True:
+        first = np.flatnonzero(starts)
+        sizes = np.diff(np.r_[first, len(mz)])
+        last = first + sizes - 1
+        wide = (mz[last] - mz[first]) / mz[first] * 1e6 > max_span_ppm
+        if not wide.any():
+            return starts
+        inner = np.where(starts, -1.0, gap)
+        largest = np.repeat(np.maximum.reduceat(inner, first), sizes)
+        at_max = np.flatnonzero((inner == largest) & np.repeat(wide, sizes))
+        owner = np.searchsorted(first, at_max, side="right")
+        starts = starts.copy()
+        starts[at_max[np.r_[True, owner[1:] != owner[:-1]]]] = True
+
+
+class PeakMatrix:
+    """
+    Features (rows, by consensus m/z) by samples (columns). ``indptr``, ``sample`` and ``values``
+    are in CSR layout: the samples and values of feature i are at indptr[i]:indptr[i + 1], sorted
+    by sample. ``span_ppm`` is the m/z spread of each feature's peaks.
+    """
+
+    def __init__(self, mz: np.ndarray, span_ppm: np.ndarray, samples: Sequence[str], indptr: np.ndarray,
+                 sample: np.ndarray, values: np.ndarray):
+        self.mz = mz
+        self.span_ppm = span_ppm
+        self.samples = list(samples)
+        self.indptr = indptr
+        self.sample = sample
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.mz)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.mz), len(self.samples)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.values)
+
+    def _columns(self, names: Iterable[str]) -> np.ndarray:
+        missing = [name for name in names if name not in self.samples]
+        if missing:
+            raise KeyError(f"Not in the matrix: {', '.join(missing)}")
+        return np.array([self.samples.index(name) for name in names], dtype=np.int64)
+
+    def _reduce(self, values: np.ndarray, op=np.add) -> np.ndarray:
+        # One value per feature; every feature has at least one entry.
+        return op.reduceat(values, self.indptr[:-1]) if len(self.mz) else np.zeros(0)
+
+    def count(self, samples: Optional[Iterable[str]] = None) -> np.ndarray:
+        """Number of ``samples`` (default: all) each feature is present in."""
+        if samples is None:
+            return np.diff(self.indptr)
+        return self._reduce(np.isin(self.sample, self._columns(samples)).astype(np.int64))
+
+    def max(self, samples: Optional[Iterable[str]] = None) -> np.ndarray:
+        """Largest value of each feature over ``samples`` (default: all); 0 where absent from all of them."""
+        values = self.values
+        if samples is not None:
+            values = np.where(np.isin(self.sample, self._columns(samples)), values, 0.0)
+        return self._reduce(values, np.maximum)
+
+    def present(self, samples: Optional[Iterable[str]] = None, min_count: int = 1) -> np.ndarray:
+        """Mask of the features present in at least ``min_count`` of ``samples`` (default: all)."""
+        return self.count(samples) >= min_count
+
+    def above_blank(self, blanks: Iterable[str], min_ratio: float = 3.0) -> np.ndarray:
+        """
+        Mask of the features whose largest value outside ``blanks`` is at least ``min_ratio`` times
+        their largest value in ``blanks`` (features absent from every blank always pass).
+        """
+        blanks = list(blanks)
+        others = [name for name in self.samples if name not in blanks]
+        return self.max(others) >= min_ratio * self.max(blanks)
+
+    def consistent(self, groups: Mapping[str, Sequence[str]], min_fraction: float = 1.0,
+                   max_cv: Optional[float] = None) -> np.ndarray:
+        """
+        Mask of the features that, in at least one replicate group, are present in ``min_fraction``
+        of its samples and (with ``max_cv``) vary by no more than that coefficient of variation
+        over the samples they are present in.
+        """
+        keep = np.zeros(len(self.mz), dtype=bool)
+        for names in groups.values():
+            member = np.isin(self.sample, self._columns(names))
+            n = self._reduce(member.astype(np.int64))
+            passed = n >= min_fraction * len(names)
+            if max_cv is not None:
+                values = np.where(member, self.values, 0.0)
+                total, squares = self._reduce(values), self._reduce(values ** 2)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    mean = total / n
+                    std = np.sqrt(np.maximum(squares / n - mean ** 2, 0.0))
+                    passed &= std <= max_cv * mean
+            keep |= passed
+        return keep
+
+    def select(self, mask: np.ndarray) -> "PeakMatrix":
+        """The features where ``mask`` is True."""
+        counts = np.diff(self.indptr)[mask]
+        entries = np.repeat(mask, np.diff(self.indptr))
+        return PeakMatrix(self.mz[mask], self.span_ppm[mask], self.samples, np.r_[0, np.cumsum(counts)],
+                          self.sample[entries], self.values[entries])
+
+    def to_dense(self, fill: float = 0.0) -> np.ndarray:
+        dense = np.full(self.shape, fill)
+        dense[np.repeat(np.arange(len(self.mz)), np.diff(self.indptr)), self.sample] = self.values
+        return dense
+
+    def to_frame(self, sparse: bool = False) -> pd.DataFrame:
+        """
+        "m/z", "Span (ppm)", "Samples" (presence count) and one column per sample, NaN where absent;
+        with ``sparse``, sample columns are pandas sparse arrays holding only the present values.
+        """
+        columns: Dict[str, object] = {"m/z": self.mz, "Span (ppm)": self.span_ppm, "Samples": self.count()}
+        row = np.repeat(np.arange(len(self.mz)), np.diff(self.indptr))
+        for j, name in enumerate(self.samples):
+            entries = self.sample == j
+            column = np.full(len(self.mz), np.nan)
+            column[row[entries]] = self.values[entries]
+            columns[name] = pd.arrays.SparseArray(column) if sparse else column
+        return pd.DataFrame(columns)
+
+
+def align(frames: Mapping[str, pd.DataFrame], ppm_tol: float = 3.0, column: str = "Intensity") -> PeakMatrix:
+    """
+    Group the peaks of every frame into features and return their ``column`` values as a PeakMatrix.
+    A sample with several peaks in one feature contributes its largest value.
+    """
+    names: List[str] = list(frames)
+    parts = [df.dropna(subset=["m/z"]) for df in frames.values()]
+    n_peaks = sum(len(df) for df in parts)
+    with stage("align", samples=len(names), peaks=n_peaks):
+        mz = np.concatenate([df["m/z"].to_numpy(dtype=np.float64) for df in parts]) if parts else np.zeros(0)
+        res = np.concatenate([df["Resolution"].to_numpy(dtype=np.float64) for df in parts]) if parts else np.zeros(0)
+        values = np.concatenate([df[column].to_numpy(dtype=np.float64) for df in parts]) if parts else np.zeros(0)
+        sample = np.repeat(np.arange(len(parts)), [len(df) for df in parts])
+        order = np.argsort(mz, kind="stable")
+        mz, res, values, sample = mz[order], res[order], values[order], sample[order]
+        if len(mz) == 0:
+            return PeakMatrix(mz, mz, names, np.zeros(1, dtype=np.int64), sample, values)
+
+        starts = _split_wide(mz, _starts(mz, _half_widths(mz, res), ppm_tol), 2 * ppm_tol)
+        feature = np.cumsum(starts) - 1
+        n_features = int(feature[-1]) + 1
+        first = np.flatnonzero(starts)
+        last = np.r_[first[1:], len(mz)] - 1
+        span = (mz[last] - mz[first]) / mz[first] * 1e6
+        weights = np.nan_to_num(values)
+        total = np.bincount(feature, weights=weights, minlength=n_features)
+        weighted = np.bincount(feature, weights=weights * mz, minlength=n_features)
+        plain = np.bincount(feature, weights=mz, minlength=n_features) / np.bincount(feature, minlength=n_features)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            consensus = np.where(total > 0, weighted / total, plain)
+
+        # One entry per (feature, sample) with the largest value. Features already come in order, so
+        # the stable sort on this key only reorders samples within each feature.
+        key = feature * len(names) + sample
+        entry = np.argsort(key, kind="stable")
+        key = key[entry]
+        pair = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        values = np.fmax.reduceat(values[entry], pair)
+        feature, sample = np.divmod(key[pair], len(names))
+        indptr = np.r_[0, np.cumsum(np.bincount(feature, minlength=n_features))]
+        return PeakMatrix(consensus, span, names, indptr, sample, values)
@@ -0,0 +1,136 @@
+"""
+Persistent database of known background ions (plasticizers, polysiloxanes, ...).
+
+The database is one SQLite file with a table of peaks (m/z, resolution,
+optional Relative, a label and the source they were added from) and an
+index on m/z. Matching reads the entries in the sample's m/z range with a
+single range query, which returns them already sorted. It then runs the
+same ppm-window match as compare_dfs against them, so a whole spectrum is
+checked in one bulk query.
+"""
+import os
+import sqlite3
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import stage
+from .matching import PeakIndex
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".spectra", "background.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS peaks (
+    id INTEGER PRIMARY KEY,
+    mz REAL NOT NULL,
+    resolution REAL NOT NULL,
+    relative REAL,
+    label TEXT,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS peaks_mz ON peaks (mz);
+CREATE INDEX IF NOT EXISTS peaks_source ON peaks (source);
+"""
+
+
+class BackgroundIndex(PeakIndex):
+    """PeakIndex over database entries that also knows what each entry is called."""
+    labels: np.ndarray
+
+
+class BackgroundDB:
+    def __init__(self, path: str = DEFAULT_PATH, create: bool = True):
+        self.path = path
+        if not os.path.exists(path):
+            if not create:
+                raise FileNotFoundError(f"No background database at {path}")
+            folder = os.path.dirname(os.path.abspath(path))
+            os.makedirs(folder, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> "BackgroundDB":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM peaks").fetchone()[0]
+
+    def sources(self) -> List[Tuple[str, int]]:
+        """(source, number of peaks) for everything in the database."""
+        return self._db.execute("SELECT source, COUNT(*) FROM peaks GROUP BY source ORDER BY source").fetchall()
+
+    def add(self, df: pd.DataFrame, source: str, label: Optional[str] = None, replace: bool = True) -> int:
+        """
+        Add the peaks of ``df`` under ``source``; ``label`` (default: ``source``) is what
+        "Removed by" reports. Peaks without a usable m/z or resolution are skipped.
+        Returns the number of peaks added.
+        """
+        mz = df["m/z"].to_numpy(dtype=np.float64)
+        resolution = df["Resolution"].to_numpy(dtype=np.float64)
+        relative = df["Relative"].to_numpy(dtype=np.float64) if "Relative" in df.columns else np.full(len(df), np.nan)
+        keep = ~np.isnan(mz) & (resolution > 0)
+        rows = zip(mz[keep].tolist(), resolution[keep].tolist(),
+                   [None if np.isnan(r) else r for r in relative[keep].tolist()])
+        with stage("background_add", peaks=int(keep.sum())), self._db:
+            if replace:
+                self._db.execute("DELETE FROM peaks WHERE source = ?", (source,))
+            self._db.executemany("INSERT INTO peaks (mz, resolution, relative, label, source) VALUES (?, ?, ?, ?, ?)",
+                                 ((m, r, rel, label or source, source) for m, r, rel in rows))
+        return int(keep.sum())
+
+    def remove(self, source: str) -> int:
+        with self._db:
+            return self._db.execute("DELETE FROM peaks WHERE source = ?", (source,)).rowcount
+
+    def index(self, mz_min: Optional[float] = None, mz_max: Optional[float] = None) -> BackgroundIndex:
+        """Entries with m/z in [mz_min, mz_max] (default: all), sorted, ready to match against."""
+        query = "SELECT mz, resolution, relative, label FROM peaks"
+        params: Tuple[float, ...] = ()
+        if mz_min is not None and mz_max is not None:
+            query += " WHERE mz BETWEEN ? AND ?"
+            params = (mz_min, mz_max)
+        with stage("background_query"):
+            rows = self._db.execute(query + " ORDER BY mz", params).fetchall()
+        values = np.array([row[:3] for row in rows], dtype=np.float64).reshape(len(rows), 3)
+        mz = np.ascontiguousarray(values[:, 0])
+        index = BackgroundIndex.from_sorted(mz, mz / values[:, 1] / 2, np.ascontiguousarray(values[:, 2]))
+        index.labels = np.array([row[3] for row in rows], dtype=object)
+        return index
+
+    def subtract(self, df: pd.DataFrame, ppm_tol: float = 3.0,
+                 index: Optional[BackgroundIndex] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        ``df`` without its background peaks, and the removed peaks with a "Removed by" column
+        naming the matching entries. Without ``index``, only the entries in the m/z range of
+        ``df`` (plus a small margin for the ppm window) are read.
+        """
+        if index is None:
+            mz = df["m/z"].dropna()
+            lo, hi = (float(mz.min()), float(mz.max())) if len(mz) else (0.0, 0.0)
+            # A match is never further away than ppm_tol, so this margin is generous.
+            margin = hi * max(ppm_tol, 1.0) * 1e-5
+            index = self.index(lo - margin, hi + margin)
+        return subtract_background(df, index, ppm_tol)
+
+
+def subtract_background(df: pd.DataFrame, index: BackgroundIndex,
+                        ppm_tol: float = 3.0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    dfA = df.dropna(subset=["m/z"])
+    with stage("background_match", peaks_a=len(dfA), peaks_b=len(index)):
+        ia, ib, _ = index.pairs(dfA["m/z"].to_numpy(dtype=np.float64),
+                                dfA["Resolution"].to_numpy(dtype=np.float64), ppm_tol)
+    matched = np.zeros(len(dfA), dtype=bool)
+    matched[ia] = True
+    removed_rows, starts = np.unique(ia, return_index=True)
+    labels = index.labels[ib]
+    groups = np.split(labels, starts[1:]) if len(ia) else []
+    removed = dfA.iloc[removed_rows].reset_index(drop=True)
+    removed["Removed by"] = pd.Series([", ".join(dict.fromkeys(group)) for group in groups], dtype=object)
+    return dfA.loc[~matched].reset_index(drop=True), removed
@@ -0,0 +1,609 @@
+"""
+Headless batch subtraction.
+
+    python -m spectra subtract book.xlsx --reference Blank --target S1 S2 --out results
+    python -m spectra subtract book.xlsx --all-pairs --out results
+    python -m spectra export book.xlsx --reference Blank --dual --format png --out figures
+    python -m spectra store import library book.xlsx --prefix book/
+    python -m spectra subtract run2.xlsx --library library --reference book/Blank
+    python -m spectra background add book.xlsx --sheets Blank
+    python -m spectra subtract book.xlsx --background --reference Blank
+    python -m spectra align book.xlsx --blank Blank --group ctrl=C1,C2,C3 --out results
+
+For every (target, reference) pair this writes the unique-peak table
+"<target>_subtracted_<reference>.csv" and the matching SVG, using the same
+names the Qt app uses when "Save Graphs" is checked. --dual adds
+"..._only_B.csv" (peaks found only in the reference) and "..._matched.csv"
+(every matched peak pair with its ppm error), both from one matching pass,
+plus the dual plot. --combined subtracts all references at once instead,
+writing "<target>_subtracted_<ref1>_+_<ref2>.csv" and a "..._removed.csv"
+whose "Removed by" column names the reference(s) that matched each peak.
+--families also removes the isotope/adduct family of every matched peak
+(spectra.families) and lists what went, and why, in "..._removed.csv".
+--recalibrate fits the mass drift of each reference against its target
+(spectra.recalibration) and corrects the reference before matching; the
+fitted corrections go to "recalibration.csv". --min-fold R keeps matched
+peaks that are at least R times as intense in the target as in the
+reference, adding a "Fold change" column and colouring the plot by it.
+--tables parquet writes the same tables as .parquet files (needs pyarrow);
+--tables xlsx writes all of them as the sheets of one workbook,
+"<file>_subtractions.xlsx", streamed to disk one pair at a time.
+--library STORE lets --reference and --target (and export's --sheets)
+name spectra kept in a spectrum store (spectra.store) as well as sheets;
+they are read as memory-mapped slices, as they were imported, and a sheet
+of the same name wins.
+"export" only draws
+figures (each sheet, plus subtractions and dual plots when asked), rendering
+them in parallel. "align" lines up the peaks of all sheets at once
+(spectra.alignment) and writes one peak-by-sheet table, "peak_matrix.csv",
+optionally keeping only the peaks that pass blank, presence and replicate
+filters.
+"""
+import argparse
+import itertools
+import os
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from . import instrumentation
+from .alignment import align
+from .background import DEFAULT_PATH as DEFAULT_BACKGROUND, BackgroundDB, subtract_background
+from .export import FORMATS, export_figures, plan_jobs
+from .families import PeakFamilies, family_subtract
+from .loading import MIN_SN, normalize
+from .matching import PeakIndex, compare_dfs, dual_frames, dual_pairs, fold_change_subtract, multi_subtract
+from .parallel import iter_subtractions
+from .plotting import save_dual_spectrum, save_spectrum
+from .recalibration import fit_drift
+from .spectrum import PRECISIONS
+from .store import SpectrumStore
+from .tables import TABLE_FORMATS, TableWriter
+from .workbook import LazyWorkbook
+
+RECALIBRATE = {"linear": 1, "quadratic": 2}
+
+
+def plan_pairs(names: Sequence[str], references: Sequence[str], targets: Sequence[str],
+               all_pairs: bool, library: Sequence[str] = ()) -> List[Tuple[str, str]]:
+    """
+    (target, reference) pairs to run, in a stable order. ``library`` names may
+    be given as references or targets but are never picked by default.
+    """
+    if all_pairs:
+        return [(a, b) for a, b in itertools.permutations(names, 2)]
+    known = set(names).union(library)
+    unknown = [n for n in itertools.chain(references, targets) if n not in known]
+    if unknown:
+        raise ValueError(f"Unknown sheets: {unknown}")
+    if not targets:
+        targets = [n for n in names if n not in references]
+    return [(t, r) for t in targets for r in references if t != r]
+
+
+def open_tables(args: argparse.Namespace, name: str) -> TableWriter:
+    """The --tables writer of a command; an xlsx workbook is named "<input file>_<name>.xlsx"."""
+    stem = os.path.splitext(os.path.basename(args.file))[0]
+    return TableWriter(args.out, args.tables, workbook_name=f"{stem}_{name}")
+
+
+def open_library(args: argparse.Namespace) -> Optional[SpectrumStore]:
+    return SpectrumStore(args.library, create=False) if args.library else None
+
+
+def load_frames(workbook: LazyWorkbook, names: Sequence[str],
+                library: Optional[SpectrumStore] = None) -> Dict[str, pd.DataFrame]:
+    """The sheets among ``names``, then stored spectra for the rest; sheets that fail are reported and left out."""
+    data = workbook.frames([name for name in names if name in workbook])
+    for name, message in workbook.errors.items():
+        print(f"warning: skipping sheet '{name}': {message}", file=sys.stderr)
+    if library is not None:
+        for name in names:
+            if name not in workbook and name in library:
+                data[name] = library.frame(name)
+    return data
+
+
+def match_pair(data: Dict[str, pd.DataFrame], indexes: Dict[str, PeakIndex], target: str, reference: str,
+               ppm_tol: float, corrected: Optional[pd.DataFrame] = None) -> Tuple[np.ndarray, ...]:
+    """dual_pairs of one pair, against ``corrected`` (the recalibrated reference) when given."""
+    if corrected is not None:
+        return dual_pairs(data[target], corrected, ppm_tol=ppm_tol)
+    if reference not in indexes:
+        indexes[reference] = PeakIndex.from_frame(data[reference])
+    return dual_pairs(data[target], data[reference], indexes[reference], ppm_tol)
+
+
+def write_pair(target: str, reference: str, unique_df: pd.DataFrame, args: argparse.Namespace, tables: TableWriter,
+               dual: Optional[Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]] = None) -> List[str]:
+    """``dual`` is the (A-only, B-only, matched) tables of the pair, written for --dual."""
+    title = f"{target} subtracted {reference}"
+    if args.normalize:
+        unique_df = normalize(unique_df)
+
+    written = [tables.write(unique_df, title)]
+    if not args.no_plots:
+        written.append(save_spectrum(unique_df, title, args.out, n_peaks=args.peaks))
+    if dual is not None:
+        up, down, matched = dual
+        if args.normalize:
+            up, down = normalize(up), normalize(down)
+        written.append(tables.write(down, title, "_only_B"))
+        written.append(tables.write(matched, title, "_matched"))
+        if not args.no_plots:
+            written.append(save_dual_spectrum(up, down, title, args.out, n_peaks=args.peaks))
+    return written
+
+
+def write_combined(target: str, references: Sequence[str], unique_df: pd.DataFrame, removed: pd.DataFrame,
+                   args: argparse.Namespace, tables: TableWriter) -> List[str]:
+    title = f"{target} subtracted {' + '.join(references)}"
+    if args.normalize:
+        unique_df = normalize(unique_df)
+    written = [tables.write(unique_df, title), tables.write(removed, title, "_removed")]
+    if not args.no_plots:
+        written.append(save_spectrum(unique_df, title, args.out, n_peaks=args.peaks))
+    return written
+
+
+class Recalibrator:
+    """Fits and remembers the drift correction of each (target, reference) pair for --recalibrate."""
+
+    def __init__(self, data: Dict[str, pd.DataFrame], degree: int):
+        self.data = data
+        self.degree = degree
+        self.rows: List[Dict[str, object]] = []
+
+    def reference(self, target: str, reference: str) -> pd.DataFrame:
+        recalibration = fit_drift(self.data[target], self.data[reference], self.degree)
+        print(f"{target} / {reference}: {recalibration.summary()}", file=sys.stderr)
+        self.rows.append({"Target": target, "Reference": reference, **recalibration.as_row()})
+        return recalibration.apply(self.data[reference])
+
+    def write(self, tables: TableWriter) -> str:
+        return tables.write(pd.DataFrame(self.rows), "recalibration")
+
+
+def open_workbook(args: argparse.Namespace, background: bool = True) -> LazyWorkbook:
+    """The input file, with database background removed at load when --background is given."""
+    index = None
+    if background and args.background:
+        with BackgroundDB(args.background, create=False) as db:
+            index = db.index()
+    return LazyWorkbook(args.file, args.skip_rows, use_cache=not args.no_cache, precision=args.precision,
+                        background=index, background_ppm=args.ppm, min_sn=args.min_sn)
+
+
+def cmd_subtract(args: argparse.Namespace) -> int:
+    if not args.all_pairs and not args.reference:
+        if args.background:
+            return subtract_background_only(args)
+        print("error: give --reference sheet(s), --all-pairs or --background", file=sys.stderr)
+        return 2
+    if args.combined and (args.all_pairs or args.dual or not args.reference):
+        print("error: --combined needs --reference and cannot be used with --all-pairs or --dual", file=sys.stderr)
+        return 2
+    if args.families and (args.combined or args.dual):
+        print("error: --families cannot be used with --combined or --dual", file=sys.stderr)
+        return 2
+    if args.min_fold is not None and (args.combined or args.families):
+        print("error: --min-fold cannot be used with --combined or --families", file=sys.stderr)
+        return 2
+    workbook = open_workbook(args)
+    library = open_library(args)
+    try:
+        pairs = plan_pairs(workbook.sheet_names, args.reference or [], args.target or [], args.all_pairs,
+                           library.names() if library is not None else ())
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    with open_tables(args, "subtractions") as tables:
+        return subtract_pairs(args, workbook, pairs, tables, library)
+
+
+def subtract_pairs(args: argparse.Namespace, workbook: LazyWorkbook, pairs: List[Tuple[str, str]],
+                   tables: TableWriter, library: Optional[SpectrumStore] = None) -> int:
+    # Only the sheets taking part are parsed; a sheet that fails is reported and its pairs skipped.
+    data = load_frames(workbook, list(dict.fromkeys(name for pair in pairs for name in pair)), library)
+    pairs = [(t, r) for t, r in pairs if t in data and r in data]
+
+    # Stored spectra are sorted already, so their indexes are views on the store.
+    indexes: Dict[str, PeakIndex] = {}
+    if library is not None:
+        indexes = {r: library.index(r) for r in dict.fromkeys(r for _, r in pairs) if r not in workbook}
+    recalibrator = Recalibrator(data, RECALIBRATE[args.recalibrate]) if args.recalibrate else None
+    if args.combined:
+        for reference in args.reference:
+            if reference in data and reference not in indexes:
+                indexes[reference] = PeakIndex.from_frame(data[reference])
+        for target in dict.fromkeys(t for t, _ in pairs):
+            refs: Dict[str, Union[pd.DataFrame, PeakIndex]] = {r: index for r, index in indexes.items() if r != target}
+            if recalibrator:
+                refs = {r: recalibrator.reference(target, r) for r in refs}
+            unique_df, removed, _ = multi_subtract(data[target], refs, ppm_tol=args.ppm)
+            for path in write_combined(target, list(refs), unique_df, removed, args, tables):
+                print(path)
+        if recalibrator:
+            print(recalibrator.write(tables))
+        return 0
+    if args.families:
+        # Each target is grouped once, whatever the number of references.
+        families: Dict[str, PeakFamilies] = {}
+        for target, reference in pairs:
+            df = data[target].dropna(subset=["m/z"]).reset_index(drop=True)
+            if target not in families:
+                families[target] = PeakFamilies.from_frame(df, args.ppm)
+            if recalibrator:
+                ref = recalibrator.reference(target, reference)
+            else:
+                if reference not in indexes:
+                    indexes[reference] = PeakIndex.from_frame(data[reference])
+                ref = indexes[reference]
+            unique_df, removed = family_subtract(df, ref, args.ppm, families=families[target])
+            for path in write_combined(target, [reference], unique_df, removed, args, tables):
+                print(path)
+        if recalibrator:
+            print(recalibrator.write(tables))
+        return 0
+    if recalibrator or args.min_fold is not None or args.dual:
+        # Each pair matches against its own corrected reference, or needs the matched pairs for the fold
+        # changes or the --dual tables, so the shared-index pool does not apply. Each pair is matched once.
+        for target, reference in pairs:
+            corrected = recalibrator.reference(target, reference) if recalibrator else None
+            matches = dual = None
+            if args.min_fold is not None or args.dual:
+                matches = match_pair(data, indexes, target, reference, args.ppm, corrected)
+            if args.dual:
+                # Tables keep the reference's measured m/z; the ppm errors are those left after any correction.
+                dual = dual_frames(data[target], data[reference], *matches)
+            if args.min_fold is not None:
+                unique_df = fold_change_subtract(data[target], data[reference], ppm_tol=args.ppm,
+                                                 min_fold=args.min_fold, column=args.fold_by, pairs=matches)
+            elif dual is not None:
+                unique_df = dual[0]
+            else:
+                unique_df = compare_dfs(data[target], corrected, args.ppm)
+            for path in write_pair(target, reference, unique_df, args, tables, dual):
+                print(path)
+        if recalibrator:
+            print(recalibrator.write(tables))
+        return 0
+    for (target, reference), unique_df in iter_subtractions(data, pairs, args.ppm, args.workers, indexes):
+        for path in write_pair(target, reference, unique_df, args, tables):
+            print(path)
+    return 0
+
+
+def subtract_background_only(args: argparse.Namespace) -> int:
+    workbook = open_workbook(args, background=False)
+    unknown = [name for name in args.target or [] if name not in workbook]
+    if unknown:
+        print(f"error: Unknown sheets: {unknown}", file=sys.stderr)
+        return 2
+    data = workbook.frames(args.target or None)
+    for name, message in workbook.errors.items():
+        print(f"warning: skipping sheet '{name}': {message}", file=sys.stderr)
+
+    with BackgroundDB(args.background, create=False) as db:
+        index = db.index()
+    with open_tables(args, "background") as tables:
+        for target, df in data.items():
+            unique_df, removed = subtract_background(df, index, ppm_tol=args.ppm)
+            for path in write_combined(target, ["background"], unique_df, removed, args, tables):
+                print(path)
+    return 0
+
+
+def cmd_background(args: argparse.Namespace) -> int:
+    with BackgroundDB(args.db, create=args.action == "add") as db:
+        if args.action == "add":
+            workbook = LazyWorkbook(args.file, args.skip_rows, use_cache=not args.no_cache)
+            data = workbook.frames(args.sheets or None)
+            for name, message in workbook.errors.items():
+                print(f"warning: skipping sheet '{name}': {message}", file=sys.stderr)
+            for name, df in data.items():
+                source = f"{os.path.basename(args.file)}:{name}"
+                count = db.add(df, source, label=args.label)
+                print(f"{source}\t{count}")
+        elif args.action == "remove":
+            for source in args.sources:
+                if not db.remove(source):
+                    print(f"warning: nothing stored from '{source}'", file=sys.stderr)
+        else:
+            for source, count in db.sources():
+                print(f"{source}\t{count}")
+    return 0
+
+
+def cmd_export(args: argparse.Namespace) -> int:
+    workbook = open_workbook(args)
+    library = open_library(args)
+    stored = library.names() if library is not None else ()
+    sheets = args.sheets or workbook.sheet_names
+    try:
+        # Checks every name given; pairs each plotted sheet with each reference.
+        pairs = plan_pairs(workbook.sheet_names, args.reference or [], sheets, False, stored)
+        if args.all_pairs:
+            pairs = plan_pairs(sheets, [], [], True)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    if args.dual and not pairs:
+        print("error: --dual needs --reference or --all-pairs", file=sys.stderr)
+        return 2
+
+    data = load_frames(workbook, list(dict.fromkeys(list(sheets) + [name for pair in pairs for name in pair])), library)
+    sheets = [name for name in sheets if name in data]
+    pairs = [(t, r) for t, r in pairs if t in data and r in data]
+    jobs = plan_jobs(sheets, pairs, pairs if args.dual else ())
+    if not jobs:
+        print("error: nothing to export", file=sys.stderr)
+        return 2
+
+    report = export_figures(data, jobs, args.out, args.format, ppm_tol=args.ppm, n_peaks=args.peaks,
+                            normalized=args.normalize, workers=args.workers)
+    print(report.summary())
+    return 1 if report.failed else 0
+
+
+def parse_groups(specs: Sequence[str]) -> Dict[str, List[str]]:
+    """NAME=SHEET,SHEET,... replicate groups of align --group."""
+    groups = {}
+    for spec in specs:
+        name, sep, sheets = spec.partition("=")
+        if not sep or not name or not sheets:
+            raise ValueError(f"group '{spec}' is not NAME=SHEET,SHEET,...")
+        groups[name] = [sheet for sheet in sheets.split(",") if sheet]
+    return groups
+
+
+def cmd_align(args: argparse.Namespace) -> int:
+    workbook = open_workbook(args)
+    try:
+        groups = parse_groups(args.group or [])
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    named = list(args.blank or []) + [sheet for sheets in groups.values() for sheet in sheets]
+    unknown = [name for name in itertools.chain(args.sheets or [], named) if name not in workbook.sheet_names]
+    if unknown:
+        print(f"error: Unknown sheets: {unknown}", file=sys.stderr)
+        return 2
+
+    sheets = list(dict.fromkeys(list(args.sheets or workbook.sheet_names) + named))
+    data = workbook.frames(sheets)
+    for name, message in workbook.errors.items():
+        print(f"warning: skipping sheet '{name}': {message}", file=sys.stderr)
+    failed = [name for name in named if name not in data]
+    if failed:
+        print(f"error: cannot filter on sheets that failed to load: {failed}", file=sys.stderr)
+        return 1
+
+    matrix = align(data, args.ppm, args.value)
+    keep = matrix.present(min_count=args.min_samples)
+    if args.blank:
+        keep &= matrix.above_blank(args.blank, args.min_ratio)
+    if groups:
+        keep &= matrix.consistent(groups, args.min_fraction, args.max_cv)
+    print(f"{len(data)} sheets, {len(matrix)} aligned peaks, {int(keep.sum())} kept", file=sys.stderr)
+    with open_tables(args, "peak_matrix") as tables:
+        print(tables.write(matrix.select(keep).to_frame(), "peak matrix"))
+    return 0
+
+
+def cmd_store(args: argparse.Namespace) -> int:
+    store = SpectrumStore(args.store, create=args.action == "import")
+    if args.action == "import":
+        workbook = LazyWorkbook(args.file, args.skip_rows, use_cache=not args.no_cache)
+        data = workbook.frames(args.sheets or None)
+        for name, message in workbook.errors.items():
+            print(f"warning: skipping sheet '{name}': {message}", file=sys.stderr)
+        prefix = args.prefix or ""
+        for name, df in data.items():
+            try:
+                store.append(prefix + name, df, replace=args.replace)
+            except ValueError as e:
+                print(f"warning: {e}", file=sys.stderr)
+                continue
+            print(prefix + name)
+    elif args.action == "delete":
+        for name in args.names:
+            if name not in store:
+                print(f"warning: no spectrum named '{name}'", file=sys.stderr)
+                continue
+            store.delete(name)
+    elif args.action == "compact":
+        store.compact()
+    else:
+        for name in store.names():
+            print(name)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="spectra", description="Orbitrap spectral subtraction")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    diagnostics = argparse.ArgumentParser(add_help=False)
+    group = diagnostics.add_argument_group("diagnostics")
+    group.add_argument("--timings", nargs="?", const="-", metavar="FILE",
+                       help="write per-stage timings as JSON lines to FILE (default: stderr)")
+    group.add_argument("--profile", metavar="FILE", help="write cProfile stats for the whole run to FILE")
+    group.add_argument("--trace-memory", action="store_true",
+                       help="with --timings, add the peak bytes each stage allocated to its timing")
+
+    background = argparse.ArgumentParser(add_help=False)
+    background.add_argument("--background", nargs="?", const=DEFAULT_BACKGROUND, metavar="DB",
+                            help="remove known background peaks from every sheet as it is loaded "
+                                 f"(default database: {DEFAULT_BACKGROUND})")
+
+    library = argparse.ArgumentParser(add_help=False)
+    library.add_argument("--library", metavar="STORE",
+                         help="spectrum store whose spectra may be named as sheets (see the store command)")
+
+    tables = argparse.ArgumentParser(add_help=False)
+    tables.add_argument("--tables", choices=TABLE_FORMATS, default="csv",
+                        help="table format: one .csv or .parquet file per table, or every table as a sheet "
+                             "of one .xlsx workbook (default: csv)")
+
+    p = sub.add_parser("subtract", parents=[diagnostics, background, library, tables],
+                       help="subtract reference sheets from target sheets")
+    p.add_argument("file", help="peak-list file (.xlsx, .csv/.tsv or .mzML)")
+    p.add_argument("-r", "--reference", nargs="+", metavar="SHEET", help="sheet(s) to subtract")
+    p.add_argument("-t", "--target", nargs="+", metavar="SHEET",
+                   help="sheet(s) to subtract from (default: every non-reference sheet)")
+    p.add_argument("--all-pairs", action="store_true", help="run every ordered pair of sheets")
+    p.add_argument("--combined", action="store_true",
+                   help="subtract all references from each target in one pass and record which one removed each peak")
+    p.add_argument("--families", action="store_true",
+                   help="also remove the 13C isotopes, adducts and 2+ ions of every matched peak, "
+                        "and list them in _removed.csv")
+    p.add_argument("--recalibrate", nargs="?", const="linear", choices=sorted(RECALIBRATE),
+                   help="correct each reference's mass drift against its target before matching "
+                        "(default fit: linear) and write the corrections to recalibration.csv")
+    p.add_argument("--min-fold", type=float, metavar="RATIO",
+                   help="keep matched peaks at least RATIO times as intense as in the reference, "
+                        "with a Fold change column")
+    p.add_argument("--fold-by", choices=("Intensity", "Relative"), default="Intensity",
+                   help="column the fold change compares (default: Intensity)")
+    p.add_argument("-o", "--out", default=".", help="output folder (default: current folder)")
+    p.add_argument("--skip-rows", type=int, default=6,
+                   help="header rows to skip in each sheet or CSV file (default: 6)")
+    p.add_argument("--ppm", type=float, default=3.0, help="match tolerance in ppm (default: 3.0)")
+    p.add_argument("--min-sn", type=float, default=MIN_SN,
+                   help="keep peaks whose Intensity is above this multiple of Noise (default: 10)")
+    p.add_argument("--peaks", type=int, default=10, help="number of peaks to annotate (default: 10)")
+    p.add_argument("--normalize", action="store_true", help="rescale Relative so the tallest peak is 100")
+    p.add_argument("--dual", action="store_true",
+                   help="also write the B-only and matched-pairs tables and the A-B / B-A dual plot")
+    p.add_argument("--no-plots", action="store_true", help="write tables only")
+    p.add_argument("--no-cache", action="store_true", help="always re-read the workbook, ignoring the sheet cache")
+    p.add_argument("--precision", choices=PRECISIONS, default="float64",
+                   help="storage precision of intensity-like columns; m/z is always float64 (default: float64)")
+    p.add_argument("-j", "--workers", type=int, default=None,
+                   help="worker processes for matching (default: one per CPU core, 1 disables the pool)")
+    p.set_defaults(func=cmd_subtract)
+
+    p = sub.add_parser("export", parents=[diagnostics, background, library],
+                       help="draw figures for many sheets and pairs in parallel")
+    p.add_argument("file", help="peak-list file (.xlsx, .csv/.tsv or .mzML)")
+    p.add_argument("-s", "--sheets", nargs="+", metavar="SHEET", help="sheets to plot (default: all)")
+    p.add_argument("-r", "--reference", nargs="+", metavar="SHEET",
+                   help="also plot each sheet with these reference sheet(s) subtracted")
+    p.add_argument("--all-pairs", action="store_true", help="also plot every ordered pair of sheets")
+    p.add_argument("--dual", action="store_true", help="also draw the A-B / B-A dual plot of each pair")
+    p.add_argument("-f", "--format", choices=FORMATS, default="svg", help="figure format (default: svg)")
+    p.add_argument("-o", "--out", default=".", help="output folder (default: current folder)")
+    p.add_argument("--skip-rows", type=int, default=6,
+                   help="header rows to skip in each sheet or CSV file (default: 6)")
+    p.add_argument("--ppm", type=float, default=3.0, help="match tolerance in ppm (default: 3.0)")
+    p.add_argument("--min-sn", type=float, default=MIN_SN,
+                   help="keep peaks whose Intensity is above this multiple of Noise (default: 10)")
+    p.add_argument("--peaks", type=int, default=10, help="number of peaks to annotate (default: 10)")
+    p.add_argument("--normalize", action="store_true", help="rescale Relative so the tallest peak is 100")
+    p.add_argument("--no-cache", action="store_true", help="always re-read the workbook, ignoring the sheet cache")
+    p.add_argument("--precision", choices=PRECISIONS, default="float64",
+                   help="storage precision of intensity-like columns; m/z is always float64 (default: float64)")
+    p.add_argument("-j", "--workers", type=int, default=None,
+                   help="worker processes for drawing (default: one per CPU core, 1 disables the pool)")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("align", parents=[diagnostics, background, tables],
+                       help="align the peaks of all sheets into one peak-by-sheet matrix")
+    p.add_argument("file", help="peak-list file (.xlsx, .csv/.tsv or .mzML)")
+    p.add_argument("-s", "--sheets", nargs="+", metavar="SHEET", help="sheets to align (default: all)")
+    p.add_argument("--value", choices=("Intensity", "Relative"), default="Intensity",
+                   help="column the matrix holds (default: Intensity)")
+    p.add_argument("--blank", nargs="+", metavar="SHEET",
+                   help="keep only peaks at least --min-ratio times as intense in some sample as in every blank")
+    p.add_argument("--min-ratio", type=float, default=3.0, help="sample / blank ratio for --blank (default: 3)")
+    p.add_argument("--min-samples", type=int, default=1,
+                   help="keep only peaks present in at least this many sheets (default: 1)")
+    p.add_argument("--group", action="append", metavar="NAME=SHEET,SHEET,...",
+                   help="a replicate group (repeatable); keep only peaks consistent in at least one group")
+    p.add_argument("--min-fraction", type=float, default=1.0,
+                   help="fraction of a group's sheets a peak must be present in (default: 1, all)")
+    p.add_argument("--max-cv", type=float, metavar="CV",
+                   help="largest coefficient of variation within a group, e.g. 0.3 (default: no limit)")
+    p.add_argument("-o", "--out", default=".", help="output folder (default: current folder)")
+    p.add_argument("--skip-rows", type=int, default=6,
+                   help="header rows to skip in each sheet or CSV file (default: 6)")
+    p.add_argument("--ppm", type=float, default=3.0, help="alignment tolerance in ppm (default: 3.0)")
+    p.add_argument("--min-sn", type=float, default=MIN_SN,
+                   help="keep peaks whose Intensity is above this multiple of Noise (default: 10)")
+    p.add_argument("--no-cache", action="store_true", help="always re-read the workbook, ignoring the sheet cache")
+    p.add_argument("--precision", choices=PRECISIONS, default="float64",
+                   help="storage precision of intensity-like columns; m/z is always float64 (default: float64)")
+    p.set_defaults(func=cmd_align)
+
+    p = sub.add_parser("store", parents=[diagnostics], help="manage a memory-mapped spectrum library")
+    store_sub = p.add_subparsers(dest="action", required=True)
+    sp = store_sub.add_parser("import", help="add the spectra of a peak-list file")
+    sp.add_argument("store", help="store folder (created if missing)")
+    sp.add_argument("file", help="peak-list file (.xlsx, .csv/.tsv or .mzML)")
+    sp.add_argument("--sheets", nargs="+", metavar="SHEET", help="only these sheets (default: all)")
+    sp.add_argument("--prefix", help="prepend this to every stored name")
+    sp.add_argument("--replace", action="store_true", help="overwrite spectra that are already stored")
+    sp.add_argument("--skip-rows", type=int, default=6,
+                    help="header rows to skip in each sheet or CSV file (default: 6)")
+    sp.add_argument("--no-cache", action="store_true", help="always re-read the file, ignoring the sheet cache")
+    sp = store_sub.add_parser("list", help="list stored spectra")
+    sp.add_argument("store", help="store folder")
+    sp = store_sub.add_parser("delete", help="remove spectra by name")
+    sp.add_argument("store", help="store folder")
+    sp.add_argument("names", nargs="+", metavar="NAME")
+    sp = store_sub.add_parser("compact", help="reclaim space left by deleted spectra")
+    sp.add_argument("store", help="store folder")
+    p.set_defaults(func=cmd_store)
+
+    p = sub.add_parser("background", parents=[diagnostics], help="manage the background peak database")
+    bg_sub = p.add_subparsers(dest="action", required=True)
+    db_help = f"database file (default: {DEFAULT_BACKGROUND})"
+    sp = bg_sub.add_parser("add", help="add every peak of some sheets as background")
+    sp.add_argument("file", help="peak-list file (.xlsx, .csv/.tsv or .mzML)")
+    sp.add_argument("--db", default=DEFAULT_BACKGROUND, help=db_help)
+    sp.add_argument("--sheets", nargs="+", metavar="SHEET", help="only these sheets (default: all)")
+    sp.add_argument("--label", help='name reported in "Removed by" (default: <file>:<sheet>)')
+    sp.add_argument("--skip-rows", type=int, default=6,
+                    help="header rows to skip in each sheet or CSV file (default: 6)")
+    sp.add_argument("--no-cache", action="store_true", help="always re-read the file, ignoring the sheet cache")
+    sp = bg_sub.add_parser("list", help="list what the database holds")
+    sp.add_argument("--db", default=DEFAULT_BACKGROUND, help=db_help)
+    sp = bg_sub.add_parser("remove", help="drop the peaks added from some sources")
+    sp.add_argument("sources", nargs="+", metavar="SOURCE", help='as shown by "list", e.g. book.xlsx:Blank')
+    sp.add_argument("--db", default=DEFAULT_BACKGROUND, help=db_help)
+    p.set_defaults(func=cmd_background)
+    return parser
+
+
+def run(args: argparse.Namespace) -> int:
+    try:
+        return args.func(args)
+    except (FileNotFoundError, ImportError) as e:
+        # Missing input file, spectrum store or background database, or the writer for --tables.
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if not (args.timings or args.profile):
+        return run(args)
+
+    # Only --timings writes stage events; --profile alone just dumps its stats file.
+    stream = sink = None
+    if args.timings:
+        stream = sys.stderr if args.timings == "-" else open(args.timings, "a", encoding="utf-8")
+        sink = instrumentation.JsonLinesSink(stream)
+        instrumentation.enable(sink)
+    try:
+        with instrumentation.capture(profile_path=args.profile, memory=args.trace_memory and sink is not None):
+            with instrumentation.stage("command", command=args.command):
+                return run(args)
+    finally:
+        if sink is not None:
+            instrumentation.disable(sink)
+        if stream not in (None, sys.stderr):
+            stream.close()
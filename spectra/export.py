@@ -0,0 +1,161 @@
+"""
+Batch figure export on a process pool.
+
+Every job names one sheet plot, one subtraction (target minus reference)
+or one dual plot. The sheets a batch needs are handed to each worker once,
+when it starts. A job then carries only sheet names: the worker does its own
+matching and renders onto a bare matplotlib Figure (Agg/SVG/PDF, no GUI
+toolkit), so figures are drawn and written in parallel. A job that fails is
+recorded in the report and does not stop the rest of the batch. Callers on a
+thread of a multithreaded process (the Qt app) pass a "spawn" ``mp_context``,
+so workers do not start as forks of it.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.context import BaseContext
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from . import instrumentation
+from .instrumentation import stage
+from .loading import normalization_scale
+from .matching import PeakIndex, compare_dfs, dual_compare
+from .parallel import default_workers
+from .plotting import save_dual_spectrum, save_spectrum
+
+FORMATS = ("svg", "png", "pdf")
+
+# (kind, names): ("sheet", (name,)), ("subtract", (target, reference)) or ("dual", (a, b)).
+Job = Tuple[str, Tuple[str, ...]]
+
+_worker_data: Dict[str, pd.DataFrame] = {}
+_worker_indexes: Dict[str, PeakIndex] = {}
+
+
+def plan_jobs(sheets: Sequence[str], pairs: Sequence[Tuple[str, str]] = (),
+              dual_pairs: Sequence[Tuple[str, str]] = ()) -> List[Job]:
+    jobs: List[Job] = [("sheet", (name,)) for name in sheets]
+    jobs += [("subtract", pair) for pair in pairs]
+    jobs += [("dual", pair) for pair in dual_pairs]
+    return jobs
+
+
+def job_title(job: Job) -> str:
+    kind, names = job
+    return names[0] if kind == "sheet" else f"{names[0]} subtracted {names[1]}"
+
+
+class ExportReport:
+    def __init__(self, out_dir: str, fmt: str):
+        self.out_dir = out_dir
+        self.format = fmt
+        self.written: List[str] = []
+        self.failed: List[Tuple[str, str]] = []
+        self.seconds = 0.0
+
+    def summary(self) -> str:
+        lines = [f"Wrote {len(self.written)} {self.format.upper()} file(s) to {os.path.abspath(self.out_dir)} "
+                 f"in {self.seconds:.1f} s."]
+        if self.failed:
+            lines.append(f"{len(self.failed)} failed:")
+            lines += [f"  {title}: {message}" for title, message in self.failed]
+        return "\n".join(lines)
+
+
+def _init_worker(data: Dict[str, pd.DataFrame]) -> None:
+    _worker_data.clear()
+    _worker_data.update(data)
+    _worker_indexes.clear()
+
+
+def _init_pool_worker(data: Dict[str, pd.DataFrame]) -> None:
+    # A forked worker inherits the parent's sinks, which may be objects of the parent's GUI; workers report no
+    # stages.
+    instrumentation.disable()
+    _init_worker(data)
+
+
+def _index(name: str) -> PeakIndex:
+    index = _worker_indexes.get(name)
+    if index is None:
+        index = _worker_indexes[name] = PeakIndex.from_frame(_worker_data[name])
+    return index
+
+
+def _render(job: Job, out_dir: str, fmt: str, ppm_tol: float, n_peaks: int, normalized: bool) -> str:
+    kind, names = job
+    title = job_title(job)
+    if kind == "sheet":
+        df = _worker_data[names[0]]
+        scale = normalization_scale(df) if normalized else 1.0
+        return save_spectrum(df, title, out_dir, n_peaks, scale, fmt=fmt)
+    target, reference = names
+    if kind == "subtract":
+        unique_df = compare_dfs(_worker_data[target], _index(reference), ppm_tol=ppm_tol)
+        scale = normalization_scale(unique_df) if normalized else 1.0
+        return save_spectrum(unique_df, title, out_dir, n_peaks, scale, fmt=fmt)
+    up, down = dual_compare(_worker_data[target], _worker_data[reference], _index(reference), ppm_tol=ppm_tol)
+    up_scale, down_scale = (normalization_scale(up), normalization_scale(down)) if normalized else (1.0, 1.0)
+    return save_dual_spectrum(up, down, title, out_dir, n_peaks, up_scale, down_scale, fmt=fmt)
+
+
+def _export_task(job: Job, out_dir: str, fmt: str, ppm_tol: float, n_peaks: int,
+                 normalized: bool) -> Tuple[Job, Optional[str], str]:
+    try:
+        return job, _render(job, out_dir, fmt, ppm_tol, n_peaks, normalized), ""
+    except Exception as e:
+        return job, None, str(e) or type(e).__name__
+
+
+def export_figures(data: Dict[str, pd.DataFrame], jobs: Sequence[Job], out_dir: str, fmt: str = "svg",
+                   ppm_tol: float = 3.0, n_peaks: int = 10, normalized: bool = False,
+                   workers: Optional[int] = None,
+                   progress: Optional[Callable[[int, int, str], None]] = None,
+                   mp_context: Optional[BaseContext] = None) -> ExportReport:
+    """
+    Render ``jobs`` into ``out_dir``. ``progress(done, total, title)`` is called as each figure
+    finishes; an exception raised from it stops the batch. ``workers`` of 1 runs without a pool.
+    ``mp_context`` is the multiprocessing context of the pool (default: the platform's).
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}'; expected one of {', '.join(FORMATS)}")
+    os.makedirs(out_dir, exist_ok=True)
+    report = ExportReport(out_dir, fmt)
+    used = {name for _, names in jobs for name in names}
+    needed = {name: data[name] for name in data if name in used}
+    workers = min(workers or default_workers(), len(jobs))
+    options = (out_dir, fmt, ppm_tol, n_peaks, normalized)
+    started = time.perf_counter()
+
+    def collect(done: int, result: Tuple[Job, Optional[str], str]) -> None:
+        job, path, message = result
+        if path is None:
+            report.failed.append((job_title(job), message))
+        else:
+            report.written.append(path)
+        if progress is not None:
+            progress(done, len(jobs), job_title(job))
+
+    with stage("export", jobs=len(jobs), format=fmt, workers=workers):
+        if workers <= 1:
+            _init_worker(needed)
+            try:
+                for done, job in enumerate(jobs, 1):
+                    collect(done, _export_task(job, *options))
+            finally:
+                _init_worker({})
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=_init_pool_worker,
+                                       initargs=(needed,))
+            try:
+                futures = [pool.submit(_export_task, job, *options) for job in jobs]
+                for done, future in enumerate(as_completed(futures), 1):
+                    collect(done, future.result())
+            finally:
+                # Also reached on cancellation: drop the queued jobs, let running ones finish.
+                pool.shutdown(wait=True, cancel_futures=True)
+    report.seconds = time.perf_counter() - started
+    report.written.sort()
+    return report
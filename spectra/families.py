@@ -0,0 +1,165 @@
+"""
+Isotope and adduct families.
+
+A contaminant rarely shows up as one peak: its 13C isotopes, its Na/K/NH4
+adducts and its doubly charged form come along. group_families links every
+peak to the peak it most likely derives from. For each entry of a table of
+mass differences (DELTAS), it looks up m/z - delta in the sorted m/z array,
+plus one lookup for the 2+ ion of a [M+H]+ peak. That is one searchsorted
+per entry, so grouping stays near-linear at 100k peaks. Following those links to
+the end gives every peak's family root, the monoisotopic [M+H]+ peak.
+family_subtract then removes a whole family when its root matches the
+reference.
+"""
+from typing import NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import stage
+from .matching import PeakIndex, match_frame
+
+PROTON = 1.007276
+# 13C abundance per carbon over the mass of one carbon: the largest M+1 / M height ratio per Da.
+C13_PER_DA = 0.0107 / 12.0
+
+
+class MassDelta(NamedTuple):
+    name: str
+    delta: float
+    # Number of 13C atoms for an isotope peak (0 for adducts), and the ion's charge.
+    carbons: int = 0
+    charge: int = 1
+
+
+# Tried in this order; a peak keeps the first link found.
+DELTAS: Tuple[MassDelta, ...] = (
+    MassDelta("13C", 1.003355, 1),
+    MassDelta("13C (2+)", 1.003355 / 2, 1, 2),
+    MassDelta("13C x2", 2.006710, 2),
+    MassDelta("+NH4", 17.026549),
+    MassDelta("+Na", 21.981943),
+    MassDelta("+K", 37.955882),
+)
+CHARGE = "2+"
+
+
+def _nearest(sorted_mz: np.ndarray, target: np.ndarray, ppm_tol: float) -> Tuple[np.ndarray, np.ndarray]:
+    # (which targets have a peak within ppm_tol, position of that nearest peak).
+    if len(sorted_mz) == 0:
+        return np.zeros(len(target), dtype=bool), np.zeros(0, dtype=np.int64)
+    right = np.clip(np.searchsorted(sorted_mz, target), 0, len(sorted_mz) - 1)
+    left = np.maximum(right - 1, 0)
+    nearest = np.where(np.abs(sorted_mz[left] - target) <= np.abs(sorted_mz[right] - target), left, right)
+    with np.errstate(invalid="ignore"):
+        hit = (target > 0) & (np.abs(sorted_mz[nearest] - target) <= target * ppm_tol * 1e-6)
+    return hit, nearest[hit]
+
+
+def _roots(parent: np.ndarray) -> np.ndarray:
+    # Pointer jumping: log(depth) passes over the whole array.
+    root = np.where(parent < 0, np.arange(len(parent)), parent)
+    while True:
+        jumped = root[root]
+        if np.array_equal(jumped, root):
+            return root
+        root = jumped
+
+
+class PeakFamilies:
+    """
+    Per-peak family links in the row order of the grouped spectrum: ``parent`` is the row a peak
+    derives from (-1 for none), ``relation`` the name of that link and ``root`` the row of the
+    family's monoisotopic peak (the peak itself for a root or a peak without family).
+    """
+
+    def __init__(self, parent: np.ndarray, root: np.ndarray, relation: np.ndarray):
+        self.parent = parent
+        self.root = root
+        self.relation = relation
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, ppm_tol: float = 3.0,
+                   deltas: Sequence[MassDelta] = DELTAS) -> "PeakFamilies":
+        return group_families(df["m/z"].to_numpy(dtype=np.float64), df["Relative"].to_numpy(dtype=np.float64),
+                              ppm_tol, deltas)
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    @property
+    def n_families(self) -> int:
+        """Families with more than one peak."""
+        return len(np.unique(self.root[self.parent >= 0]))
+
+    def expand(self, matched: np.ndarray) -> np.ndarray:
+        """``matched`` plus every peak whose family root is matched."""
+        return matched | matched[self.root]
+
+
+def group_families(mz: np.ndarray, relative: np.ndarray, ppm_tol: float = 3.0,
+                   deltas: Sequence[MassDelta] = DELTAS) -> PeakFamilies:
+    mz = np.asarray(mz, dtype=np.float64)
+    relative = np.asarray(relative, dtype=np.float64)
+    n = len(mz)
+    order = np.argsort(mz, kind="stable")
+    smz, srel = mz[order], relative[order]
+    parent = np.full(n, -1, dtype=np.int64)
+    relation = np.full(n, "", dtype=object)
+
+    with stage("families", peaks=n):
+        for delta in deltas:
+            free = np.flatnonzero(parent < 0)
+            hit, found = _nearest(smz, smz[free] - delta.delta, ppm_tol)
+            child = free[hit]
+            if delta.carbons:
+                # Even an all-carbon ion cannot have a taller isotope peak than this.
+                ratio = smz[found] * delta.charge * C13_PER_DA
+                bound = ratio ** delta.carbons / (2.0 if delta.carbons == 2 else 1.0)
+                plausible = srel[child] <= srel[found] * bound
+                child, found = child[plausible], found[plausible]
+            parent[child] = found
+            relation[child] = delta.name
+
+        # The 2+ ion of [M+H]+ sits at (M+H + H) / 2, below its parent. Links so far all point to lower
+        # m/z; a 2+ link is kept only if its parent's chain does not end at another 2+ candidate,
+        # so following parents can never loop.
+        free = np.flatnonzero(parent < 0)
+        hit, found = _nearest(smz, 2 * smz[free] - PROTON, ppm_tol)
+        child = free[hit]
+        safe = ~np.isin(_roots(parent)[found], child)
+        parent[child[safe]] = found[safe]
+        relation[child[safe]] = CHARGE
+        root = _roots(parent)
+
+    # Back from m/z order to row order.
+    out_parent = np.full(n, -1, dtype=np.int64)
+    linked = parent >= 0
+    out_parent[order[linked]] = order[parent[linked]]
+    out_root = np.empty(n, dtype=np.int64)
+    out_root[order] = order[root]
+    out_relation = np.empty(n, dtype=object)
+    out_relation[order] = relation
+    return PeakFamilies(out_parent, out_root, out_relation)
+
+
+def family_subtract(df_a: pd.DataFrame, df_b: Union[pd.DataFrame, PeakIndex], ppm_tol: float = 3.0,
+                    group_ppm: Optional[float] = None,
+                    families: Optional[PeakFamilies] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Like compare_dfs, but a peak also goes when the monoisotopic peak of its family in ``df_a``
+    matches ``df_b``. Returns the unique peaks and the removed ones, with "Family m/z" (the
+    root's m/z), "Relation" (the link to its parent, "" for a root) and "Matched" (whether the
+    peak itself matched) columns. Families are grouped within ``group_ppm`` (default: ``ppm_tol``),
+    unless given; ``families`` must come from ``df_a`` without NaN m/z rows.
+    """
+    dfA = df_a.dropna(subset=["m/z"]).reset_index(drop=True)
+    matched = match_frame(dfA, df_b, ppm_tol)
+    if families is None:
+        families = PeakFamilies.from_frame(dfA, ppm_tol if group_ppm is None else group_ppm)
+    gone = families.expand(matched)
+    removed = dfA.loc[gone].reset_index(drop=True)
+    removed["Family m/z"] = dfA["m/z"].to_numpy()[families.root[gone]]
+    removed["Relation"] = families.relation[gone]
+    removed["Matched"] = matched[gone]
+    return dfA.loc[~gone].reset_index(drop=True), removed
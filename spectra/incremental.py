@@ -0,0 +1,157 @@
+"""
+Incremental re-matching for interactive ppm and S/N thresholds.
+
+At ppm tolerance t, an A peak survives subtraction when its nearest
+overlapping B peak is more than t ppm away. A S/N cut drops peaks whose
+Intensity is not above that multiple of their Noise. LiveMatch does the
+match once, up to ``max_ppm``, and keeps the unfiltered spectra in memory.
+For a S/N cutoff it reduces the stored pairs to each peak's nearest partner
+that passes the cut (``min_ppm_a`` and ``min_ppm_b``). A new ppm tolerance
+is then one comparison against those arrays, and a new S/N cutoff one pass
+over the stored pairs; neither matches again. The cut is readers.sn_mask,
+the same one sn_filter applies. Isotope/adduct families of A
+(spectra.families) are grouped once per S/N cutoff and ppm tolerance, at
+that tolerance, as --families does. Fold changes (fold_change_subtract)
+come from the same stored pairs.
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .families import group_families
+from .instrumentation import stage
+from .matching import FOLD_COLUMN, PeakIndex, dual_pairs, fold_changes, matched_frame
+from .readers import MIN_SN, sn_mask
+
+# Widest tolerance the live controls offer; pairs further apart are never stored.
+MAX_PPM = 20.0
+
+Pairs = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def _by_peak(own: np.ndarray, other: np.ndarray, dist: np.ndarray) -> Pairs:
+    # Pairs grouped by ``own``, nearest partner first within each group.
+    order = np.lexsort((dist, own))
+    return own[order], other[order], dist[order]
+
+
+def _nearest(pairs: Pairs, passed_other: np.ndarray, n: int) -> np.ndarray:
+    own, other, dist = pairs
+    passed = passed_other[other]
+    own, dist = own[passed], dist[passed]
+    nearest = np.full(n, np.inf)
+    first = np.ones(len(own), dtype=bool)
+    first[1:] = own[1:] != own[:-1]
+    nearest[own[first]] = dist[first]
+    return nearest
+
+
+class LiveMatch:
+    """
+    A minus B and B minus A for any ppm tolerance up to ``max_ppm`` and any S/N cutoff.
+    ``df_a`` and ``df_b`` should be unfiltered (LazyWorkbook with ``min_sn=None``) so every
+    cutoff can be applied later. ``pairs`` are dual_pairs(df_a, df_b, index_b, max_ppm) when
+    already known, e.g. from a ResultCache.
+    """
+
+    def __init__(self, df_a: pd.DataFrame, df_b: pd.DataFrame, index_b: Optional[PeakIndex] = None,
+                 max_ppm: float = MAX_PPM, pairs: Optional[Pairs] = None):
+        self.max_ppm = float(max_ppm)
+        self.df_a = df_a.dropna(subset=["m/z"]).reset_index(drop=True)
+        self.df_b = df_b
+        ia, ib, ppm = pairs if pairs is not None else dual_pairs(df_a, df_b, index_b, self.max_ppm)
+        self._pairs = (ia, ib, ppm)
+        dist = np.abs(ppm)
+        self._pairs_a = _by_peak(ia, ib, dist)
+        self._pairs_b = _by_peak(ib, ia, dist)
+        self.intensity_a = self.df_a["Intensity"].to_numpy(dtype=np.float64)
+        self.intensity_b = df_b["Intensity"].to_numpy(dtype=np.float64)
+        self.noise_a = self.df_a["Noise"].to_numpy(dtype=np.float64)
+        self.noise_b = df_b["Noise"].to_numpy(dtype=np.float64)
+        self._has_mz_b = df_b["m/z"].notna().to_numpy()
+        self.min_sn: Optional[float] = None
+        # Peaks passing the S/N cut, and each peak's nearest partner that passes it, at ``min_sn``.
+        self.passed_a = self.passed_b = np.zeros(0, dtype=bool)
+        self.min_ppm_a = self.min_ppm_b = np.zeros(0)
+        self._stale = True
+        self._roots: Optional[Tuple[Optional[float], float, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        """Number of stored (A, B) pairs."""
+        return len(self._pairs_a[0])
+
+    def set_min_sn(self, min_sn: Optional[float]) -> None:
+        """Nearest-partner distances counting only partners above ``min_sn`` (None: all)."""
+        if not self._stale and min_sn == self.min_sn:
+            return
+        with stage("live_sn", pairs=len(self)):
+            self.passed_a = sn_mask(self.intensity_a, self.noise_a, min_sn)
+            self.passed_b = sn_mask(self.intensity_b, self.noise_b, min_sn)
+            self.min_ppm_a = _nearest(self._pairs_a, self.passed_b, len(self.df_a))
+            self.min_ppm_b = _nearest(self._pairs_b, self.passed_a, len(self.df_b))
+        self.min_sn = min_sn
+        self._stale = False
+
+    def _keep(self, side: str, ppm_tol: float, min_sn: Optional[float]) -> np.ndarray:
+        if ppm_tol > self.max_ppm:
+            raise ValueError(f"ppm tolerance {ppm_tol} is above the {self.max_ppm} ppm this match was built for")
+        self.set_min_sn(min_sn)
+        min_ppm, passed = (self.min_ppm_a, self.passed_a) if side == "a" else (self.min_ppm_b, self.passed_b)
+        return (min_ppm > ppm_tol) & passed
+
+    def family_roots(self, min_sn: Optional[float], ppm_tol: float = 3.0) -> np.ndarray:
+        """Family root of every A peak, grouping only the peaks above ``min_sn``, within ``ppm_tol``."""
+        if self._roots is None or self._roots[:2] != (min_sn, ppm_tol):
+            n = len(self.df_a)
+            self.set_min_sn(min_sn)
+            passed = np.flatnonzero(self.passed_a)
+            families = group_families(self.df_a["m/z"].to_numpy(dtype=np.float64)[passed],
+                                      self.df_a["Relative"].to_numpy(dtype=np.float64)[passed], ppm_tol)
+            root = np.arange(n)
+            root[passed] = passed[families.root]
+            self._roots = (min_sn, ppm_tol, root)
+        return self._roots[2]
+
+    def fold_changes(self, ppm_tol: float = 3.0, min_sn: Optional[float] = MIN_SN) -> np.ndarray:
+        """Intensity fold change of every A peak over its B partners above ``min_sn`` (see fold_changes)."""
+        self.set_min_sn(min_sn)
+        own, other, dist = self._pairs_a
+        paired = (dist <= ppm_tol) & self.passed_b[other]
+        return fold_changes(self.intensity_a, self.intensity_b, own[paired], other[paired])
+
+    def a_only(self, ppm_tol: float = 3.0, min_sn: Optional[float] = MIN_SN, families: bool = False,
+               min_fold: Optional[float] = None) -> pd.DataFrame:
+        """
+        Same rows as compare_dfs(sn_filter(df_a, min_sn), sn_filter(df_b, min_sn), ppm_tol), or with
+        ``families`` as the unique table of family_subtract on the same inputs. With ``min_fold``, the
+        same as fold_change_subtract(..., min_fold=min_fold) instead: matched peaks at least that much
+        more intense in A stay, with their "Fold change" (and with ``families``, a family goes only
+        when its root was removed).
+        """
+        keep = self._keep("a", ppm_tol, min_sn)
+        if not families and min_fold is None:
+            return self.df_a.loc[keep].reset_index(drop=True)
+        removed = (self.min_ppm_a <= ppm_tol) & self.passed_a
+        if min_fold is not None:
+            fold = self.fold_changes(ppm_tol, min_sn)
+            removed &= fold < min_fold
+            keep = ~removed & self.passed_a
+        if families:
+            keep &= ~removed[self.family_roots(min_sn, ppm_tol)]
+        table = self.df_a.loc[keep].reset_index(drop=True)
+        if min_fold is not None:
+            table[FOLD_COLUMN] = fold[keep]
+        return table
+
+    def matched(self, ppm_tol: float = 3.0, min_sn: Optional[float] = MIN_SN) -> pd.DataFrame:
+        """The matched table of dual_subtract(sn_filter(df_a, min_sn), sn_filter(df_b, min_sn), ppm_tol)."""
+        self.set_min_sn(min_sn)
+        ia, ib, ppm = self._pairs
+        paired = (np.abs(ppm) <= ppm_tol) & self.passed_a[ia] & self.passed_b[ib]
+        return matched_frame(self.df_a, self.df_b, ia[paired], ib[paired], ppm[paired])
+
+    def b_only(self, ppm_tol: float = 3.0, min_sn: Optional[float] = MIN_SN) -> pd.DataFrame:
+        """B peaks passing ``min_sn`` with no A peak passing it within ``ppm_tol``."""
+        keep = self._keep("b", ppm_tol, min_sn)
+        return self.df_b.loc[keep & self._has_mz_b].reset_index(drop=True)
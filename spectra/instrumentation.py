@@ -0,0 +1,155 @@
+"""
+Stage timing for load, match, normalize and plotting.
+
+Code marks its stages with
+
+    with stage("match", peaks_a=len(a)):
+        ...
+
+Nothing is measured until enable() is called. While disabled, stage()
+returns a shared no-op context, so the cost is one function call and a
+flag check. Once enabled, each finished stage becomes an event dict
+({"stage", "seconds", "thread", ...fields}) that is passed to every
+registered sink. Sinks include the JSON-lines writer used by the CLI and
+the status bar and diagnostics panel in the Qt app.
+
+capture() adds optional cProfile and tracemalloc recording around a
+block. With memory tracing on, each event also reports "peak_bytes": how
+far traced memory rose above what was in use when the stage started,
+nested stages included. tracemalloc keeps a single peak, so every stage
+boundary folds it into all open stages before resetting it.
+"""
+import contextlib
+import cProfile
+import json
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, Optional, TextIO
+
+Event = Dict[str, object]
+Sink = Callable[[Event], None]
+
+_enabled = False
+_trace_memory = False
+_sinks: List[Sink] = []
+_lock = threading.Lock()
+_open: List["_Stage"] = []
+_NULL = contextlib.nullcontext()
+
+
+class _Stage:
+    __slots__ = ("name", "fields", "start", "base", "peak")
+
+    def __init__(self, name: str, fields: Dict[str, object]):
+        self.name = name
+        self.fields = fields
+        self.base: Optional[int] = None
+
+    def __enter__(self) -> "_Stage":
+        if _trace_memory and tracemalloc.is_tracing():
+            with _lock:
+                _fold_peak()
+                self.base = self.peak = tracemalloc.get_traced_memory()[0]
+                _open.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        event: Event = {"stage": self.name, "seconds": time.perf_counter() - self.start,
+                        "thread": threading.current_thread().name}
+        if self.base is not None:
+            with _lock:
+                if tracemalloc.is_tracing():
+                    _fold_peak()
+                _open.remove(self)
+            event["peak_bytes"] = self.peak - self.base
+        if exc_type is not None:
+            event["error"] = exc_type.__name__
+        event.update(self.fields)
+        emit(event)
+
+
+def _fold_peak() -> None:
+    """Carry the peak since the last reset into every open stage, then start a new peak window."""
+    peak = tracemalloc.get_traced_memory()[1]
+    for open_stage in _open:
+        open_stage.peak = max(open_stage.peak, peak)
+    tracemalloc.reset_peak()
+
+
+def stage(name: str, **fields):
+    """Context manager timing one stage; a no-op unless instrumentation is enabled."""
+    if not _enabled:
+        return _NULL
+    return _Stage(name, fields)
+
+
+def emit(event: Event) -> None:
+    with _lock:
+        sinks = list(_sinks)
+    for sink in sinks:
+        sink(event)
+
+
+def enable(sink: Optional[Sink] = None) -> None:
+    global _enabled
+    with _lock:
+        if sink is not None and sink not in _sinks:
+            _sinks.append(sink)
+        _enabled = True
+
+
+def disable(sink: Optional[Sink] = None) -> None:
+    """Remove ``sink``; with no sink (or none left) stop measuring altogether."""
+    global _enabled
+    with _lock:
+        if sink is None:
+            _sinks.clear()
+        elif sink in _sinks:
+            _sinks.remove(sink)
+        _enabled = bool(_sinks)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class JsonLinesSink:
+    """Writes one JSON object per event to a text stream."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event) -> None:
+        line = json.dumps(event, default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+@contextlib.contextmanager
+def capture(profile_path: Optional[str] = None, memory: bool = False) -> Iterator[None]:
+    """
+    Optionally profile the block with cProfile (stats written to
+    ``profile_path``, readable with pstats/snakeviz) and trace allocations
+    so stage events carry ``peak_bytes``.
+    """
+    global _trace_memory
+    profiler = cProfile.Profile() if profile_path else None
+    started_tracing = memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    _trace_memory = memory
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        _trace_memory = False
+        if started_tracing:
+            tracemalloc.stop()
@@ -0,0 +1,80 @@
+"""
+Loading peak lists into one filtered DataFrame per spectrum.
+
+Files are read through spectra.readers (Excel, CSV/TSV, mzML). Each
+spectrum has the columns listed in REQUIRED_COLUMNS; peaks at or below
+``min_sn`` times the noise level (10x by default) are dropped on load.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .instrumentation import stage
+from .readers import MIN_SN, REQUIRED_COLUMNS, excel_engine, filter_sheet, open_reader, sn_filter
+from .sheet_cache import SheetCache
+
+__all__ = ["MIN_SN", "REQUIRED_COLUMNS", "excel_engine", "filter_sheet", "load_data", "normalization_scale",
+           "normalize", "sn_filter"]
+
+
+def load_data(skip_rows: int, path: str, progress: Optional[Callable[[int, int, str], None]] = None,
+              use_cache: bool = True, min_sn: Optional[float] = MIN_SN) -> Tuple[List[str], Dict[str, pd.DataFrame]]:
+    """
+    Read and filter every spectrum (sheet) in the file at ``path``.
+
+    ``progress(done, total, sheet_name)`` is called after each sheet; it may
+    raise to abandon the load. With ``use_cache`` the sheets are kept in a
+    SheetCache next to the workbook and reused on the next load; the cache
+    holds them before the S/N cut, so one cache serves every ``min_sn``.
+    """
+    with stage("load_data", path=path):
+        return _load_data(skip_rows, path, progress, use_cache, min_sn)
+
+
+def _load_data(skip_rows: int, path: str, progress: Optional[Callable[[int, int, str], None]],
+               use_cache: bool, min_sn: Optional[float]) -> Tuple[List[str], Dict[str, pd.DataFrame]]:
+    cache = SheetCache(path, skip_rows) if use_cache else None
+    if cache is not None and cache.is_complete():
+        names = list(cache.sheet_names)
+        filtered: Dict[str, pd.DataFrame] = {}
+        for i, name in enumerate(names):
+            with stage("cache_read", sheet=name):
+                df = cache.get(name)
+            if df is None:
+                break
+            filtered[name] = sn_filter(df, min_sn)
+            if progress is not None:
+                progress(i + 1, len(names), name)
+        else:
+            return names, filtered
+
+    reader = open_reader(path)
+    names = reader.sheet_names
+    raw: Dict[str, pd.DataFrame] = {}
+    for i, name in enumerate(names):
+        raw[name] = reader.read(name, skip_rows, None if cache is not None else min_sn)
+        if progress is not None:
+            progress(i + 1, len(names), name)
+    if cache is not None:
+        cache.put_all(names, raw)
+    return names, {name: sn_filter(df, min_sn) for name, df in raw.items()}
+
+
+def normalization_scale(df: pd.DataFrame) -> float:
+    """Factor that brings the tallest Relative peak to 100 (1.0 if there is none)."""
+    with stage("normalize", rows=len(df)):
+        max_rel = df["Relative"].max() if not df.empty else float("nan")
+    if pd.notna(max_rel) and max_rel > 0:
+        return 100.0 / max_rel
+    return 1.0
+
+
+def normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """Copy of ``df`` with Relative rescaled so the tallest peak is 100."""
+    # Only Relative changes, so the other columns are shared with ``df``.
+    with stage("normalize", rows=len(df)):
+        normalized = df.copy(deep=False)
+        max_rel = normalized["Relative"].max()
+        if pd.notna(max_rel) and max_rel > 0:
+            normalized["Relative"] = normalized["Relative"] / max_rel * 100.0
+        return normalized
@@ -0,0 +1,298 @@
+"""
+Peak matching between two spectra.
+
+A peak in A is considered present in B when some peak in B overlaps it
+(separation <= sum of the half widths, half width = m/z / Resolution / 2)
+and the two centroids agree within ``ppm_tol``.
+"""
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import stage
+
+# Upper bound on the number of (A, B) candidate pairs expanded at once.
+_PAIR_CHUNK = 1 << 22
+FOLD_COLUMN = "Fold change"
+
+
+def _half_widths(mz: np.ndarray, res: np.ndarray) -> np.ndarray:
+    # Missing or non-positive resolution means "no width" for the A side,
+    # matching the behaviour of the original per-row matcher.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hw = mz / res / 2
+    return np.where(res > 0, hw, 0.0)
+
+
+class PeakIndex:
+    """
+    Sorted, contiguous view of one spectrum used as the B side of a match.
+
+    Built once per sheet; every subtraction against that sheet reuses it.
+    ``order`` maps sorted positions back to rows of the source frame.
+    """
+
+    def __init__(self, mz: np.ndarray, resolution: np.ndarray, relative: Optional[np.ndarray] = None):
+        mz = np.asarray(mz, dtype=np.float64)
+        resolution = np.asarray(resolution, dtype=np.float64)
+        if relative is None:
+            relative = np.full(len(mz), np.nan)
+        relative = np.asarray(relative, dtype=np.float64)
+
+        self.order = np.argsort(mz, kind="stable")
+        self.mz = np.ascontiguousarray(mz[self.order])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.half_width = np.ascontiguousarray(self.mz / resolution[self.order] / 2)
+        self.relative = np.ascontiguousarray(relative[self.order])
+        valid = ~np.isnan(self.half_width)
+        self.max_half_width = float(self.half_width[valid].max()) if valid.any() else float("nan")
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "PeakIndex":
+        with stage("index", peaks=len(df)):
+            return cls(
+                df["m/z"].to_numpy(dtype=np.float64),
+                df["Resolution"].to_numpy(dtype=np.float64),
+                df["Relative"].to_numpy(dtype=np.float64) if "Relative" in df.columns else None,
+            )
+
+    @classmethod
+    def from_sorted(cls, mz: np.ndarray, half_width: np.ndarray,
+                    relative: Optional[np.ndarray] = None) -> "PeakIndex":
+        """Wrap arrays already sorted by m/z (e.g. memory-mapped store slices) without copying."""
+        index = cls.__new__(cls)
+        index.order = np.arange(len(mz))
+        index.mz = mz
+        index.half_width = half_width
+        index.relative = relative if relative is not None else np.full(len(mz), np.nan)
+        valid = ~np.isnan(half_width)
+        index.max_half_width = float(half_width[valid].max()) if valid.any() else float("nan")
+        return index
+
+    def __len__(self) -> int:
+        return len(self.mz)
+
+    def match(self, mz_a: np.ndarray, res_a: np.ndarray, ppm_tol: float = 3.0) -> np.ndarray:
+        """Return a boolean array, True where the A peak has a match in this index."""
+        mask = np.zeros(len(mz_a), dtype=bool)
+        for ia, _ib, _ppm in self._hits(mz_a, res_a, ppm_tol):
+            mask[ia] = True
+        return mask
+
+    def pairs(self, mz_a: np.ndarray, res_a: np.ndarray,
+              ppm_tol: float = 3.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Every matching (A, B) pair as (A positions, B rows of the source frame, signed ppm error),
+        ordered by A. The ppm error is (B - A) relative to the mean of the two m/z values.
+        """
+        hits = list(self._hits(mz_a, res_a, ppm_tol))
+        if not hits:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        ia, ib, ppm = (np.concatenate(parts) for parts in zip(*hits))
+        return ia, self.order[ib], ppm
+
+    def _hits(self, mz_a: np.ndarray, res_a: np.ndarray,
+              ppm_tol: float) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        # Yields (A positions, sorted B positions, signed ppm) for each chunk of candidate pairs.
+        mz_a = np.asarray(mz_a, dtype=np.float64)
+        res_a = np.asarray(res_a, dtype=np.float64)
+        if len(mz_a) == 0 or len(self.mz) == 0 or np.isnan(self.max_half_width):
+            return
+
+        mz_b, hw_b = self.mz, self.half_width
+        hw_a = _half_widths(mz_a, res_a)
+        reach = hw_a + self.max_half_width
+        left = np.searchsorted(mz_b, mz_a - reach, side="left")
+        right = np.searchsorted(mz_b, mz_a + reach, side="right")
+        counts = np.maximum(right - left, 0)
+
+        # Expand candidate windows into flat (A, B) index pairs, a bounded chunk at a time.
+        ends = np.cumsum(counts)
+        start = 0
+        while start < len(mz_a):
+            base = ends[start - 1] if start else 0
+            stop = int(np.searchsorted(ends, base + _PAIR_CHUNK, side="right"))
+            stop = max(stop, start + 1)
+            c = counts[start:stop]
+            total = int(c.sum())
+            if total:
+                ia = np.repeat(np.arange(start, stop), c)
+                first = np.cumsum(c) - c
+                ib = np.arange(total) - np.repeat(first, c) + np.repeat(left[start:stop], c)
+
+                m1 = mz_a[ia]
+                mb = mz_b[ib]
+                diff = mb - m1
+                sep = np.abs(diff)
+                overlap = sep <= (hw_a[ia] + hw_b[ib])
+                delta_ppm = sep / ((mb + m1) / 2.0) * 1e6
+                hit = overlap & (delta_ppm <= ppm_tol)
+                if hit.any():
+                    yield ia[hit], ib[hit], np.copysign(delta_ppm[hit], diff[hit])
+            start = stop
+
+
+def compare_dfs(df1: pd.DataFrame, df2: Union[pd.DataFrame, PeakIndex], ppm_tol: float = 3.0) -> pd.DataFrame:
+    """Peaks of ``df1`` with no overlapping peak in ``df2`` (A minus B)."""
+    if df1.empty:
+        return df1.copy()
+    if len(df2) == 0:
+        return df1.dropna(subset=["m/z"]).reset_index(drop=True)
+
+    dfA = df1.dropna(subset=["m/z"])
+    mask = match_frame(dfA, df2, ppm_tol)
+    return dfA.loc[~mask].reset_index(drop=True)
+
+
+def match_frame(dfA: pd.DataFrame, df2: Union[pd.DataFrame, PeakIndex], ppm_tol: float = 3.0) -> np.ndarray:
+    """True for each row of ``dfA`` (no NaN m/z) that has a match in ``df2``."""
+    if dfA.empty or len(df2) == 0:
+        return np.zeros(len(dfA), dtype=bool)
+    index = df2 if isinstance(df2, PeakIndex) else PeakIndex.from_frame(df2)
+    with stage("match", peaks_a=len(dfA), peaks_b=len(index)):
+        return index.match(
+            dfA["m/z"].to_numpy(dtype=np.float64),
+            dfA["Resolution"].to_numpy(dtype=np.float64),
+            ppm_tol,
+        )
+
+
+def merge_indexes(indexes: Dict[str, PeakIndex]) -> Tuple[PeakIndex, np.ndarray]:
+    """
+    One index over the peaks of several references, plus the position (in ``indexes``)
+    of the reference each sorted peak came from.
+    """
+    parts = list(indexes.values())
+    mz = np.concatenate([index.mz for index in parts]) if parts else np.zeros(0)
+    source = np.repeat(np.arange(len(parts)), [len(index) for index in parts])
+    order = np.argsort(mz, kind="stable")
+    merged = PeakIndex.from_sorted(
+        np.ascontiguousarray(mz[order]),
+        np.ascontiguousarray(np.concatenate([index.half_width for index in parts])[order]) if parts else mz,
+        np.ascontiguousarray(np.concatenate([index.relative for index in parts])[order]) if parts else mz,
+    )
+    return merged, source[order]
+
+
+def multi_subtract(df_a: pd.DataFrame, references: Dict[str, Union[pd.DataFrame, PeakIndex]],
+                   ppm_tol: float = 3.0) -> Tuple[pd.DataFrame, pd.DataFrame, Dict[str, int]]:
+    """
+    A minus every reference at once, in one query against their merged index.
+
+    Returns the unique peaks, the removed ones and the number of peaks each reference matched
+    (a peak matched by several references counts for each). The removed frame has an extra
+    "Removed by" column naming every reference (comma separated) that matched the peak.
+    """
+    names = list(references)
+    indexes = {name: ref if isinstance(ref, PeakIndex) else PeakIndex.from_frame(ref)
+               for name, ref in references.items()}
+    dfA = df_a.dropna(subset=["m/z"])
+    merged, source = merge_indexes(indexes)
+    with stage("multi_match", peaks_a=len(dfA), peaks_b=len(merged), references=len(names)):
+        ia, ib, _ = merged.pairs(dfA["m/z"].to_numpy(dtype=np.float64),
+                                 dfA["Resolution"].to_numpy(dtype=np.float64), ppm_tol)
+        # Unique (A row, reference) hits, in A order then reference order.
+        hits = np.unique(ia * max(len(names), 1) + source[ib])
+        rows, refs = np.divmod(hits, max(len(names), 1))
+    matched = np.zeros(len(dfA), dtype=bool)
+    matched[rows] = True
+    counts = dict(zip(names, np.bincount(refs, minlength=len(names)).tolist()))
+
+    if df_a.empty:
+        return df_a.copy(), df_a.assign(**{"Removed by": pd.Series(dtype=object)}), counts
+    removed_rows, starts = np.unique(rows, return_index=True)
+    removed = dfA.iloc[removed_rows].reset_index(drop=True)
+    groups = np.split(refs, starts[1:]) if len(refs) else []
+    removed["Removed by"] = pd.Series([", ".join(names[r] for r in group) for group in groups], dtype=object)
+    return dfA.loc[~matched].reset_index(drop=True), removed, counts
+
+
+def dual_subtract(df_a: pd.DataFrame, df_b: pd.DataFrame, index_b: Optional[PeakIndex] = None,
+                  ppm_tol: float = 3.0) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Peaks only in A, peaks only in B, and the matched pairs, from one matching pass.
+
+    The matched frame has one row per overlapping (A, B) pair: "m/z A", "Relative A",
+    "m/z B", "Relative B" and "ppm error" (see PeakIndex.pairs). ``index_b`` must be
+    built from ``df_b`` itself.
+    """
+    return dual_frames(df_a, df_b, *dual_pairs(df_a, df_b, index_b, ppm_tol))
+
+
+def dual_pairs(df_a: pd.DataFrame, df_b: pd.DataFrame, index_b: Optional[PeakIndex] = None,
+               ppm_tol: float = 3.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(rows of df_a without NaN m/z, rows of df_b, signed ppm) for every matching pair."""
+    dfA = df_a.dropna(subset=["m/z"])
+    if dfA.empty or len(df_b) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    index = index_b if index_b is not None else PeakIndex.from_frame(df_b)
+    with stage("dual_match", peaks_a=len(dfA), peaks_b=len(index)):
+        return index.pairs(dfA["m/z"].to_numpy(dtype=np.float64), dfA["Resolution"].to_numpy(dtype=np.float64),
+                           ppm_tol)
+
+
+def dual_frames(df_a: pd.DataFrame, df_b: pd.DataFrame, ia: np.ndarray, ib: np.ndarray,
+                ppm: np.ndarray) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    dfA = df_a.dropna(subset=["m/z"])
+    matched_a = np.zeros(len(dfA), dtype=bool)
+    matched_a[ia] = True
+    # B rows are positions in df_b; its NaN m/z rows never match and are dropped here.
+    matched_b = np.zeros(len(df_b), dtype=bool)
+    matched_b[ib] = True
+    a_only = df_a.copy() if df_a.empty else dfA.loc[~matched_a].reset_index(drop=True)
+    b_only = df_b.copy() if df_b.empty else df_b.loc[~matched_b].dropna(subset=["m/z"]).reset_index(drop=True)
+    return a_only, b_only, matched_frame(dfA, df_b, ia, ib, ppm)
+
+
+def matched_frame(dfA: pd.DataFrame, df_b: pd.DataFrame, ia: np.ndarray, ib: np.ndarray,
+                  ppm: np.ndarray) -> pd.DataFrame:
+    """The matched table of dual_subtract; ``dfA`` is A without NaN m/z rows."""
+    return pd.DataFrame({
+        "m/z A": dfA["m/z"].to_numpy()[ia],
+        "Relative A": dfA["Relative"].to_numpy()[ia],
+        "m/z B": df_b["m/z"].to_numpy()[ib],
+        "Relative B": df_b["Relative"].to_numpy()[ib],
+        "ppm error": ppm,
+    })
+
+
+def dual_compare(df_a: pd.DataFrame, df_b: pd.DataFrame, index_b: Optional[PeakIndex] = None,
+                 ppm_tol: float = 3.0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """A minus B and B minus A (the "Plot Dual" view); see dual_subtract."""
+    a_only, b_only, _ = dual_subtract(df_a, df_b, index_b, ppm_tol)
+    return a_only, b_only
+
+
+def fold_changes(intensity_a: np.ndarray, intensity_b: np.ndarray, ia: np.ndarray, ib: np.ndarray) -> np.ndarray:
+    """
+    Per A peak, its intensity over the summed intensity of the B peaks it matched (pairs ``ia``,
+    ``ib``); inf for a peak without a match or whose partners all have zero intensity.
+    """
+    b_sum = np.bincount(ia, weights=intensity_b[ib], minlength=len(intensity_a))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fold = intensity_a / b_sum
+    return np.where(b_sum > 0, fold, np.inf)
+
+
+def fold_change(df_a: pd.DataFrame, df_b: pd.DataFrame, index_b: Optional[PeakIndex] = None, ppm_tol: float = 3.0,
+                column: str = "Intensity", pairs: Optional[Tuple[np.ndarray, ...]] = None) -> pd.DataFrame:
+    """
+    ``df_a`` without NaN m/z rows, plus a "Fold change" column comparing ``column`` (see fold_changes).
+    ``pairs`` is the dual_pairs result for the two frames, when it has been computed already.
+    """
+    dfA = df_a.dropna(subset=["m/z"]).reset_index(drop=True)
+    ia, ib, _ = pairs if pairs is not None else dual_pairs(dfA, df_b, index_b, ppm_tol)
+    return dfA.assign(**{FOLD_COLUMN: fold_changes(dfA[column].to_numpy(dtype=np.float64),
+                                                   df_b[column].to_numpy(dtype=np.float64), ia, ib)})
+
+
+def fold_change_subtract(df_a: pd.DataFrame, df_b: pd.DataFrame, index_b: Optional[PeakIndex] = None,
+                         ppm_tol: float = 3.0, min_fold: float = 3.0, column: str = "Intensity",
+                         pairs: Optional[Tuple[np.ndarray, ...]] = None) -> pd.DataFrame:
+    """
+    Quantitative A minus B: instead of dropping every matched peak, keep those at least ``min_fold``
+    times as intense in A as in B (unmatched peaks always stay), with their "Fold change".
+    """
+    table = fold_change(df_a, df_b, index_b, ppm_tol, column, pairs)
+    return table.loc[table[FOLD_COLUMN].to_numpy() >= min_fold].reset_index(drop=True)
@@ -0,0 +1,127 @@
+"""
+Running many subtractions at once on a process pool.
+
+The m/z and Resolution columns of every sheet are copied once into a single
+shared-memory block. Workers attach to it when they start and build their
+own PeakIndex per reference sheet on first use, so a task only carries two
+sheet names and the tolerance, and only a boolean mask comes back.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import stage
+from .matching import PeakIndex
+
+# Column order inside each sheet's slice of the shared block.
+SHARED_COLUMNS = ("m/z", "Resolution")
+
+Layout = Dict[str, Tuple[int, int]]
+
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+_worker_arrays: Dict[str, np.ndarray] = {}
+_worker_indexes: Dict[str, PeakIndex] = {}
+
+
+class SharedPeakArrays:
+    """Parent-side owner of the shared block; use as a context manager."""
+
+    def __init__(self, data: Dict[str, pd.DataFrame]):
+        self.layout: Layout = {}
+        offset = 0
+        for name, df in data.items():
+            n = len(df)
+            self.layout[name] = (offset, n)
+            offset += n * len(SHARED_COLUMNS)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1) * 8)
+        block = np.ndarray((offset,), dtype=np.float64, buffer=self.shm.buf)
+        for name, df in data.items():
+            start, n = self.layout[name]
+            for i, col in enumerate(SHARED_COLUMNS):
+                block[start + i * n:start + (i + 1) * n] = df[col].to_numpy(dtype=np.float64)
+        del block
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self) -> "SharedPeakArrays":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _init_worker(shm_name: str, layout: Layout) -> None:
+    global _worker_shm
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    total = sum(n * len(SHARED_COLUMNS) for _, n in layout.values())
+    block = np.ndarray((total,), dtype=np.float64, buffer=_worker_shm.buf)
+    _worker_arrays.clear()
+    _worker_indexes.clear()
+    for name, (start, n) in layout.items():
+        _worker_arrays[name] = block[start:start + n * len(SHARED_COLUMNS)].reshape(len(SHARED_COLUMNS), n)
+
+
+def _match_task(target: str, reference: str, ppm_tol: float) -> np.ndarray:
+    index = _worker_indexes.get(reference)
+    if index is None:
+        mz_b, res_b = _worker_arrays[reference]
+        index = _worker_indexes[reference] = PeakIndex(mz_b, res_b)
+    mz_a, res_a = _worker_arrays[target]
+    return index.match(mz_a, res_a, ppm_tol)
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def iter_subtractions(data: Dict[str, pd.DataFrame], pairs: Sequence[Tuple[str, str]], ppm_tol: float = 3.0,
+                      workers: Optional[int] = None, indexes: Optional[Dict[str, PeakIndex]] = None
+                      ) -> Iterator[Tuple[Tuple[str, str], pd.DataFrame]]:
+    """
+    Yield ((target, reference), unique_df) in the order of ``pairs``.
+
+    Each unique_df equals compare_dfs(data[target], data[reference], ppm_tol).
+    ``workers`` of 1 runs in this process without a pool. ``indexes`` holds
+    PeakIndex objects already built for some references (e.g. from a
+    SpectrumStore); the in-process path matches against them as they are.
+    """
+    workers = workers or default_workers()
+    # Sheets are dropna'd on m/z up front, the same as compare_dfs does for A.
+    frames = {name: df.dropna(subset=["m/z"]) for name, df in data.items()}
+
+    if workers <= 1 or len(pairs) <= 1:
+        indexes = dict(indexes or {})
+        for target, reference in pairs:
+            if reference not in indexes:
+                indexes[reference] = PeakIndex.from_frame(frames[reference])
+            dfA = frames[target]
+            with stage("match", target=target, reference=reference, peaks_a=len(dfA)):
+                mask = indexes[reference].match(dfA["m/z"].to_numpy(dtype=np.float64),
+                                                dfA["Resolution"].to_numpy(dtype=np.float64), ppm_tol)
+                unique_df = dfA.loc[~mask].reset_index(drop=True)
+            yield (target, reference), unique_df
+        return
+
+    used = {name for pair in pairs for name in pair}
+    with SharedPeakArrays({name: frames[name] for name in used}) as shared:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pairs)), initializer=_init_worker,
+                                 initargs=(shared.name, shared.layout)) as pool:
+            targets = [t for t, _ in pairs]
+            references = [r for _, r in pairs]
+            masks = pool.map(_match_task, targets, references, [ppm_tol] * len(pairs))
+            for pair in pairs:
+                # Worker processes report no stages; this times the wait for each result, in order.
+                with stage("match_wait", target=pair[0], reference=pair[1]):
+                    mask = next(masks)
+                    unique_df = frames[pair[0]].loc[~mask].reset_index(drop=True)
+                yield pair, unique_df
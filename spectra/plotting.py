@@ -0,0 +1,202 @@
+"""
+Stick-spectrum drawing shared by the Qt app and the batch CLI.
+
+The draw_* functions only touch the Axes they are given, so callers decide
+whether the figure comes from pyplot (interactive windows) or from a bare
+matplotlib Figure (headless export, no GUI toolkit needed). The update_*
+functions redraw an Axes made by the matching draw_* function in place, so
+an embedded canvas can switch spectra without building a new figure.
+A table with a "Fold change" column (fold_change_subtract) is drawn with its
+sticks coloured by fold change, on a log scale with a small colour bar.
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.axes import Axes
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+
+from .instrumentation import stage
+from .matching import FOLD_COLUMN
+from .render import StickCollection
+
+FIGSIZE = (10, 5)
+# Colour range of fold-change plots; unmatched peaks (infinite fold change) take the top colour.
+FOLD_RANGE = (1.0, 100.0)
+FOLD_CMAP = "viridis"
+
+
+def annotate_peaks(ax: Axes, top: pd.DataFrame, y_scale: float = 1.0) -> None:
+    """Label each peak in ``top`` with its m/z; a negative ``y_scale`` puts labels below the axis."""
+    below = y_scale < 0
+    for mz, rel in zip(top["m/z"].to_numpy(), top["Relative"].to_numpy()):
+        ax.annotate(f"{mz:.4f}", xy=(mz, rel * y_scale), xytext=(0, -5 if below else 5),
+                    textcoords="offset points", ha="center", va="top" if below else "bottom",
+                    rotation=45, fontsize=8)
+
+
+def draw_spectrum(ax: Axes, df: pd.DataFrame, title: str, n_peaks: int = 10, y_scale: float = 1.0,
+                  decimate: bool = False) -> StickCollection:
+    """
+    ``y_scale`` multiplies Relative at draw time (e.g. normalization) so ``df`` is never copied.
+    ``decimate`` is for interactive axes; see spectra.render.
+    """
+    with stage("draw", peaks=len(df)):
+        return _draw_spectrum(ax, df, title, n_peaks, y_scale, decimate)
+
+
+def _draw_spectrum(ax: Axes, df: pd.DataFrame, title: str, n_peaks: int, y_scale: float,
+                   decimate: bool) -> StickCollection:
+    values = _fold_values(df)
+    if values is None:
+        sticks = StickCollection(ax, df["m/z"].to_numpy(), df["Relative"].to_numpy() * y_scale, "black", decimate)
+    else:
+        sticks = StickCollection(ax, df["m/z"].to_numpy(), df["Relative"].to_numpy() * y_scale, "black", decimate,
+                                 values, FOLD_CMAP, LogNorm(*FOLD_RANGE))
+        _fold_colorbar(ax, sticks)
+    _finish_spectrum(ax, df, title, n_peaks, y_scale)
+    return sticks
+
+
+def _fold_values(df: pd.DataFrame) -> Optional[np.ndarray]:
+    # LogNorm masks infinite values, so unmatched peaks are clipped into the top colour here.
+    return np.clip(df[FOLD_COLUMN].to_numpy(dtype=np.float64), *FOLD_RANGE) if FOLD_COLUMN in df.columns else None
+
+
+def _fold_colorbar(ax: Axes, sticks: StickCollection) -> None:
+    # An inset of ``ax`` (above its top right corner), so clearing the Axes removes it as well.
+    cax = ax.inset_axes([0.75, 1.02, 0.25, 0.025])
+    bar = ax.figure.colorbar(sticks.collection, cax=cax, orientation="horizontal")
+    cax.xaxis.set_ticks_position("top")
+    cax.tick_params(labelsize=7)
+    cax.set_title("fold change A / B (unmatched: top)", fontsize=8, loc="left")
+
+
+def _finish_spectrum(ax: Axes, df: pd.DataFrame, title: str, n_peaks: int, y_scale: float) -> None:
+    top = df.nlargest(n_peaks, "Relative") if not df.empty else df
+    ax.set_title(title)
+    ax.set_xlabel("m/z")
+    ax.set_ylabel("Relative")
+    ax.set_xlim(right=max(350, float(df["m/z"].max()) if not df.empty else 350))
+    ax.set_ylim(bottom=0, top=115)
+    annotate_peaks(ax, top, y_scale)
+
+
+def update_spectrum(ax: Axes, sticks: StickCollection, df: pd.DataFrame, title: str, n_peaks: int = 10,
+                    y_scale: float = 1.0, keep_view: bool = False) -> None:
+    """
+    Redraw an Axes made by draw_spectrum with new data, reusing its sticks artist. With ``keep_view``
+    the limits (and any zoom) stay as they are; only the sticks and the peak labels change.
+    ``df`` must have a "Fold change" column exactly when the drawn table had one.
+    """
+    with stage("draw", peaks=len(df)):
+        if keep_view:
+            _clear_labels(ax)
+        else:
+            _reset_axes(ax)
+        sticks.set_data(df["m/z"].to_numpy(), df["Relative"].to_numpy() * y_scale, _fold_values(df))
+        if keep_view:
+            annotate_peaks(ax, df.nlargest(n_peaks, "Relative") if not df.empty else df, y_scale)
+            return
+        _rescale(ax, sticks)
+        _finish_spectrum(ax, df, title, n_peaks, y_scale)
+
+
+def _clear_labels(ax: Axes) -> None:
+    for text in list(ax.texts):
+        text.remove()
+
+
+def _reset_axes(ax: Axes) -> None:
+    """Drop the previous peak labels and forget the old data limits and any zoom."""
+    _clear_labels(ax)
+    ax.set_autoscale_on(True)
+    ax.ignore_existing_data_limits = True
+
+
+def _rescale(ax: Axes, *sticks: StickCollection) -> None:
+    for collection in sticks:
+        collection.update_datalim()
+    ax.autoscale_view()
+
+
+def draw_dual_spectrum(ax: Axes, df_up: pd.DataFrame, df_down: pd.DataFrame, title: str, n_peaks: int = 10,
+                       up_scale: float = 1.0, down_scale: float = 1.0,
+                       decimate: bool = False) -> Tuple[StickCollection, StickCollection]:
+    with stage("draw", peaks=len(df_up) + len(df_down)):
+        return _draw_dual_spectrum(ax, df_up, df_down, title, n_peaks, up_scale, down_scale, decimate)
+
+
+def _draw_dual_spectrum(ax: Axes, df_up: pd.DataFrame, df_down: pd.DataFrame, title: str, n_peaks: int,
+                        up_scale: float, down_scale: float,
+                        decimate: bool) -> Tuple[StickCollection, StickCollection]:
+    up = StickCollection(ax, df_up["m/z"].to_numpy(), df_up["Relative"].to_numpy() * up_scale, "#13f034", decimate)
+    down = StickCollection(ax, df_down["m/z"].to_numpy(), -df_down["Relative"].to_numpy() * down_scale, "#f51c0c",
+                           decimate)
+    ax.axhline(0, linewidth=1)
+    _finish_dual_spectrum(ax, df_up, df_down, title, n_peaks, up_scale, down_scale)
+    return up, down
+
+
+def _finish_dual_spectrum(ax: Axes, df_up: pd.DataFrame, df_down: pd.DataFrame, title: str, n_peaks: int,
+                          up_scale: float, down_scale: float) -> None:
+    top_up = df_up.nlargest(n_peaks, "Relative") if not df_up.empty else df_up
+    top_down = df_down.nlargest(n_peaks, "Relative") if not df_down.empty else df_down
+    ax.set_title(title)
+    ax.set_xlabel("m/z")
+    ax.set_ylabel("Relative")
+    xmax = max(350, float(df_up["m/z"].max()) if not df_up.empty else 0,
+               float(df_down["m/z"].max()) if not df_down.empty else 0)
+    ax.set_xlim(right=xmax)
+    ax.set_ylim(-130, 130)
+
+    annotate_peaks(ax, top_up, up_scale)
+    annotate_peaks(ax, top_down, -down_scale)
+
+
+def update_dual_spectrum(ax: Axes, sticks: Tuple[StickCollection, StickCollection], df_up: pd.DataFrame,
+                         df_down: pd.DataFrame, title: str, n_peaks: int = 10, up_scale: float = 1.0,
+                         down_scale: float = 1.0, keep_view: bool = False) -> None:
+    up, down = sticks
+    with stage("draw", peaks=len(df_up) + len(df_down)):
+        if keep_view:
+            _clear_labels(ax)
+        else:
+            _reset_axes(ax)
+        up.set_data(df_up["m/z"].to_numpy(), df_up["Relative"].to_numpy() * up_scale)
+        down.set_data(df_down["m/z"].to_numpy(), -df_down["Relative"].to_numpy() * down_scale)
+        if keep_view:
+            annotate_peaks(ax, df_up.nlargest(n_peaks, "Relative") if not df_up.empty else df_up, up_scale)
+            annotate_peaks(ax, df_down.nlargest(n_peaks, "Relative") if not df_down.empty else df_down, -down_scale)
+            return
+        _rescale(ax, up, down)
+        _finish_dual_spectrum(ax, df_up, df_down, title, n_peaks, up_scale, down_scale)
+
+
+def figure_filename(title: str, suffix: str = "", ext: str = "svg") -> str:
+    return f"{title.replace(' ', '_')}{suffix}.{ext}"
+
+
+def finish_figure(fig: Figure, filepath: str) -> str:
+    with stage("tight_layout"):
+        fig.tight_layout()
+    with stage("savefig", path=filepath):
+        fig.savefig(filepath)
+    return filepath
+
+
+def save_spectrum(df: pd.DataFrame, title: str, out_dir: str, n_peaks: int = 10, y_scale: float = 1.0,
+                  fmt: str = "svg") -> str:
+    """Render a single spectrum off-screen and write it as ``fmt`` (svg, png or pdf); returns the path."""
+    fig = Figure(figsize=FIGSIZE)
+    draw_spectrum(fig.add_subplot(), df, title, n_peaks, y_scale)
+    return finish_figure(fig, os.path.join(out_dir, figure_filename(title, ext=fmt)))
+
+
+def save_dual_spectrum(df_up: pd.DataFrame, df_down: pd.DataFrame, title: str, out_dir: str,
+                       n_peaks: int = 10, up_scale: float = 1.0, down_scale: float = 1.0, fmt: str = "svg") -> str:
+    fig = Figure(figsize=FIGSIZE)
+    draw_dual_spectrum(fig.add_subplot(), df_up, df_down, title, n_peaks, up_scale, down_scale)
+    return finish_figure(fig, os.path.join(out_dir, figure_filename(title, "_dual", fmt)))
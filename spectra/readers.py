@@ -0,0 +1,286 @@
+"""
+Peak-list readers.
+
+A reader opens one file and exposes ``sheet_names`` (one name per spectrum)
+and ``read(name, skip_rows, min_sn)``, which returns the peak table with
+the columns in REQUIRED_COLUMNS. Peaks whose signal-to-noise ratio
+(Intensity / Noise) is not above ``min_sn`` (default 10) are dropped while
+reading, so the rejected rows are never kept in full; ``min_sn=None`` keeps
+every peak, for callers that apply the cut later (see sn_filter).
+
+Supported out of the box:
+    .xlsx/.xls          one spectrum per sheet
+    .csv/.tsv/.txt      one spectrum per file, parsed in chunks
+    .mzML               one spectrum per <spectrum>, centroided peak arrays
+
+Other formats can be added with register_reader().
+"""
+import base64
+import mmap
+import os
+import re
+import xml.etree.ElementTree as ET
+import zlib
+from typing import Dict, List, Optional, Tuple, Type
+from xml.sax.saxutils import unescape
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import stage
+
+REQUIRED_COLUMNS = ("m/z", "Intensity", "Relative", "Resolution", "Noise")
+
+CSV_CHUNK_ROWS = 100_000
+
+# Default signal-to-noise cut: keep peaks with Intensity > MIN_SN * Noise.
+MIN_SN = 10.0
+
+
+def filter_sheet(name: str, df: pd.DataFrame, min_sn: Optional[float] = MIN_SN) -> pd.DataFrame:
+    missing = set(REQUIRED_COLUMNS) - set(df.columns)
+    if missing:
+        raise ValueError(f"Sheet '{name}' is missing columns: {sorted(missing)}")
+    if min_sn is not None:
+        noise = pd.to_numeric(df["Noise"], errors="coerce")
+        df = df.loc[pd.to_numeric(df["Intensity"], errors="coerce") > min_sn * noise]
+    keep = df.copy()
+    for col in REQUIRED_COLUMNS:
+        keep[col] = pd.to_numeric(keep[col], errors="coerce")
+    return keep.dropna(subset=["m/z", "Relative", "Resolution"]).reset_index(drop=True)
+
+
+def sn_mask(intensity: np.ndarray, noise: np.ndarray, min_sn: Optional[float] = MIN_SN) -> np.ndarray:
+    """True for the peaks that pass the S/N cut, Intensity > min_sn * Noise (every peak for None)."""
+    if min_sn is None:
+        return np.ones(len(intensity), dtype=bool)
+    return intensity > min_sn * noise
+
+
+def sn_filter(df: pd.DataFrame, min_sn: Optional[float] = MIN_SN) -> pd.DataFrame:
+    """Rows of an already loaded peak table that pass the S/N cut (``df`` itself for None)."""
+    if min_sn is None:
+        return df
+    keep = sn_mask(df["Intensity"].to_numpy(dtype=np.float64), df["Noise"].to_numpy(dtype=np.float64), min_sn)
+    return df if keep.all() else df.loc[keep].reset_index(drop=True)
+
+
+def excel_engine() -> Optional[str]:
+    """The fastest Excel reader installed; None lets pandas pick (openpyxl, read-only)."""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return None
+    return "calamine"
+
+
+class PeakListReader:
+    """Base class; subclasses set ``sheet_names`` in __init__ and implement read()."""
+
+    extensions: Tuple[str, ...] = ()
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sheet_names: List[str] = []
+
+    def read(self, name: str, skip_rows: int, min_sn: Optional[float] = MIN_SN) -> pd.DataFrame:
+        raise NotImplementedError
+
+
+class ExcelReader(PeakListReader):
+    extensions = (".xlsx", ".xlsm", ".xls")
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._xls = pd.ExcelFile(path, engine=excel_engine())
+        self.sheet_names = list(self._xls.sheet_names)
+
+    def read(self, name: str, skip_rows: int, min_sn: Optional[float] = MIN_SN) -> pd.DataFrame:
+        with stage("read", sheet=name):
+            raw = pd.read_excel(self._xls, sheet_name=name, skiprows=skip_rows)
+        with stage("filter", sheet=name, rows=len(raw)):
+            return filter_sheet(name, raw, min_sn)
+
+
+class DelimitedReader(PeakListReader):
+    """CSV/TSV peak list; the whole file is one spectrum named after the file."""
+
+    extensions = (".csv", ".tsv", ".txt")
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.sheet_names = [os.path.splitext(os.path.basename(path))[0]]
+
+    def _sep(self) -> Optional[str]:
+        ext = os.path.splitext(self.path)[1].lower()
+        return {".csv": ",", ".tsv": "\t"}.get(ext)
+
+    def read(self, name: str, skip_rows: int, min_sn: Optional[float] = MIN_SN) -> pd.DataFrame:
+        if name not in self.sheet_names:
+            raise KeyError(name)
+        sep = self._sep()
+        chunks = pd.read_csv(self.path, sep=sep, skiprows=skip_rows, chunksize=CSV_CHUNK_ROWS,
+                             engine="c" if sep else "python")
+        with stage("read", sheet=name):
+            kept = [filter_sheet(name, chunk, min_sn) for chunk in chunks]
+        if not kept:
+            raise ValueError(f"Sheet '{name}' has no rows")
+        return pd.concat(kept, ignore_index=True)
+
+
+# mzML controlled-vocabulary accessions used below.
+_MZ_ARRAY = "MS:1000514"
+_INTENSITY_ARRAY = "MS:1000515"
+_NOISE_ARRAY = "MS:1002742"
+_NON_STANDARD_ARRAY = "MS:1000786"
+_FLOAT32 = "MS:1000521"
+_FLOAT64 = "MS:1000523"
+_ZLIB = "MS:1000574"
+
+# Start tag of a <spectrum> (not <spectrumList>), with any namespace prefix, and its attributes.
+_SPECTRUM_TAG = re.compile(rb"<((?:[\w.-]+:)?)spectrum(?=[\s>/])([^>]*)>")
+_ID_ATTR = re.compile(rb"""\sid\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+_XMLNS_ATTR = re.compile(rb"""\sxmlns(?::[\w.-]+)?\s*=\s*(?:"[^"]*"|'[^']*')""")
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+class MzmlReader(PeakListReader):
+    """
+    Centroided mzML.
+
+    Opening the file scans it once for the id and byte range of every
+    <spectrum>; read() then parses only that range, so loading the spectra
+    one by one reads the file once, not once per spectrum.
+
+    Resolution and noise are not standard mzML arrays; they are taken from a
+    noise array (MS:1002742) or "non-standard data array" entries named
+    resolution/noise, as written by Thermo converters.
+    """
+
+    extensions = (".mzml",)
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.sheet_names: List[str] = []
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        # Namespace declarations made before the first spectrum, re-declared around each parsed range.
+        self._namespaces = b""
+        with open(path, "rb") as fh, stage("scan", sheet=os.path.basename(path)):
+            if os.fstat(fh.fileno()).st_size == 0:
+                return
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                pos = 0
+                while True:
+                    start = _SPECTRUM_TAG.search(data, pos)
+                    if start is None:
+                        break
+                    if not self.sheet_names:
+                        self._namespaces = b"".join(_XMLNS_ATTR.findall(data, 0, start.start()))
+                    if start.group(2).rstrip().endswith(b"/"):
+                        end = start.end()
+                    else:
+                        close = data.find(b"</" + start.group(1) + b"spectrum>", start.end())
+                        if close < 0:
+                            raise ValueError(f"Unterminated <spectrum> in {path}")
+                        end = close + len(start.group(1)) + len(b"</spectrum>")
+                    found = _ID_ATTR.search(start.group(2))
+                    raw = (found.group(1) if found.group(1) is not None else found.group(2)) if found else b""
+                    spectrum_id = unescape(raw.decode("utf-8"), {"&quot;": '"', "&apos;": "'"})
+                    self.sheet_names.append(spectrum_id)
+                    self._offsets.setdefault(spectrum_id, (start.start(), end))
+                    pos = end
+
+    def _spectrum(self, name: str) -> ET.Element:
+        start, end = self._offsets[name]
+        with open(self.path, "rb") as fh:
+            fh.seek(start)
+            fragment = fh.read(end - start)
+        return ET.fromstring(b"<spectra" + self._namespaces + b">" + fragment + b"</spectra>")[0]
+
+    def read(self, name: str, skip_rows: int = 0, min_sn: Optional[float] = MIN_SN) -> pd.DataFrame:
+        if name not in self._offsets:
+            raise KeyError(name)
+        with stage("read", sheet=name):
+            elem = self._spectrum(name)
+        with stage("filter", sheet=name):
+            return self._to_frame(name, self._arrays(elem), min_sn)
+
+    @staticmethod
+    def _arrays(spectrum: ET.Element) -> Dict[str, np.ndarray]:
+        arrays: Dict[str, np.ndarray] = {}
+        for bda in spectrum.iter():
+            if _local(bda.tag) != "binaryDataArray":
+                continue
+            dtype, compressed, column = "<f8", False, None
+            binary = ""
+            for child in bda:
+                tag = _local(child.tag)
+                if tag == "cvParam":
+                    acc = child.get("accession")
+                    if acc == _FLOAT32:
+                        dtype = "<f4"
+                    elif acc == _FLOAT64:
+                        dtype = "<f8"
+                    elif acc == _ZLIB:
+                        compressed = True
+                    elif acc == _MZ_ARRAY:
+                        column = "m/z"
+                    elif acc == _INTENSITY_ARRAY:
+                        column = "Intensity"
+                    elif acc == _NOISE_ARRAY:
+                        column = "Noise"
+                    elif acc == _NON_STANDARD_ARRAY:
+                        column = (child.get("value") or "").strip().lower().capitalize() or None
+                elif tag == "binary":
+                    binary = child.text or ""
+            if column is None:
+                continue
+            raw = base64.b64decode(binary)
+            if compressed:
+                raw = zlib.decompress(raw)
+            arrays[column] = np.frombuffer(raw, dtype=dtype).astype(np.float64)
+        return arrays
+
+    @staticmethod
+    def _to_frame(name: str, arrays: Dict[str, np.ndarray], min_sn: Optional[float] = MIN_SN) -> pd.DataFrame:
+        missing = {"m/z", "Intensity", "Resolution", "Noise"} - set(arrays)
+        if missing:
+            raise ValueError(f"Spectrum '{name}' is missing arrays: {sorted(missing)}")
+        intensity = arrays["Intensity"]
+        top = intensity.max() if len(intensity) else 0.0
+        relative = intensity / top * 100.0 if top > 0 else np.zeros_like(intensity)
+        keep = ~np.isnan(arrays["m/z"]) & ~np.isnan(arrays["Resolution"]) & sn_mask(intensity, arrays["Noise"], min_sn)
+        return pd.DataFrame({
+            "m/z": arrays["m/z"][keep],
+            "Intensity": intensity[keep],
+            "Relative": relative[keep],
+            "Resolution": arrays["Resolution"][keep],
+            "Noise": arrays["Noise"][keep],
+        })
+
+
+_READERS: Dict[str, Type[PeakListReader]] = {}
+
+
+def register_reader(reader: Type[PeakListReader]) -> None:
+    for ext in reader.extensions:
+        _READERS[ext.lower()] = reader
+
+
+for _reader in (ExcelReader, DelimitedReader, MzmlReader):
+    register_reader(_reader)
+
+
+def supported_extensions() -> List[str]:
+    return sorted(_READERS)
+
+
+def open_reader(path: str) -> PeakListReader:
+    ext = os.path.splitext(path)[1].lower()
+    reader = _READERS.get(ext)
+    if reader is None:
+        raise ValueError(f"Unsupported file type '{ext}' (supported: {', '.join(supported_extensions())})")
+    return reader(path)
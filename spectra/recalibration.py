@@ -0,0 +1,131 @@
+"""
+Mass-drift recalibration.
+
+Runs acquired days apart can drift by a few ppm, enough to turn real
+matches into "unique" peaks at a 3 ppm tolerance. fit_drift finds anchor
+pairs: peaks of A and B that are each other's only candidate within a wide
+ppm window (a plain sorted-array window, so the peak-width test of the
+final match does not hide the drift). It then fits the B - A ppm error as a
+linear or quadratic function of m/z, dropping outliers, and returns a
+Recalibration. Applied to B, that correction moves B onto A's mass scale
+before the final match. All of this is a few vectorized passes, cheap
+enough to run before every subtraction.
+"""
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.polynomial import Polynomial
+
+from .instrumentation import stage
+
+# Widest drift looked for, in ppm.
+COARSE_PPM = 20.0
+# Fewer anchors than this and the spectra are left as they are.
+MIN_ANCHORS = 10
+
+
+def _anchors(mz_a: np.ndarray, mz_b: np.ndarray, coarse_ppm: float) -> Tuple[np.ndarray, np.ndarray]:
+    # (A m/z, B m/z) of the pairs where each peak is the other's only candidate within coarse_ppm.
+    mz_a = mz_a[~np.isnan(mz_a)]
+    mz_b = np.sort(mz_b[~np.isnan(mz_b)])
+    left = np.searchsorted(mz_b, mz_a * (1 - coarse_ppm * 1e-6), side="left")
+    right = np.searchsorted(mz_b, mz_a * (1 + coarse_ppm * 1e-6), side="right")
+    single = (right - left) == 1
+    a, ib = mz_a[single], left[single]
+    # The B side has to be unambiguous as well.
+    once = np.bincount(ib, minlength=len(mz_b))[ib] == 1
+    return a[once], mz_b[ib[once]]
+
+
+def _rms(values: np.ndarray) -> float:
+    return float(np.sqrt(np.mean(values ** 2))) if len(values) else float("nan")
+
+
+class Recalibration:
+    """
+    The fitted drift of B relative to A: ``shift(mz)`` is the ppm error (B - A) expected at
+    ``mz``. ``applied`` is False when there were too few anchors and nothing is corrected.
+    """
+
+    def __init__(self, shift: Polynomial, degree: int, anchors: int, rms_before: float, rms_after: float,
+                 mz_range: Tuple[float, float], applied: bool):
+        self.shift = shift
+        self.degree = degree
+        self.anchors = anchors
+        self.rms_before = rms_before
+        self.rms_after = rms_after
+        self.mz_range = mz_range
+        self.applied = applied
+
+    def ppm_at(self, mz: np.ndarray) -> np.ndarray:
+        return self.shift(np.asarray(mz, dtype=np.float64)) if self.applied else np.zeros(np.shape(mz))
+
+    def correct(self, mz: np.ndarray) -> np.ndarray:
+        """B m/z values moved onto A's mass scale."""
+        mz = np.asarray(mz, dtype=np.float64)
+        return mz / (1 + self.ppm_at(mz) * 1e-6)
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Copy of B with corrected m/z; the other columns are shared with ``df``."""
+        if not self.applied:
+            return df
+        corrected = df.copy(deep=False)
+        corrected["m/z"] = self.correct(df["m/z"].to_numpy(dtype=np.float64))
+        return corrected
+
+    def summary(self) -> str:
+        if not self.applied:
+            return f"not recalibrated: {self.anchors} anchor peaks, need {MIN_ANCHORS}"
+        lo, hi = self.mz_range
+        kind = "linear" if self.degree == 1 else "quadratic"
+        return (f"B drift {self.ppm_at(lo):+.2f} ppm at m/z {lo:.0f}, {self.ppm_at(hi):+.2f} ppm at m/z {hi:.0f} "
+                f"({kind}, {self.anchors} anchors, rms {self.rms_before:.2f} -> {self.rms_after:.2f} ppm)")
+
+    def as_row(self) -> Dict[str, object]:
+        lo, hi = self.mz_range
+        coefficients = self.shift.convert().coef if self.applied else np.zeros(1)
+        return {
+            "Applied": self.applied,
+            "Degree": self.degree,
+            "Anchors": self.anchors,
+            "m/z min": lo,
+            "m/z max": hi,
+            "ppm at m/z min": float(self.ppm_at(lo)),
+            "ppm at m/z max": float(self.ppm_at(hi)),
+            "rms before (ppm)": self.rms_before,
+            "rms after (ppm)": self.rms_after,
+            "Coefficients": " ".join(f"{c:.6g}" for c in coefficients),
+        }
+
+
+def fit_drift(df_a: pd.DataFrame, df_b: pd.DataFrame, degree: int = 1, coarse_ppm: float = COARSE_PPM,
+              min_anchors: int = MIN_ANCHORS) -> Recalibration:
+    """Fit the ppm drift of ``df_b`` against ``df_a`` as a polynomial of ``degree`` (1 or 2) in m/z."""
+    if degree not in (1, 2):
+        raise ValueError(f"degree must be 1 (linear) or 2 (quadratic), not {degree}")
+    with stage("recalibrate", peaks_a=len(df_a), peaks_b=len(df_b)):
+        a, b = _anchors(df_a["m/z"].to_numpy(dtype=np.float64), df_b["m/z"].to_numpy(dtype=np.float64), coarse_ppm)
+        mz = (a + b) / 2
+        ppm = (b - a) / mz * 1e6
+        mz_range = (float(mz.min()), float(mz.max())) if len(mz) else (0.0, 0.0)
+        if len(mz) < max(min_anchors, degree + 1):
+            return Recalibration(Polynomial([0.0]), degree, len(mz), _rms(ppm), _rms(ppm), mz_range, False)
+
+        keep = np.ones(len(mz), dtype=bool)
+        for _ in range(5):
+            shift = Polynomial.fit(mz[keep], ppm[keep], degree)
+            residual = ppm - shift(mz)
+            spread = 1.4826 * np.median(np.abs(residual[keep] - np.median(residual[keep])))
+            # Chance pairs inside the wide window sit far from the fitted curve.
+            inliers = np.abs(residual) <= max(3 * spread, 0.05)
+            if inliers.sum() < max(min_anchors, degree + 1) or np.array_equal(inliers, keep):
+                break
+            keep = inliers
+        return Recalibration(shift, degree, int(keep.sum()), _rms(ppm[keep]), _rms(residual[keep]), mz_range, True)
+
+
+def recalibrate(df_a: pd.DataFrame, df_b: pd.DataFrame, degree: int = 1) -> Tuple[pd.DataFrame, Recalibration]:
+    """``df_b`` moved onto ``df_a``'s mass scale, and the correction that was applied."""
+    recalibration = fit_drift(df_a, df_b, degree)
+    return recalibration.apply(df_b), recalibration
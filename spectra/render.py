@@ -0,0 +1,110 @@
+"""
+Stick rendering for large spectra.
+
+StickCollection draws every peak of a spectrum as one LineCollection built
+straight from numpy arrays (no per-peak artists). When it is interactive, it
+follows the x limits of its Axes. If more sticks are visible than the axes
+is wide in pixels, it shows only the tallest stick in each pixel column,
+which looks identical on screen. Once zoomed in far enough, it shows every
+visible stick again. Saved figures use the full data unless decimation is
+requested.
+Given per-stick ``values`` and a colormap, the sticks are coloured by value
+instead of drawn in one colour.
+"""
+from typing import Optional, Union
+
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.collections import LineCollection
+from matplotlib.colors import Colormap, Normalize
+
+# Decimate when more than this many sticks share one pixel column on average.
+STICKS_PER_PIXEL = 2
+
+
+def stick_segments(mz: np.ndarray, heights: np.ndarray) -> np.ndarray:
+    segments = np.empty((len(mz), 2, 2))
+    segments[:, :, 0] = mz[:, None]
+    segments[:, 0, 1] = 0.0
+    segments[:, 1, 1] = heights
+    return segments
+
+
+def max_per_bin(mz: np.ndarray, heights: np.ndarray, x0: float, x1: float, bins: int) -> np.ndarray:
+    """Indices of the tallest stick (by |height|) in each of ``bins`` equal m/z bins; ``mz`` sorted."""
+    if len(mz) == 0 or bins <= 0 or x1 <= x0:
+        return np.arange(len(mz))
+    column = ((mz - x0) * (bins / (x1 - x0))).astype(np.int64)
+    magnitude = np.abs(heights)
+    starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+    counts = np.diff(np.r_[starts, len(mz)])
+    tallest = np.maximum.reduceat(magnitude, starts)
+    # First stick in each bin that reaches the bin maximum.
+    hits = np.flatnonzero(magnitude == np.repeat(tallest, counts))
+    first = np.r_[True, column[hits[1:]] != column[hits[:-1]]]
+    return hits[first]
+
+
+class StickCollection:
+    def __init__(self, ax: Axes, mz: np.ndarray, heights: np.ndarray, color: str = "black",
+                 decimate: bool = True, values: Optional[np.ndarray] = None,
+                 cmap: Optional[Union[str, Colormap]] = None, norm: Optional[Normalize] = None):
+        self.ax = ax
+        self.decimate = decimate
+        self._sort(mz, heights, values)
+        # An explicit colour would override the colormap.
+        self.collection = LineCollection(np.zeros((0, 2, 2)), colors=color if values is None else None,
+                                         cmap=cmap, norm=norm)
+        # Interactive collections start empty; update_view() fills in only what is on screen.
+        if not decimate:
+            self._show(slice(None))
+        ax.add_collection(self.collection, autolim=False)
+        self.update_datalim()
+        ax.autoscale_view()
+        self._cid: Optional[int] = None
+        if decimate:
+            # A closure, not a bound method: CallbackRegistry only keeps weak references to methods.
+            self._cid = ax.callbacks.connect("xlim_changed", lambda _ax: self.update_view())
+            self.update_view()
+
+    def _sort(self, mz: np.ndarray, heights: np.ndarray, values: Optional[np.ndarray]) -> None:
+        mz = np.asarray(mz, dtype=np.float64)
+        order = np.argsort(mz, kind="stable")
+        self.mz = mz[order]
+        self.heights = np.nan_to_num(np.asarray(heights, dtype=np.float64))[order]
+        self.values = np.asarray(values, dtype=np.float64)[order] if values is not None else None
+
+    def _show(self, selection: Union[slice, np.ndarray]) -> None:
+        self.collection.set_segments(stick_segments(self.mz[selection], self.heights[selection]))
+        if self.values is not None:
+            self.collection.set_array(self.values[selection])
+
+    def set_data(self, mz: np.ndarray, heights: np.ndarray, values: Optional[np.ndarray] = None) -> None:
+        """Replace the sticks (and colour values, if coloured) in place (same artist, no new figure)."""
+        self._sort(mz, heights, values)
+        self.update_view()
+
+    def update_datalim(self) -> None:
+        # Three corner points are enough; feeding every segment to the Axes costs seconds at 1M peaks.
+        if len(self.mz):
+            self.ax.update_datalim([(self.mz[0], 0.0), (self.mz[-1], self.heights.min()),
+                                    (self.mz[-1], self.heights.max())])
+
+    def update_view(self) -> None:
+        if not self.decimate:
+            self._show(slice(None))
+            return
+        x0, x1 = sorted(self.ax.get_xlim())
+        lo = int(np.searchsorted(self.mz, x0, side="left"))
+        hi = int(np.searchsorted(self.mz, x1, side="right"))
+        pixels = max(int(self.ax.bbox.width), 1)
+        if hi - lo > STICKS_PER_PIXEL * pixels:
+            self._show(lo + max_per_bin(self.mz[lo:hi], self.heights[lo:hi], x0, x1, pixels))
+        else:
+            self._show(slice(lo, hi))
+
+    def remove(self) -> None:
+        if self._cid is not None:
+            self.ax.callbacks.disconnect(self._cid)
+            self._cid = None
+        self.collection.remove()
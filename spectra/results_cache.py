@@ -0,0 +1,122 @@
+"""
+Memoized subtraction results.
+
+A subtraction depends only on the m/z and Resolution columns of the two
+spectra and on ppm_tol. Normalization is a draw-time scale, so it plays no
+part. ResultCache therefore keys each result on a content hash of both
+spectra plus the tolerance. It stores only the matched row pairs of
+dual_pairs; LiveMatch (spectra.incremental) builds every table from them.
+The most recently used entries stay in memory. With ``spill_dir`` set,
+entries pushed out of memory are written there as .npz files and read back
+on a later miss.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .matching import PeakIndex, dual_pairs
+from .spectrum import peak_digest
+
+DEFAULT_MAX_ENTRIES = 256
+
+# (A rows, B rows, ppm) of the matched pairs.
+Masks = Tuple[np.ndarray, ...]
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    return peak_digest(df["m/z"].to_numpy(), df["Resolution"].to_numpy())
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, spill_dir: Optional[str] = None):
+        self.max_entries = max(1, max_entries)
+        self.spill_dir = spill_dir
+        self.hits = 0
+        self.misses = 0
+        self._masks: "OrderedDict[str, Masks]" = OrderedDict()
+        # GUI workers look results up from several threads.
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._masks)
+
+    @staticmethod
+    def key(kind: str, digest_a: str, digest_b: str, ppm_tol: float) -> str:
+        return hashlib.blake2b(f"{kind}:{digest_a}:{digest_b}:{float(ppm_tol)!r}".encode(),
+                               digest_size=16).hexdigest()
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.npz")
+
+    def get(self, key: str) -> Optional[Masks]:
+        with self._lock:
+            masks = self._masks.get(key)
+            if masks is not None:
+                self._masks.move_to_end(key)
+            elif self.spill_dir is not None:
+                masks = self._read_spill(key)
+                if masks is not None:
+                    self._store(key, masks)
+            if masks is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return masks
+
+    def put(self, key: str, masks: Masks) -> None:
+        with self._lock:
+            self._store(key, masks)
+
+    def _store(self, key: str, masks: Masks) -> None:
+        self._masks[key] = masks
+        self._masks.move_to_end(key)
+        while len(self._masks) > self.max_entries:
+            old_key, old_masks = self._masks.popitem(last=False)
+            self._write_spill(old_key, old_masks)
+
+    def _read_spill(self, key: str) -> Optional[Masks]:
+        try:
+            with np.load(self._spill_path(key), allow_pickle=False) as npz:
+                return tuple(npz[f"m{i}"] for i in range(len(npz.files)))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_spill(self, key: str, masks: Masks) -> None:
+        # Best effort, like the sheet cache: a failed write only costs a recomputation.
+        if self.spill_dir is None:
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            tmp = self._spill_path(key) + ".tmp.npz"
+            np.savez(tmp, **{f"m{i}": mask for i, mask in enumerate(masks)})
+            os.replace(tmp, self._spill_path(key))
+        except OSError:
+            pass
+
+    def clear(self, spilled: bool = True) -> None:
+        """Forget every entry held in memory and, with ``spilled``, those written to ``spill_dir``."""
+        with self._lock:
+            self._masks.clear()
+            if not spilled or self.spill_dir is None or not os.path.isdir(self.spill_dir):
+                return
+            for filename in os.listdir(self.spill_dir):
+                if filename.endswith(".npz"):
+                    try:
+                        os.remove(os.path.join(self.spill_dir, filename))
+                    except OSError:
+                        pass
+
+    def pairs(self, df_a: pd.DataFrame, df_b: pd.DataFrame, index_b: Optional[PeakIndex] = None,
+              ppm_tol: float = 3.0, digest_a: Optional[str] = None, digest_b: Optional[str] = None) -> Masks:
+        """Same result as dual_pairs(df_a, df_b, index_b, ppm_tol)."""
+        key = self.key("dual", digest_a or frame_digest(df_a), digest_b or frame_digest(df_b), ppm_tol)
+        pairs = self.get(key)
+        if pairs is None:
+            pairs = dual_pairs(df_a, df_b, index_b, ppm_tol)
+            self.put(key, pairs)
+        return pairs
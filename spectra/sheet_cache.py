@@ -0,0 +1,128 @@
+"""
+On-disk cache of parsed sheets, kept next to the workbook.
+
+The first load of "data.xlsx" writes ".data.xlsx.cache/" holding meta.json
+and one .npz per sheet (one array per column). Later loads with the same
+file size, modification time and skip_rows read the arrays back without
+touching Excel. Sheets are stored before the S/N cut, so changing the cut
+never invalidates them. The cache is best effort: any problem reading or
+writing it just means the workbook is parsed again.
+"""
+import json
+import os
+import shutil
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 2
+
+
+def cache_dir_for(path: str) -> str:
+    folder, base = os.path.split(os.path.abspath(path))
+    return os.path.join(folder, f".{base}.cache")
+
+
+class SheetCache:
+    def __init__(self, path: str, skip_rows: int):
+        self.dir = cache_dir_for(path)
+        st = os.stat(path)
+        self.key = {
+            "version": CACHE_VERSION,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "skip_rows": int(skip_rows),
+        }
+        self.sheet_names: Optional[List[str]] = None
+        self._files: Dict[str, str] = {}
+        self._read_meta()
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.dir, "meta.json")
+
+    def _read_meta(self) -> None:
+        try:
+            with open(self._meta_path(), encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            return
+        if meta.get("key") != self.key:
+            return
+        self.sheet_names = meta.get("sheet_names")
+        self._files = meta.get("files", {})
+
+    def _write_meta(self) -> None:
+        meta = {"key": self.key, "sheet_names": self.sheet_names, "files": self._files}
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, self._meta_path())
+
+    def _reset(self) -> None:
+        # Stale entries from another version of the workbook or another skip_rows.
+        if os.path.isdir(self.dir):
+            shutil.rmtree(self.dir, ignore_errors=True)
+        os.makedirs(self.dir, exist_ok=True)
+
+    def get(self, name: str) -> Optional[pd.DataFrame]:
+        filename = self._files.get(name)
+        if filename is None:
+            return None
+        try:
+            with np.load(os.path.join(self.dir, filename), allow_pickle=False) as npz:
+                columns = [str(c) for c in npz["__columns__"]]
+                arrays = {c: npz[f"c{i}"] for i, c in enumerate(columns)}
+        except (OSError, ValueError, KeyError):
+            return None
+        df = pd.DataFrame(arrays, columns=columns)
+        for c in columns:
+            if arrays[c].dtype.kind == "U":
+                df[c] = df[c].astype(object)
+        return df
+
+    def set_sheet_names(self, names: List[str]) -> None:
+        """Start (or keep) a cache for this version of the workbook."""
+        if self.sheet_names == list(names):
+            return
+        try:
+            self._reset()
+            self.sheet_names = list(names)
+            self._files = {}
+            self._write_meta()
+        except OSError:
+            pass
+
+    def put(self, name: str, df: pd.DataFrame) -> None:
+        self.put_all([name], {name: df}, set_names=False)
+
+    def put_all(self, names: List[str], frames: Dict[str, pd.DataFrame], set_names: bool = True) -> None:
+        if set_names:
+            self.set_sheet_names(names)
+        if self.sheet_names is None:
+            return
+        try:
+            for name in names:
+                if name in frames and name not in self._files:
+                    filename = f"sheet{self.sheet_names.index(name)}.npz"
+                    _save_frame(os.path.join(self.dir, filename), frames[name])
+                    self._files[name] = filename
+            self._write_meta()
+        except (OSError, ValueError):
+            pass
+
+    def is_complete(self) -> bool:
+        return self.sheet_names is not None and all(n in self._files for n in self.sheet_names)
+
+
+def _save_frame(filepath: str, df: pd.DataFrame) -> None:
+    arrays = {"__columns__": np.array([str(c) for c in df.columns])}
+    for i, c in enumerate(df.columns):
+        col = df[c]
+        if isinstance(col.dtype, np.dtype) and col.dtype.kind in "biuf":
+            arrays[f"c{i}"] = col.to_numpy()
+        else:
+            arrays[f"c{i}"] = col.astype(str).to_numpy(dtype=str)
+    tmp = filepath + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, filepath)
@@ -0,0 +1,90 @@
+"""
+Compact in-memory spectrum.
+
+A Spectrum holds its peaks in one structured numpy array instead of a
+DataFrame, keeping only the columns in REQUIRED_COLUMNS. m/z is always
+float64, since ppm-level matching needs it. The other columns are float32 or
+float64, chosen by ``precision``. frame() gives views on the peaks; plots
+normalize the S/N-filtered table with a scale factor
+(loading.normalization_scale), not a rescaled copy.
+"""
+import hashlib
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .matching import PeakIndex
+
+PRECISIONS = ("float32", "float64")
+
+# Structured field name for each loaded column.
+FIELDS = {"m/z": "mz", "Intensity": "intensity", "Relative": "relative", "Resolution": "resolution", "Noise": "noise"}
+
+
+def peak_digest(mz: np.ndarray, resolution: np.ndarray) -> str:
+    """Hash of everything matching looks at; equal digests give equal subtraction results."""
+    h = hashlib.blake2b(digest_size=16)
+    for values in (mz, resolution):
+        h.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def peak_dtype(precision: str = "float64") -> np.dtype:
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {PRECISIONS}, not {precision!r}")
+    return np.dtype([(field, "f8" if field == "mz" else precision) for field in FIELDS.values()])
+
+
+class Spectrum:
+    __slots__ = ("name", "peaks", "_digest")
+
+    def __init__(self, name: str, peaks: np.ndarray):
+        self.name = name
+        self.peaks = peaks
+        self._digest: Optional[str] = None
+
+    @classmethod
+    def from_frame(cls, name: str, df: pd.DataFrame, precision: str = "float64") -> "Spectrum":
+        peaks = np.empty(len(df), dtype=peak_dtype(precision))
+        for col, field in FIELDS.items():
+            peaks[field] = df[col].to_numpy()
+        return cls(name, peaks)
+
+    def __len__(self) -> int:
+        return len(self.peaks)
+
+    def __repr__(self) -> str:
+        return f"Spectrum({self.name!r}, {len(self)} peaks, {self.precision})"
+
+    @property
+    def precision(self) -> str:
+        return self.peaks.dtype["relative"].name
+
+    @property
+    def nbytes(self) -> int:
+        return self.peaks.nbytes
+
+    @property
+    def mz(self) -> np.ndarray:
+        return self.peaks["mz"]
+
+    @property
+    def relative(self) -> np.ndarray:
+        return self.peaks["relative"]
+
+    @property
+    def resolution(self) -> np.ndarray:
+        return self.peaks["resolution"]
+
+    def digest(self) -> str:
+        if self._digest is None:
+            self._digest = peak_digest(self.mz, self.resolution)
+        return self._digest
+
+    def frame(self) -> pd.DataFrame:
+        """DataFrame whose columns are views on ``peaks`` (no copy)."""
+        return pd.DataFrame({col: self.peaks[field] for col, field in FIELDS.items()}, copy=False)
+
+    def index(self) -> PeakIndex:
+        return PeakIndex(self.mz, self.resolution, self.relative)
@@ -0,0 +1,186 @@
+"""
+On-disk spectrum library backed by memory-mapped column files.
+
+A store is a folder holding one raw float64 file per column (all spectra
+back to back) and index.json, which maps each spectrum name to its
+(offset, length) in those files. Spectra are sorted by m/z when they are
+added, so a stored spectrum can be matched against directly. Reading a
+spectrum returns numpy.memmap slices, so nothing is copied into RAM until
+it is used.
+
+Deleting only drops the name from the index. The space is reclaimed by
+compact(), which also runs on its own once deleted rows outnumber live ones.
+Spectra read before then may still map the old files, and Windows will not
+replace or truncate a mapped file, so compact() writes a new generation of
+column files ("mz.2.f64", ...) and removes the old ones once they are free.
+"""
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .matching import PeakIndex
+from .readers import REQUIRED_COLUMNS
+
+STORE_VERSION = 1
+DTYPE = np.float64
+# Stored columns: the loaded peak columns plus the precomputed half width used for matching.
+COLUMNS = REQUIRED_COLUMNS + ("half_width",)
+
+
+def _column_file(column: str, generation: int = 0) -> str:
+    stem = {"m/z": "mz"}.get(column, column.lower())
+    return f"{stem}.{generation}.f64" if generation else f"{stem}.f64"
+
+
+_COLUMN_FILE = re.compile(r"^[a-z_]+(\.\d+)?\.f64$")
+
+
+class SpectrumStore:
+    def __init__(self, path: str, create: bool = True):
+        self.path = path
+        if not os.path.isdir(path):
+            if not create:
+                raise FileNotFoundError(f"No spectrum store at {path}")
+            os.makedirs(path)
+        self._spectra: Dict[str, Tuple[int, int]] = {}
+        self._rows = 0
+        self._dead = 0
+        self._generation = 0
+        self._maps: Optional[Dict[str, np.memmap]] = None
+        self._read_index()
+
+    def _index_path(self) -> str:
+        return os.path.join(self.path, "index.json")
+
+    def _read_index(self) -> None:
+        try:
+            with open(self._index_path(), encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except FileNotFoundError:
+            return
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported spectrum store version in {self.path}")
+        self._spectra = {name: (int(o), int(n)) for name, (o, n) in meta["spectra"].items()}
+        self._rows = int(meta["rows"])
+        self._dead = int(meta["dead"])
+        self._generation = int(meta.get("generation", 0))
+
+    def _write_index(self) -> None:
+        meta = {"version": STORE_VERSION, "columns": list(COLUMNS), "rows": self._rows,
+                "dead": self._dead, "generation": self._generation, "spectra": self._spectra}
+        tmp = self._index_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, self._index_path())
+
+    def _file(self, column: str, generation: Optional[int] = None) -> str:
+        return os.path.join(self.path, _column_file(column, self._generation if generation is None else generation))
+
+    def _columns(self) -> Dict[str, np.memmap]:
+        if self._maps is None:
+            self._maps = {}
+            for col in COLUMNS:
+                if self._rows:
+                    self._maps[col] = np.memmap(self._file(col), dtype=DTYPE, mode="r", shape=(self._rows,))
+                else:
+                    self._maps[col] = np.empty(0, dtype=DTYPE)
+        return self._maps
+
+    def _release(self) -> None:
+        # Drop our own mappings before the files change; slices handed out keep theirs alive.
+        self._maps = None
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._spectra
+
+    def __len__(self) -> int:
+        return len(self._spectra)
+
+    def names(self) -> List[str]:
+        return list(self._spectra)
+
+    def arrays(self, name: str) -> Dict[str, np.ndarray]:
+        """Zero-copy, read-only column slices for one spectrum."""
+        offset, length = self._spectra[name]
+        return {col: arr[offset:offset + length] for col, arr in self._columns().items()}
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """The spectrum as a DataFrame whose columns are views on the store."""
+        arrays = self.arrays(name)
+        return pd.DataFrame({col: arrays[col] for col in REQUIRED_COLUMNS}, copy=False)
+
+    def index(self, name: str) -> PeakIndex:
+        arrays = self.arrays(name)
+        return PeakIndex.from_sorted(arrays["m/z"], arrays["half_width"], arrays["Relative"])
+
+    def append(self, name: str, df: pd.DataFrame, replace: bool = False) -> None:
+        if name in self._spectra:
+            if not replace:
+                raise ValueError(f"Spectrum '{name}' is already in the store")
+            self.delete(name)
+        columns = {col: df[col].to_numpy(dtype=DTYPE) for col in REQUIRED_COLUMNS}
+        order = np.argsort(columns["m/z"], kind="stable")
+        columns = {col: arr[order] for col, arr in columns.items()}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            columns["half_width"] = columns["m/z"] / columns["Resolution"] / 2
+
+        self._release()
+        size = self._rows * DTYPE().itemsize
+        for col in COLUMNS:
+            with open(self._file(col), "a+b") as fh:
+                # Drop anything past the indexed rows, e.g. from an interrupted append. Only then, as
+                # a file that handed-out slices still map cannot be truncated on Windows.
+                if os.fstat(fh.fileno()).st_size > size:
+                    fh.truncate(size)
+                fh.write(np.ascontiguousarray(columns[col], dtype=DTYPE).tobytes())
+        self._spectra[name] = (self._rows, len(order))
+        self._rows += len(order)
+        self._write_index()
+
+    def import_data(self, data: Dict[str, pd.DataFrame], replace: bool = False) -> None:
+        """Add every spectrum from a load_data() result."""
+        for name, df in data.items():
+            self.append(name, df, replace=replace)
+
+    def delete(self, name: str) -> None:
+        _, length = self._spectra.pop(name)
+        self._dead += length
+        self._write_index()
+        if self._dead > self._rows - self._dead:
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrite the column files without the rows of deleted spectra."""
+        maps = self._columns()
+        generation = self._generation + 1
+        spectra: Dict[str, Tuple[int, int]] = {}
+        offset = 0
+        for name, (start, length) in self._spectra.items():
+            spectra[name] = (offset, length)
+            offset += length
+        for col in COLUMNS:
+            with open(self._file(col, generation), "wb") as fh:
+                for start, length in self._spectra.values():
+                    fh.write(np.asarray(maps[col][start:start + length]).tobytes())
+        self._release()
+        del maps
+        self._spectra = spectra
+        self._rows = offset
+        self._dead = 0
+        self._generation = generation
+        self._write_index()
+        self._remove_stale()
+
+    def _remove_stale(self) -> None:
+        """Delete column files of earlier generations; any still mapped are left for the next compact."""
+        current = {_column_file(col, self._generation) for col in COLUMNS}
+        for entry in os.listdir(self.path):
+            if _COLUMN_FILE.match(entry) and entry not in current:
+                try:
+                    os.remove(os.path.join(self.path, entry))
+                except OSError:
+                    pass
@@ -0,0 +1,149 @@
+"""
+Result table export.
+
+TableWriter writes result tables one at a time as they are computed, so a
+batch run holds only the current pair's tables in memory. "csv" and
+"parquet" write one file per table, named like the figures. "xlsx" writes
+every table into one workbook, one worksheet each, plus a "Contents" sheet
+mapping worksheet names (at most 31 characters) to the full titles. The
+workbook is written with xlsxwriter in constant-memory mode when it is
+installed (each row goes to disk as soon as it is written), otherwise with
+openpyxl's write-only mode, which streams too.
+"""
+import os
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .instrumentation import stage
+
+TABLE_FORMATS = ("csv", "parquet", "xlsx")
+# Data rows per worksheet (Excel's limit is 1,048,576 rows including the header).
+MAX_SHEET_ROWS = 1_048_575
+# Rows converted to cells at once when writing a worksheet.
+_CHUNK_ROWS = 10_000
+
+
+def xlsx_engine() -> str:
+    """The fastest installed Excel writer: xlsxwriter, else openpyxl."""
+    try:
+        import xlsxwriter  # noqa: F401
+    except ImportError:
+        return "openpyxl"
+    return "xlsxwriter"
+
+
+def _check_parquet() -> None:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        try:
+            import fastparquet  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow (pip install pyarrow)") from None
+
+
+def _rows(table: pd.DataFrame) -> Iterator[list]:
+    # Cell values row by row: NaN becomes an empty cell, +-inf the text "inf" / "-inf".
+    for start in range(0, len(table), _CHUNK_ROWS):
+        chunk = table.iloc[start:start + _CHUNK_ROWS]
+        columns = []
+        for name in chunk.columns:
+            values = chunk[name].to_numpy()
+            if values.dtype.kind == "f":
+                cells = values.astype(object)
+                cells[np.isnan(values)] = None
+                cells[np.isposinf(values)] = "inf"
+                cells[np.isneginf(values)] = "-inf"
+                values = cells
+            elif values.dtype.kind in "iub":
+                values = values.tolist()
+            columns.append(values)
+        yield from (list(row) for row in zip(*columns))
+
+
+class TableWriter:
+    def __init__(self, out_dir: str, fmt: str = "csv", workbook_name: str = "results"):
+        if fmt not in TABLE_FORMATS:
+            raise ValueError(f"Unknown table format '{fmt}', expected one of {', '.join(TABLE_FORMATS)}")
+        if fmt == "parquet":
+            _check_parquet()
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.path: Optional[str] = None
+        self._book = None
+        self._contents: List[Tuple[str, str, int]] = []
+        if fmt == "xlsx":
+            self.path = os.path.join(out_dir, f"{workbook_name}.xlsx")
+            self.engine = xlsx_engine()
+            if self.engine == "xlsxwriter":
+                import xlsxwriter
+                self._book = xlsxwriter.Workbook(self.path, {"constant_memory": True})
+            else:
+                from openpyxl import Workbook
+                self._book = Workbook(write_only=True)
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write(self, table: pd.DataFrame, title: str, suffix: str = "") -> str:
+        """Write one table; returns the file it went to (for xlsx, "<workbook> [<worksheet>]")."""
+        name = f"{title.replace(' ', '_')}{suffix}"
+        if self.fmt != "xlsx":
+            path = os.path.join(self.out_dir, f"{name}.{self.fmt}")
+            with stage("write_table", path=path, rows=len(table)):
+                if self.fmt == "csv":
+                    table.to_csv(path, index=False)
+                else:
+                    table.to_parquet(path, index=False)
+            return path
+        sheets = []
+        # An empty table still gets its worksheet with the header.
+        for start in range(0, max(len(table), 1), MAX_SHEET_ROWS):
+            sheet = self._sheet_name(name)
+            rows = min(len(table) - start, MAX_SHEET_ROWS)
+            with stage("write_table", path=f"{self.path}:{sheet}", rows=rows):
+                self._write_sheet(sheet, table.iloc[start:start + MAX_SHEET_ROWS])
+            self._contents.append((sheet, f"{title}{suffix.replace('_', ' ')}", rows))
+            sheets.append(sheet)
+        return f"{self.path} [{', '.join(sheets)}]"
+
+    def _sheet_name(self, name: str) -> str:
+        # Excel: at most 31 characters, none of []:*?/\, unique ignoring case.
+        base = "".join("_" if c in "[]:*?/\\" else c for c in name)[:31]
+        taken = {sheet.lower() for sheet, _, _ in self._contents} | {"contents"}
+        sheet, n = base, 1
+        while sheet.lower() in taken:
+            n += 1
+            sheet = f"{base[:31 - len(str(n)) - 1]}~{n}"
+        return sheet
+
+    def _write_sheet(self, sheet: str, table: pd.DataFrame) -> None:
+        header = [str(column) for column in table.columns]
+        if self.engine == "xlsxwriter":
+            worksheet = self._book.add_worksheet(sheet)
+            worksheet.write_row(0, 0, header)
+            for r, row in enumerate(_rows(table), 1):
+                worksheet.write_row(r, 0, row)
+        else:
+            worksheet = self._book.create_sheet(sheet)
+            worksheet.append(header)
+            for row in _rows(table):
+                worksheet.append(row)
+
+    def close(self) -> None:
+        if self._book is None:
+            return
+        contents = pd.DataFrame(self._contents, columns=["Sheet", "Table", "Rows"])
+        self._write_sheet("Contents", contents)
+        with stage("write_workbook", path=self.path):
+            if self.engine == "xlsxwriter":
+                self._book.close()
+            else:
+                self._book.save(self.path)
+        self._book = None
@@ -0,0 +1,128 @@
+"""
+Lazy, per-sheet access to a workbook or other peak-list file.
+
+Opening a LazyWorkbook only reads the sheet names. Each sheet is parsed,
+filtered and validated the first time it is asked for, and the most
+recently used sheets are kept in memory as compact Spectrum objects (with
+their PeakIndex). A sheet that
+fails to parse is recorded in ``errors`` and does not affect the others.
+With ``background`` (see spectra.background) every sheet has its known
+background peaks removed as it is loaded; the on-disk sheet cache keeps the
+unsubtracted data, so the database can change between loads. It likewise
+keeps every peak regardless of S/N; ``min_sn`` is applied in memory, and
+``min_sn=None`` keeps all of them for callers that cut interactively.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .background import BackgroundIndex, subtract_background
+from .readers import MIN_SN, PeakListReader, open_reader, sn_filter
+from .spectrum import Spectrum
+from .instrumentation import stage
+from .matching import PeakIndex
+from .sheet_cache import SheetCache
+
+DEFAULT_MAX_CACHED = 32
+
+
+class LazyWorkbook:
+    def __init__(self, path: str, skip_rows: int, max_cached: int = DEFAULT_MAX_CACHED, use_cache: bool = True,
+                 precision: str = "float64", background: Optional[BackgroundIndex] = None,
+                 background_ppm: float = 3.0, min_sn: Optional[float] = MIN_SN):
+        self.path = path
+        self.skip_rows = skip_rows
+        self.min_sn = min_sn
+        self.precision = precision
+        self.max_cached = max(1, max_cached)
+        self.errors: Dict[str, str] = {}
+        self.background = background
+        self.background_ppm = background_ppm
+        # Peaks removed as background from each sheet loaded so far.
+        self.background_removed: Dict[str, int] = {}
+        self._disk = SheetCache(path, skip_rows) if use_cache else None
+        self._reader: Optional[PeakListReader] = None
+        self._entries: "OrderedDict[str, Tuple[Spectrum, PeakIndex]]" = OrderedDict()
+        # File readers are not thread safe, and two workers may want the same sheet.
+        self._lock = threading.RLock()
+
+        if self._disk is not None and self._disk.sheet_names is not None:
+            self.sheet_names: List[str] = list(self._disk.sheet_names)
+        else:
+            self.sheet_names = list(self._open().sheet_names)
+            if self._disk is not None:
+                self._disk.set_sheet_names(self.sheet_names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sheet_names
+
+    def __len__(self) -> int:
+        return len(self.sheet_names)
+
+    def _open(self) -> PeakListReader:
+        if self._reader is None:
+            self._reader = open_reader(self.path)
+        return self._reader
+
+    def _entry(self, name: str) -> Tuple[Spectrum, PeakIndex]:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries.move_to_end(name)
+                return entry
+            if name not in self.sheet_names:
+                raise KeyError(f"Sheet '{name}' is not in {self.path}")
+
+            with stage("cache_read", sheet=name):
+                df = self._disk.get(name) if self._disk is not None else None
+            if df is None:
+                try:
+                    df = self._open().read(name, self.skip_rows, None if self._disk is not None else self.min_sn)
+                except Exception as e:
+                    self.errors[name] = str(e)
+                    raise
+                if self._disk is not None:
+                    self._disk.put(name, df)
+            self.errors.pop(name, None)
+            df = sn_filter(df, self.min_sn)
+            if self.background is not None:
+                df, removed = subtract_background(df, self.background, self.background_ppm)
+                self.background_removed[name] = len(removed)
+
+            with stage("index", sheet=name, peaks=len(df)):
+                spectrum = Spectrum.from_frame(name, df, self.precision)
+                entry = (spectrum, spectrum.index())
+            self._entries[name] = entry
+            while len(self._entries) > self.max_cached:
+                self._entries.popitem(last=False)
+            return entry
+
+    def spectrum(self, name: str) -> Spectrum:
+        return self._entry(name)[0]
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """The sheet as a DataFrame of views on its Spectrum; treat it as read-only."""
+        return self._entry(name)[0].frame()
+
+    def index(self, name: str) -> PeakIndex:
+        return self._entry(name)[1]
+
+    def digest(self, name: str) -> str:
+        """Content hash of the sheet's m/z and Resolution; see spectra.results_cache."""
+        return self._entry(name)[0].digest()
+
+    def frames(self, names: Optional[Sequence[str]] = None,
+               progress: Optional[Callable[[int, int, str], None]] = None) -> Dict[str, pd.DataFrame]:
+        """Parse ``names`` (default: all sheets), skipping sheets that fail; see ``errors``."""
+        names = list(self.sheet_names if names is None else names)
+        out: Dict[str, pd.DataFrame] = {}
+        for i, name in enumerate(names):
+            try:
+                out[name] = self.frame(name)
+            except Exception:
+                pass
+            if progress is not None:
+                progress(i + 1, len(names), name)
+        return out
@@ -14,8 +14,9 @@ HOW TO RUN:
        python spectra_app_NEWGUI.py
 
 INPUT DATA REQUIREMENTS:
-    - Input must be an Excel file (.xlsx).
-    - Sheets must contain these columns: 'm/z', 'Intensity', 'Relative', 'Resolution', 'Noise'.
+    - Input is an Excel file (.xlsx), a CSV/TSV peak list, or a centroided mzML file.
+    - Sheets (and CSV/TSV files) must contain these columns: 'm/z', 'Intensity', 'Relative', 'Resolution', 'Noise'.
+    - mzML spectra need m/z, intensity, noise and resolution arrays.
 """
 ############################
 # This code was developed by Jonathan Barwegen at The Kings University so if you have any questions please reach
@@ -23,17 +24,293 @@ INPUT DATA REQUIREMENTS:
 
 # imports the libraries needed for running the application
 import pandas as pd
-import matplotlib.pyplot as plt
+import collections
+import copy
+import multiprocessing
 import os
 import sys
-from PyQt5 import uic, QtWidgets as qw,QtCore as qc
-from typing import Dict, List, Tuple
+from PyQt5 import uic, QtWidgets as qw,QtCore as qc, QtGui as qg
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg, NavigationToolbar2QT
+from matplotlib.figure import Figure
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from spectra import LazyWorkbook, PeakIndex, compare_dfs, load_data, multi_subtract
+from spectra import instrumentation
+from spectra.alignment import align
+from spectra.export import FORMATS, export_figures, plan_jobs
+from spectra.background import DEFAULT_PATH as DEFAULT_BACKGROUND, BackgroundDB
+from spectra.incremental import MAX_PPM, LiveMatch
+from spectra.loading import MIN_SN, normalization_scale, normalize, sn_filter
+from spectra.matching import FOLD_COLUMN
+from spectra.recalibration import Recalibration, fit_drift
+from spectra.results_cache import ResultCache
+from spectra.sheet_cache import cache_dir_for
+from spectra.tables import TABLE_FORMATS, TableWriter
+from spectra.plotting import (FIGSIZE, draw_dual_spectrum, draw_spectrum, figure_filename, save_dual_spectrum,
+                              save_spectrum, update_dual_spectrum, update_spectrum)
 
 #IMPORTANT
 # You will need python installed on your computer if you want to run this file
 # You will also need the "Spectra.ui" file in the same folder as 
 
+####################
+# BACKGROUND WORK
+# Loading, matching and saving figures run on QThreadPool threads so the window
+# stays responsive. A task is a plain function whose first argument is a
+# report(done, total, label) callback; the callback raises Cancelled once the
+# user presses Cancel. Results come back to the main thread through signals.
+class Cancelled(Exception):
+  pass
+
+
+class WorkerSignals(qc.QObject):
+  progress = qc.pyqtSignal(int, int, str)
+  finished = qc.pyqtSignal(object)
+  error = qc.pyqtSignal(str)
+  cancelled = qc.pyqtSignal()
+  done = qc.pyqtSignal(object)
+
+
+class Worker(qc.QRunnable):
+  def __init__(self, fn: Callable, *args):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.signals = WorkerSignals()
+        self.is_cancelled = False
+
+  def cancel(self) -> None:
+        self.is_cancelled = True
+
+  def report(self, done: int, total: int, label: str) -> None:
+        if self.is_cancelled:
+            raise Cancelled()
+        self.signals.progress.emit(done, total, label)
+
+  def run(self) -> None:
+        try:
+            result = self.fn(self.report, *self.args)
+        except Cancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+        finally:
+            self.signals.done.emit(self)
+
+
+def _load_task(report, skip_rows: int, path: str, background_path: Optional[str] = None):
+  report(0, 1, f"Opening {os.path.basename(path)}")
+  background = None
+  if background_path and os.path.exists(background_path):
+      with BackgroundDB(background_path, create=False) as db:
+          background = db.index()
+  # Every peak is kept; the S/N cut is one of the live thresholds.
+  return path, LazyWorkbook(path, skip_rows, background=background, min_sn=None)
+
+
+def _background_add_task(report, workbook: LazyWorkbook, names: List[str], background_path: str, min_sn: float):
+  # Re-read without background subtraction, so a sheet added again keeps all its peaks.
+  raw = LazyWorkbook(workbook.path, workbook.skip_rows, min_sn=min_sn)
+  added = {}
+  with BackgroundDB(background_path) as db:
+      for i, name in enumerate(names):
+          report(i, len(names), f"Adding {name} to the background database")
+          added[name] = db.add(raw.frame(name), f"{os.path.basename(workbook.path)}:{name}")
+  return added
+
+
+def _sheet_task(report, workbook: LazyWorkbook, name: str, normalized: bool, n_peaks: int):
+  report(0, 1, f"Reading {name}")
+  return workbook.frame(name), name, normalized, n_peaks
+
+
+def _live_match_task(report, workbook: LazyWorkbook, results: ResultCache, main_name: str, sub_name: str,
+                     normalized: bool, n_peaks: int, recalibrate: bool = False):
+  # Matches once at the widest tolerance; the ppm and S/N controls then only re-cut the stored pairs.
+  title = f"{main_name} subtracted {sub_name}"
+  report(0, 2, f"Reading {main_name} / {sub_name}")
+  df_main, df_sub, index_sub = workbook.frame(main_name), workbook.frame(sub_name), workbook.index(sub_name)
+  report(1, 2, f"Matching {title}")
+  recalibration = None
+  if recalibrate:
+      # Anchors come from the peaks above the default S/N cut; B keeps its row order, so the pairs
+      # found against the corrected copy index the original B too.
+      recalibration = fit_drift(sn_filter(df_main, MIN_SN), sn_filter(df_sub, MIN_SN))
+      pairs = results.pairs(df_main, recalibration.apply(df_sub), None, MAX_PPM,
+                            digest_a=workbook.digest(main_name))
+  else:
+      pairs = results.pairs(df_main, df_sub, index_sub, MAX_PPM, digest_a=workbook.digest(main_name),
+                            digest_b=workbook.digest(sub_name))
+  live = LiveMatch(df_main, df_sub, pairs=pairs)
+  report(2, 2, f"Matching {title}")
+  return live, title, normalized, n_peaks, recalibration
+
+
+def _multi_subtraction_task(report, workbook: LazyWorkbook, main_name: str, sub_names: List[str], normalized: bool,
+                            n_peaks: int, ppm_tol: float, min_sn: float):
+  title = f"{main_name} subtracted {' + '.join(sub_names)}"
+  report(0, 2, f"Reading {main_name} and {len(sub_names)} references")
+  df_main = sn_filter(workbook.frame(main_name), min_sn)
+  references = {name: sn_filter(workbook.frame(name), min_sn) for name in sub_names}
+  report(1, 2, f"Matching {title}")
+  unique_df, removed, counts = multi_subtract(df_main, references, ppm_tol)
+  scale = normalization_scale(unique_df) if normalized else 1.0
+  report(2, 2, f"Matching {title}")
+  return unique_df, removed, counts, scale, title, n_peaks
+
+
+def _save_task(report, save_fn: Callable, *args):
+  report(0, 1, "Saving figure")
+  return save_fn(*args)
+
+
+def _save_table(df: pd.DataFrame, filepath: str) -> str:
+  df.to_csv(filepath, index=False)
+  return filepath
+
+
+def _export_task(report, workbook: LazyWorkbook, jobs: list, out_dir: str, fmt: str, normalized: bool, n_peaks: int,
+                 ppm_tol: float, min_sn: float):
+  names = list(dict.fromkeys(name for _, job_names in jobs for name in job_names))
+  report(0, len(jobs), f"Reading {len(names)} sheets")
+  data = {name: sn_filter(df, min_sn) for name, df in workbook.frames(names).items()}
+  jobs = [job for job in jobs if all(name in data for name in job[1])]
+  # Spawned, not forked: this runs on a pool thread of a multithreaded Qt process.
+  return export_figures(data, jobs, out_dir, fmt, ppm_tol, n_peaks=n_peaks, normalized=normalized,
+                        progress=lambda done, total, title: report(done, total, f"Exported {title}"),
+                        mp_context=multiprocessing.get_context("spawn"))
+
+
+def _align_task(report, workbook: LazyWorkbook, names: List[str], ppm_tol: float, min_sn: float,
+                blanks: List[str], min_ratio: float, min_samples: int, filepath: str):
+  frames = {}
+  for i, name in enumerate(names):
+      report(i, len(names) + 1, f"Reading {name}")
+      frames[name] = sn_filter(workbook.frame(name), min_sn)
+  report(len(names), len(names) + 1, f"Aligning {len(names)} sheets")
+  matrix = align(frames, ppm_tol)
+  keep = matrix.present(min_count=min_samples)
+  if blanks:
+      keep &= matrix.above_blank(blanks, min_ratio)
+  _save_table(matrix.select(keep).to_frame(), filepath)
+  return filepath, f"{len(names)} sheets, {len(matrix)} aligned peaks, {int(keep.sum())} kept"
+
+
+def _result_tables_task(report, matches: List[Tuple[str, LiveMatch, bool]], ppm_tol: float, min_sn: float,
+                        families: bool, min_fold: Optional[float], out_dir: str, fmt: str, workbook_name: str):
+  # One pair at a time: only the tables of the pair being written are in memory.
+  with TableWriter(out_dir, fmt, workbook_name) as tables:
+      for i, (title, live, normalized) in enumerate(matches):
+          report(i, len(matches), f"Writing {title}")
+          unique_df, b_only = live.a_only(ppm_tol, min_sn, families, min_fold), live.b_only(ppm_tol, min_sn)
+          if normalized:
+              unique_df, b_only = normalize(unique_df), normalize(b_only)
+          tables.write(unique_df, title)
+          tables.write(b_only, title, "_only_B")
+          tables.write(live.matched(ppm_tol, min_sn), title, "_matched")
+  return tables.path or out_dir, f"{len(matches)} pair(s), {3 * len(matches)} tables"
+
+
+class TimingSink(qc.QObject):
+  # Instrumentation sink: events may come from any worker thread, the signal hands them to the GUI thread.
+  recorded = qc.pyqtSignal(object)
+
+  def __call__(self, event: dict) -> None:
+        self.recorded.emit(event)
+
+
+# (ppm tolerance, minimum S/N, remove families, minimum fold change or None) of the live controls,
+# and what a live tab recomputes its tables from for them.
+LiveSettings = Tuple[float, float, bool, Optional[float]]
+LiveFrames = Callable[[float, float, bool, Optional[float]], List[pd.DataFrame]]
+
+
+class PlotTab(qw.QWidget):
+  """
+  One embedded figure. Showing another spectrum of the same kind reuses the
+  Axes and the stick artists, so switching sheets is a data swap plus a redraw.
+  A tab with ``live`` set can recompute its tables for new ppm / S/N / fold-change
+  thresholds (and the families setting); ``thresholds`` are the ones it was last drawn with.
+  ``match`` is the LiveMatch behind a subtraction or dual plot, for saving its tables.
+  Tables with a fold change are their own kind, as their sticks are coloured.
+  """
+  def __init__(self, parent=None):
+    super().__init__(parent)
+    self.figure = Figure(figsize=FIGSIZE)
+    self.canvas = FigureCanvasQTAgg(self.figure)
+    self.toolbar = NavigationToolbar2QT(self.canvas, self)
+    self.ax = self.figure.add_subplot()
+    self.kind: Optional[str] = None
+    self.sticks: tuple = ()
+    self.title = ""
+    self.n_peaks = 10
+    self.live: Optional[Tuple[LiveFrames, bool]] = None
+    self.thresholds: Optional[LiveSettings] = None
+    self.match: Optional[LiveMatch] = None
+    layout = qw.QVBoxLayout(self)
+    layout.setContentsMargins(0, 0, 0, 0)
+    layout.addWidget(self.toolbar)
+    layout.addWidget(self.canvas)
+    # Decimation depends on the axes width in pixels.
+    self.canvas.mpl_connect("resize_event", lambda _event: self._update_views())
+
+  def _update_views(self) -> None:
+    for sticks in self.sticks:
+        sticks.update_view()
+
+  def _reset(self, kind: str) -> None:
+    for sticks in self.sticks:
+        sticks.remove()
+    self.sticks = ()
+    self.ax.clear()
+    self.kind = kind
+
+  def show_spectrum(self, df: pd.DataFrame, title: str, n_peaks: int, y_scale: float,
+                    keep_view: bool = False) -> None:
+    kind = "fold" if FOLD_COLUMN in df.columns else "single"
+    keep_view = keep_view and self.kind == kind
+    self.title, self.n_peaks = title, n_peaks
+    if self.kind == kind:
+        update_spectrum(self.ax, self.sticks[0], df, title, n_peaks, y_scale, keep_view)
+    else:
+        self._reset(kind)
+        self.sticks = (draw_spectrum(self.ax, df, title, n_peaks, y_scale, decimate=True),)
+    self._redraw(keep_view)
+
+  def show_dual_spectrum(self, df_up: pd.DataFrame, df_down: pd.DataFrame, title: str, n_peaks: int,
+                         up_scale: float, down_scale: float, keep_view: bool = False) -> None:
+    keep_view = keep_view and self.kind == "dual"
+    self.title, self.n_peaks = title, n_peaks
+    if self.kind == "dual":
+        update_dual_spectrum(self.ax, self.sticks, df_up, df_down, title, n_peaks, up_scale, down_scale, keep_view)
+    else:
+        self._reset("dual")
+        self.sticks = draw_dual_spectrum(self.ax, df_up, df_down, title, n_peaks, up_scale, down_scale,
+                                         decimate=True)
+    self._redraw(keep_view)
+
+  def refresh(self, frames: List[pd.DataFrame], scales: List[float]) -> None:
+    """Same plot, new tables (one, or two for a dual plot): keeps the zoom and skips the layout pass."""
+    if len(frames) == 1:
+        self.show_spectrum(frames[0], self.title, self.n_peaks, scales[0], keep_view=True)
+    else:
+        self.show_dual_spectrum(frames[0], frames[1], self.title, self.n_peaks, *scales, keep_view=True)
+
+  def _redraw(self, keep_view: bool = False) -> None:
+    if keep_view:
+        self.canvas.draw_idle()
+        return
+    # Forget the old zoom history so Home returns to this spectrum.
+    self.toolbar.update()
+    with instrumentation.stage("tight_layout"):
+        self.figure.tight_layout()
+    self.canvas.draw_idle()
+
 class SpectraSubtractionApp(qw.QMainWindow):
+  # Tab key shared by every single-sheet plot that comes from browsing the sheet list.
+  PREVIEW = "\0preview"
+
   @staticmethod
   def resource_path(relative_path):
     try:
@@ -48,7 +325,53 @@ class SpectraSubtractionApp(qw.QMainWindow):
     self.save_path: str = ""
     self.excel_path: str = ""
     self.sheet_names: List[str] = []
-    self.data_by_sheet: Dict[str, pd.DataFrame] = {}
+    self.workbook: Optional[LazyWorkbook] = None
+    # Subtraction results by sheet content, so repeats and normalization toggles skip the matching.
+    self.results = ResultCache()
+    self.pool = qc.QThreadPool.globalInstance()
+    self._workers: List[Worker] = []
+    self._load_worker: Union[Worker, None] = None
+    # Bumped by every load; a cancelled load that still finishes carries an older number and is ignored.
+    self._load_generation = 0
+    self._pending: List[Callable[[], None]] = []
+    self.progressBar = qw.QProgressBar(self)
+    self.progressBar.setMaximumWidth(160)
+    self.progressBar.hide()
+    self.cancelButton = qw.QPushButton("Cancel", self)
+    self.cancelButton.hide()
+    self.statusbar.addPermanentWidget(self.progressBar)
+    self.statusbar.addPermanentWidget(self.cancelButton)
+    self.timingsLabel = qw.QLabel(self)
+    self.statusbar.addPermanentWidget(self.timingsLabel)
+    self.timings: collections.deque = collections.deque(maxlen=500)
+    self.timingSink = TimingSink(self)
+    self.timingSink.recorded.connect(self._on_timing)
+    self.recordTimingsAction = self.menuSpectra_Subtraction.addAction("Record Stage Timings")
+    self.recordTimingsAction.setCheckable(True)
+    self.recordTimingsAction.toggled.connect(self._set_timings_enabled)
+    self.recordTimingsAction.setChecked(True)
+    self.diagnosticsAction = self.menuSpectra_Subtraction.addAction("Diagnostics...")
+    self.diagnosticsAction.triggered.connect(self.show_diagnostics)
+    self.exportAllAction = self.menuSpectra_Subtraction.addAction("Export All...")
+    self.exportAllAction.setShortcut(qg.QKeySequence("Ctrl+E"))
+    self.exportAllAction.triggered.connect(self.export_all)
+    self.peakMatrixAction = self.menuSpectra_Subtraction.addAction("Peak Matrix...")
+    self.peakMatrixAction.triggered.connect(self.export_peak_matrix)
+    self.resultTablesAction = self.menuSpectra_Subtraction.addAction("Save Result Tables...")
+    self.resultTablesAction.triggered.connect(self.save_result_tables)
+    self.familiesAction = self.menuSpectra_Subtraction.addAction("Remove Isotope/Adduct Families")
+    self.familiesAction.setCheckable(True)
+    self.recalibrateAction = self.menuSpectra_Subtraction.addAction("Recalibrate Mass Drift")
+    self.recalibrateAction.setCheckable(True)
+    self.background_path = DEFAULT_BACKGROUND
+    backgroundMenu = self.menuSpectra_Subtraction.addMenu("Background")
+    self.subtractBackgroundAction = backgroundMenu.addAction("Subtract Background on Load")
+    self.subtractBackgroundAction.setCheckable(True)
+    self.subtractBackgroundAction.toggled.connect(self._on_subtract_background_toggled)
+    backgroundMenu.addAction("Add Selected Sheets to Background").triggered.connect(self.add_background_sheets)
+    backgroundMenu.addAction("Background Database...").triggered.connect(self.show_background_database)
+    self._preview_name = ""
+    self._embed_plots()
 # Wire up required UI
     self.rowSkipSpinBox.setValue(6)
     self.peaksAnnotate.setValue(10)
@@ -56,13 +379,63 @@ class SpectraSubtractionApp(qw.QMainWindow):
     self.loadfileButton.clicked.connect(self.load_excel_file)
     self.plotGraphs.clicked.connect(self._on_plot_graphs_clicked)
     self.plotSubtractionButton.clicked.connect(self._on_plot_subtraction_clicked)
+    self.plotMultiSubtractionButton.clicked.connect(self._on_plot_multi_subtraction_clicked)
     self.graphsWidget.itemActivated.connect(self._on_plot_selected_item)
+    self.graphsWidget.currentItemChanged.connect(self._on_current_sheet_changed)
     self.plotDualButton.clicked.connect(self._on_dual_clicked)
+    self.cancelButton.clicked.connect(self.cancel_all)
+    self.ppmSpinBox.setMaximum(MAX_PPM)
+    self.ppmSpinBox.valueChanged.connect(self._on_thresholds_changed)
+    self.snSpinBox.valueChanged.connect(self._on_thresholds_changed)
+    self.foldSpinBox.valueChanged.connect(self._on_thresholds_changed)
+    self.plotTabs.currentChanged.connect(self._on_thresholds_changed)
+    self.familiesAction.toggled.connect(self._on_thresholds_changed)
     
     
     
 
 
+  def _embed_plots(self) -> None:
+        # Spectra.ui places its controls absolutely, so they keep their size on the left of a splitter
+        # and the plots take whatever room is left.
+        controls = self.takeCentralWidget()
+        controls.setMinimumSize(670, 575)
+        self.plotTabs = qw.QTabWidget(self)
+        self.plotTabs.setTabsClosable(True)
+        self.plotTabs.setDocumentMode(True)
+        self.plotTabs.tabCloseRequested.connect(self._close_plot_tab)
+        self._plot_tabs: Dict[str, PlotTab] = {}
+        splitter = qw.QSplitter(qc.Qt.Horizontal, self)
+        splitter.addWidget(controls)
+        splitter.addWidget(self.plotTabs)
+        splitter.setStretchFactor(1, 1)
+        splitter.setCollapsible(0, False)
+        self.setCentralWidget(splitter)
+        self.resize(1500, 640)
+
+  def _plot_tab(self, key: str, label: str) -> PlotTab:
+        tab = self._plot_tabs.get(key)
+        if tab is None:
+            tab = self._plot_tabs[key] = PlotTab(self.plotTabs)
+            self.plotTabs.addTab(tab, label)
+        # Whoever asks for the tab is about to draw something new in it.
+        tab.live = None
+        tab.match = None
+        index = self.plotTabs.indexOf(tab)
+        self.plotTabs.setTabText(index, label)
+        self.plotTabs.setTabToolTip(index, label)
+        self.plotTabs.setCurrentIndex(index)
+        return tab
+
+  def _close_plot_tab(self, index: int) -> None:
+        tab = self.plotTabs.widget(index)
+        self.plotTabs.removeTab(index)
+        for key, value in list(self._plot_tabs.items()):
+            if value is tab:
+                del self._plot_tabs[key]
+        tab.deleteLater()
+
+
 ####################
 # ACTIONS
   def choose_save_location(self) -> None:
@@ -76,24 +449,312 @@ class SpectraSubtractionApp(qw.QMainWindow):
             self.save_path = path
             self.saveLocationLineEdit.setText(self.save_path)
 
+  def _set_timings_enabled(self, enabled: bool) -> None:
+        if enabled:
+            instrumentation.enable(self.timingSink)
+        else:
+            instrumentation.disable(self.timingSink)
+            self.timingsLabel.clear()
+
+  def _on_timing(self, event: dict) -> None:
+        self.timings.append(event)
+        recent = list(self.timings)[-4:]
+        self.timingsLabel.setText("  ".join(f"{e['stage']} {e['seconds'] * 1e3:.0f} ms" for e in recent))
+
+  def show_diagnostics(self) -> None:
+        lines = []
+        for e in self.timings:
+            extra = ", ".join(f"{k}={v}" for k, v in e.items() if k not in ("stage", "seconds", "thread"))
+            lines.append(f"{e['stage']:<14}{e['seconds'] * 1e3:>10.1f} ms   {extra}")
+        dialog = qw.QDialog(self)
+        dialog.setWindowTitle("Diagnostics - stage timings")
+        text = qw.QPlainTextEdit("\n".join(lines) or "No timings recorded yet.", dialog)
+        text.setReadOnly(True)
+        text.setFont(qg.QFontDatabase.systemFont(qg.QFontDatabase.FixedFont))
+        layout = qw.QVBoxLayout(dialog)
+        layout.addWidget(text)
+        dialog.resize(700, 400)
+        dialog.exec_()
+
+  def export_all(self) -> None:
+        if self.workbook is None:
+            qw.QMessageBox.information(self, "No data", "Load a file first.")
+            return
+        items = self.graphsWidget.selectedItems()
+        sheets = [self._sheet_name(item) for item in items] or [n for n in self.sheet_names if n in self.workbook]
+        dialog = qw.QDialog(self)
+        dialog.setWindowTitle("Export all")
+        form = qw.QFormLayout(dialog)
+        form.addRow(qw.QLabel(f"{len(sheets)} sheet(s): " + ("the selected ones" if items else "all of them")))
+        formatBox = qw.QComboBox(dialog)
+        formatBox.addItems(FORMATS)
+        form.addRow("Format", formatBox)
+        sheetsCheck = qw.QCheckBox("Each sheet", dialog)
+        sheetsCheck.setChecked(True)
+        form.addRow(sheetsCheck)
+        referenceBox = qw.QComboBox(dialog)
+        referenceBox.addItems([n for n in self.sheet_names if n in self.workbook])
+        referenceBox.setCurrentText(self.subtractBox.currentText())
+        subtractCheck = qw.QCheckBox("Each sheet with the reference subtracted", dialog)
+        dualCheck = qw.QCheckBox("Dual plot of each sheet against the reference", dialog)
+        form.addRow(subtractCheck)
+        form.addRow(dualCheck)
+        form.addRow("Reference", referenceBox)
+        folderEdit = qw.QLineEdit(self.save_path, dialog)
+        form.addRow("Folder", folderEdit)
+        buttons = qw.QDialogButtonBox(qw.QDialogButtonBox.Ok | qw.QDialogButtonBox.Cancel, dialog)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        form.addRow(buttons)
+        if dialog.exec_() != qw.QDialog.Accepted:
+            return
+
+        reference = referenceBox.currentText()
+        pairs = [(name, reference) for name in sheets if reference and name != reference]
+        jobs = plan_jobs(sheets if sheetsCheck.isChecked() else [], pairs if subtractCheck.isChecked() else [],
+                         pairs if dualCheck.isChecked() else [])
+        if not jobs:
+            qw.QMessageBox.information(self, "Nothing to export", "Tick at least one kind of figure.")
+            return
+        out_dir = folderEdit.text() or self.save_path or os.getcwd()
+        self._start(self._on_export_finished, _export_task, self.workbook, jobs, out_dir, formatBox.currentText(),
+                    self.toggleNormalization.isChecked(), self._get_peaks_to_annotate(), *self._thresholds())
+
+  def _on_export_finished(self, report) -> None:
+        if report.failed:
+            qw.QMessageBox.warning(self, "Export finished with errors", report.summary())
+        else:
+            qw.QMessageBox.information(self, "Export finished", report.summary())
+
+  def export_peak_matrix(self) -> None:
+        if self.workbook is None:
+            qw.QMessageBox.information(self, "No data", "Load a file first.")
+            return
+        items = self.graphsWidget.selectedItems()
+        sheets = [self._sheet_name(item) for item in items] or [n for n in self.sheet_names if n in self.workbook]
+        dialog = qw.QDialog(self)
+        dialog.setWindowTitle("Peak matrix")
+        form = qw.QFormLayout(dialog)
+        form.addRow(qw.QLabel(f"Align the peaks of {len(sheets)} sheet(s): "
+                              + ("the selected ones" if items else "all of them")))
+        blankList = qw.QListWidget(dialog)
+        for name in sheets:
+            item = qw.QListWidgetItem(name, blankList)
+            item.setFlags(item.flags() | qc.Qt.ItemIsUserCheckable)
+            item.setCheckState(qc.Qt.Checked if name == self.subtractBox.currentText() else qc.Qt.Unchecked)
+        form.addRow("Blanks", blankList)
+        ratioBox = qw.QDoubleSpinBox(dialog)
+        ratioBox.setRange(1.0, 1000.0)
+        ratioBox.setValue(3.0)
+        form.addRow("Min sample / blank", ratioBox)
+        samplesBox = qw.QSpinBox(dialog)
+        samplesBox.setRange(1, len(sheets))
+        form.addRow("Present in at least", samplesBox)
+        fileEdit = qw.QLineEdit(os.path.join(self.save_path or os.getcwd(), "peak_matrix.csv"), dialog)
+        form.addRow("File", fileEdit)
+        buttons = qw.QDialogButtonBox(qw.QDialogButtonBox.Ok | qw.QDialogButtonBox.Cancel, dialog)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        form.addRow(buttons)
+        if dialog.exec_() != qw.QDialog.Accepted:
+            return
+        blanks = [blankList.item(i).text() for i in range(blankList.count())
+                  if blankList.item(i).checkState() == qc.Qt.Checked]
+        # Matched at the current ppm tolerance and S/N cut.
+        self._start(lambda result: self._on_table_saved(*result), _align_task, self.workbook, sheets,
+                    *self._thresholds(), blanks, ratioBox.value(), samplesBox.value(), fileEdit.text())
+
+  def save_result_tables(self) -> None:
+        # The subtraction and dual plots of a pair have the same three tables, so each pair is written once,
+        # from whichever of its tabs comes first.
+        by_pair: Dict[str, PlotTab] = {}
+        for i in range(self.plotTabs.count()):
+            tab = self.plotTabs.widget(i)
+            if tab.match is not None:
+                by_pair.setdefault(tab.title, tab)
+        matches = list(by_pair.values())
+        if not matches:
+            qw.QMessageBox.information(self, "No results", "Plot a subtraction or dual plot first.")
+            return
+        dialog = qw.QDialog(self)
+        dialog.setWindowTitle("Save result tables")
+        form = qw.QFormLayout(dialog)
+        form.addRow(qw.QLabel(f"Unique, B-only and matched peaks of the {len(matches)} plotted pair(s), "
+                              "at the current thresholds"))
+        formatBox = qw.QComboBox(dialog)
+        formatBox.addItems(TABLE_FORMATS)
+        formatBox.setToolTip("csv / parquet: one file per table; xlsx: one workbook, a sheet per table")
+        form.addRow("Format", formatBox)
+        folderEdit = qw.QLineEdit(self.save_path, dialog)
+        form.addRow("Folder", folderEdit)
+        buttons = qw.QDialogButtonBox(qw.QDialogButtonBox.Ok | qw.QDialogButtonBox.Cancel, dialog)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        form.addRow(buttons)
+        if dialog.exec_() != qw.QDialog.Accepted:
+            return
+        out_dir = folderEdit.text() or self.save_path or os.getcwd()
+        stem = os.path.splitext(os.path.basename(self.excel_path or "results"))[0]
+        # Shallow copies: the threshold controls keep re-cutting the tabs' own LiveMatch on this thread.
+        jobs = [(tab.title, copy.copy(tab.match), tab.live[1]) for tab in matches]
+        self._start(lambda result: self._on_table_saved(*result), _result_tables_task, jobs,
+                    *self._live_settings(), out_dir, formatBox.currentText(), f"{stem}_subtractions")
+
+  def _on_subtract_background_toggled(self, checked: bool) -> None:
+        # The background is removed as sheets are read, so the open file has to be read again.
+        if self.excel_path:
+            self._load(self.excel_path)
+
+  def add_background_sheets(self) -> None:
+        if self.workbook is None:
+            qw.QMessageBox.information(self, "No data", "Load a file first.")
+            return
+        names = [self._sheet_name(item) for item in self.graphsWidget.selectedItems()]
+        if not names:
+            qw.QMessageBox.information(self, "Select a sheet", "Select the blank sheet(s) in the list first.")
+            return
+        self._start(self._on_background_added, _background_add_task, self.workbook, names, self.background_path,
+                    self.snSpinBox.value())
+
+  def _on_background_added(self, added: Dict[str, int]) -> None:
+        lines = "\n".join(f"{name}: {count} peaks" for name, count in added.items())
+        qw.QMessageBox.information(self, "Background", f"Added to {self.background_path}:\n{lines}")
+
+  def show_background_database(self) -> None:
+        with BackgroundDB(self.background_path) as db:
+            sources = db.sources()
+        dialog = qw.QDialog(self)
+        dialog.setWindowTitle("Background database")
+        layout = qw.QVBoxLayout(dialog)
+        layout.addWidget(qw.QLabel(self.background_path, dialog))
+        listWidget = qw.QListWidget(dialog)
+        listWidget.setSelectionMode(qw.QAbstractItemView.ExtendedSelection)
+        for source, count in sources:
+            item = qw.QListWidgetItem(f"{source}  ({count} peaks)", listWidget)
+            item.setData(qc.Qt.UserRole, source)
+        layout.addWidget(listWidget)
+        buttons = qw.QDialogButtonBox(qw.QDialogButtonBox.Close, dialog)
+        removeButton = buttons.addButton("Remove Selected", qw.QDialogButtonBox.ActionRole)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+
+        def remove_selected() -> None:
+            with BackgroundDB(self.background_path) as db:
+                for item in listWidget.selectedItems():
+                    db.remove(item.data(qc.Qt.UserRole))
+                    listWidget.takeItem(listWidget.row(item))
+
+        removeButton.clicked.connect(remove_selected)
+        dialog.resize(500, 300)
+        dialog.exec_()
+
+  def cancel_all(self) -> None:
+        self._pending.clear()
+        for worker in self._workers:
+            worker.cancel()
+
 
   
 ####################
 #HELPER FUNCTIONS  
 #       
+  def _start(self, on_finished: Callable[[object], None], fn: Callable, *args,
+             on_error: Union[Callable[[str], None], None] = None) -> Worker:
+        worker = Worker(fn, *args)
+        worker.signals.progress.connect(self._on_worker_progress)
+        worker.signals.finished.connect(on_finished)
+        worker.signals.error.connect(on_error or self._on_worker_error)
+        worker.signals.cancelled.connect(self._on_worker_cancelled)
+        worker.signals.done.connect(self._on_worker_done)
+        self._workers.append(worker)
+        self.progressBar.show(); self.cancelButton.show()
+        self.pool.start(worker)
+        return worker
+
+  def _when_loaded(self, action: Callable[[], None]) -> None:
+        # Requests made while a workbook is still loading run once it is in.
+        if self._load_worker is not None:
+            self._pending.append(action)
+            self.statusbar.showMessage(f"{len(self._pending)} plot(s) queued until loading finishes")
+        else:
+            action()
+
+  def _on_worker_progress(self, done: int, total: int, label: str) -> None:
+        self.progressBar.setRange(0, max(total, 1))
+        self.progressBar.setValue(done)
+        self.statusbar.showMessage(label)
+
+  def _on_worker_error(self, message: str) -> None:
+        qw.QMessageBox.warning(self, "Error", message)
+
+  def _on_worker_cancelled(self) -> None:
+        self.statusbar.showMessage("Cancelled", 3000)
+
+  def _on_worker_done(self, worker: Worker) -> None:
+        if worker in self._workers:
+            self._workers.remove(worker)
+        if worker is self._load_worker:
+            self._load_worker = None
+            pending, self._pending = self._pending, []
+            for action in pending:
+                action()
+        if not self._workers:
+            self.progressBar.hide(); self.cancelButton.hide()
+        self._show_sheet_errors()
+
+  def _show_sheet_errors(self) -> None:
+        # Sheets that failed to parse are flagged in every list instead of failing the load.
+        errors = self.workbook.errors if self.workbook is not None else {}
+        boxes = (self.mainSpectraBox, self.subtractBox, self.spectraABox, self.spectraBBox)
+        for row, name in enumerate(self.sheet_names):
+            message = errors.get(name)
+            item = self.graphsWidget.item(row)
+            if item is not None:
+                item.setText(f"{name}  (error)" if message else name)
+                item.setData(qc.Qt.UserRole, name)
+                item.setToolTip(message or "")
+                item.setForeground(qg.QBrush(qg.QColor("red")) if message else self.graphsWidget.palette().text())
+            for box in boxes:
+                if row < box.count():
+                    box.setItemData(row, message, qc.Qt.ToolTipRole)
+                    box.setItemData(row, qg.QColor("red") if message else None, qc.Qt.ForegroundRole)
+
   def load_excel_file(self) -> None:
     file_path, _ = qw.QFileDialog.getOpenFileName(
-        self, "Select Excel File", "", "Excel Files (*.xlsx *.xls)"
+        self, "Select Peak List File", "",
+        "Peak lists (*.xlsx *.xls *.csv *.tsv *.txt *.mzML);;Excel Files (*.xlsx *.xls);;"
+        "CSV/TSV Files (*.csv *.tsv *.txt);;mzML Files (*.mzML)"
     )
     if not file_path:
         return
-    try:
-        skip_rows = self.rowSkipSpinBox.value()
-        names, data = self.load_data(skip_rows, file_path)
-
+    self._load(file_path)
+
+  def _load(self, file_path: str) -> None:
+    if self._load_worker is not None:
+        self._load_worker.cancel()
+    skip_rows = self.rowSkipSpinBox.value()
+    background_path = self.background_path if self.subtractBackgroundAction.isChecked() else None
+    self._load_generation += 1
+    generation = self._load_generation
+    self._load_worker = self._start(lambda result: self._on_load_finished(result, generation), _load_task,
+                                    skip_rows, file_path, background_path,
+                                    on_error=lambda message: self._on_load_error(message, generation))
+
+  def _on_load_finished(self, result, generation: int) -> None:
+        if generation != self._load_generation:
+            # Superseded by a newer load while it was running.
+            return
+        file_path, workbook = result
+        names = workbook.sheet_names
+        previous = self.workbook
+        if previous is None or previous.path != file_path:
+            self.results.clear(spilled=False)
+            self.results.spill_dir = os.path.join(cache_dir_for(file_path), "results")
+        elif previous.skip_rows != workbook.skip_rows:
+            self.results.clear()
         self.excel_path = file_path
         self.sheet_names = names
-        self.data_by_sheet = data
+        self.workbook = workbook
 
         self.mainSpectraBox.clear(); self.mainSpectraBox.addItems(names)
         self.subtractBox.clear(); self.subtractBox.addItems(names)
@@ -101,85 +762,147 @@ class SpectraSubtractionApp(qw.QMainWindow):
         self.spectraABox.clear(); self.spectraABox.addItems(names)
         self.spectraBBox.clear(); self.spectraBBox.addItems(names)
 
-        qw.QMessageBox.information(self, "Loaded", f"Loaded {len(names)} sheets from\n{file_path}")
-    except Exception as e:  # 
-        qw.QMessageBox.warning(self, "Error", f"Failed to load Excel file:\n{e}")
+        note = "\n\nKnown background peaks are removed from every sheet." if workbook.background is not None else ""
+        qw.QMessageBox.information(self, "Loaded", f"Loaded {len(names)} sheets from\n{file_path}{note}")
+
+  def _on_load_error(self, message: str, generation: int) -> None:
+        if generation != self._load_generation:
+            return
+        qw.QMessageBox.warning(self, "Error", f"Failed to load file:\n{message}")
+
+  def _sheet_name(self, item: qw.QListWidgetItem) -> str:
+        return item.data(qc.Qt.UserRole) or item.text()
+
   def _on_plot_selected_item(self, item: qw.QListWidgetItem) -> None:
-        self._plot_single_sheet(item.text())
+        name = self._sheet_name(item)
+        self._when_loaded(lambda: self._plot_single_sheet(name))
+  def _on_current_sheet_changed(self, item: Optional[qw.QListWidgetItem], _previous) -> None:
+        # Browsing the list only previews; saving still needs Plot or a double-click.
+        if item is None or self.workbook is None or self._sheet_name(item) not in self.workbook:
+            return
+        self._preview_name = self._sheet_name(item)
+        self._plot_single_sheet(self._preview_name, self.PREVIEW, save=False)
   def _on_plot_graphs_clicked(self) -> None:
         items = self.graphsWidget.selectedItems() or [self.graphsWidget.currentItem()]
         if not items or not items[0]:
             qw.QMessageBox.information(self, "Select a sheet", "Choose a sheet in the list to plot.")
             return
         for item in items:
-          self._plot_single_sheet(item.text())
+          name = self._sheet_name(item)
+          # Several sheets at once get a tab each; a single one goes to the preview tab.
+          key = name if len(items) > 1 else self.PREVIEW
+          self._when_loaded(lambda name=name, key=key: self._plot_single_sheet(name, key))
   def _on_plot_subtraction_clicked(self) -> None:
         main_name = self.mainSpectraBox.currentText()
         sub_name = self.subtractBox.currentText()
         if not main_name or not sub_name:
             qw.QMessageBox.warning(self, "Select sheets", "Select both A and B sheets.")
             return
-        if main_name not in self.data_by_sheet or sub_name not in self.data_by_sheet:
+        self._when_loaded(lambda: self._start_subtraction(main_name, sub_name))
+
+  def _is_loaded(self, *names: str) -> bool:
+        return self.workbook is not None and all(name in self.workbook for name in names)
+
+  def _start_subtraction(self, main_name: str, sub_name: str) -> None:
+        if not self._is_loaded(main_name, sub_name):
             qw.QMessageBox.warning(self, "Data missing", "Selected sheets not loaded.")
             return
+        self._start(self._on_subtraction_ready, _live_match_task, self.workbook, self.results, main_name, sub_name,
+                    self.toggleNormalization.isChecked(), self._get_peaks_to_annotate(),
+                    self.recalibrateAction.isChecked())
+
+  def _on_subtraction_ready(self, result) -> None:
+        live, title, normalized, n, recalibration = result
+        self._show_live(title, title,
+                        lambda ppm_tol, min_sn, families, min_fold: [live.a_only(ppm_tol, min_sn, families, min_fold)],
+                        normalized, n)
+        self._plot_tabs[title].match = live
+        self._report_recalibration(title, recalibration)
+
+  def _report_recalibration(self, title: str, recalibration: Optional[Recalibration]) -> None:
+        if recalibration is None:
+            return
+        summary = recalibration.summary()
+        self.plotTabs.setTabToolTip(self.plotTabs.currentIndex(), f"{title}\n{summary}")
+        self.statusbar.showMessage(f"{title}: {summary}", 15000)
+
+  def _on_plot_multi_subtraction_clicked(self) -> None:
+        main_name = self.mainSpectraBox.currentText()
+        if not main_name:
+            qw.QMessageBox.warning(self, "Select sheets", "Select the A sheet first.")
+            return
+        dialog = qw.QDialog(self)
+        dialog.setWindowTitle(f"Subtract from {main_name}")
+        layout = qw.QVBoxLayout(dialog)
+        layout.addWidget(qw.QLabel("Tick every B sheet to subtract:", dialog))
+        listWidget = qw.QListWidget(dialog)
+        for name in self.sheet_names:
+            if name == main_name:
+                continue
+            item = qw.QListWidgetItem(name, listWidget)
+            item.setFlags(item.flags() | qc.Qt.ItemIsUserCheckable)
+            item.setCheckState(qc.Qt.Checked if name == self.subtractBox.currentText() else qc.Qt.Unchecked)
+        layout.addWidget(listWidget)
+        buttons = qw.QDialogButtonBox(qw.QDialogButtonBox.Ok | qw.QDialogButtonBox.Cancel, dialog)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        if dialog.exec_() != qw.QDialog.Accepted:
+            return
+        sub_names = [listWidget.item(i).text() for i in range(listWidget.count())
+                     if listWidget.item(i).checkState() == qc.Qt.Checked]
+        if not sub_names:
+            qw.QMessageBox.warning(self, "Select sheets", "Tick at least one B sheet.")
+            return
+        self._when_loaded(lambda: self._start_multi_subtraction(main_name, sub_names))
+
+  def _start_multi_subtraction(self, main_name: str, sub_names: List[str]) -> None:
+        if not self._is_loaded(main_name, *sub_names):
+            qw.QMessageBox.warning(self, "Data missing", "Selected sheets not loaded.")
+            return
+        self._start(self._on_multi_subtraction_ready, _multi_subtraction_task, self.workbook, main_name, sub_names,
+                    self.toggleNormalization.isChecked(), self._get_peaks_to_annotate(), *self._thresholds())
+
+  def _on_multi_subtraction_ready(self, result) -> None:
+        unique_df, removed, counts, scale, title, n = result
+        self.plot_spectrum(unique_df, title, n_peaks=n, y_scale=scale)
+        by_reference = ", ".join(f"{name} {count}" for name, count in counts.items())
+        summary = f"{len(removed)} peaks removed ({by_reference})"
+        self.plotTabs.setTabToolTip(self.plotTabs.currentIndex(), f"{title}\n{summary}")
+        self.statusbar.showMessage(f"{title}: {summary}", 15000)
+        if self._should_save_graphs():
+            filepath = os.path.join(self.save_path or "", figure_filename(title, "_removed", "csv"))
+            self._start(lambda path: self._on_table_saved(path, summary), _save_task, _save_table, removed, filepath)
 
-        n = self._get_peaks_to_annotate()
-        df_main = self._maybe_normalize(self.data_by_sheet[main_name])
-        df_sub = self._maybe_normalize(self.data_by_sheet[sub_name])
-        title = f"{main_name} subtracted {sub_name}"
-        #self.plot_dual_spectrum(df_main, df_sub, title=title, n_peaks=n)
-
-        unique_df = self.compare_dfs(self.data_by_sheet[main_name], self.data_by_sheet[sub_name])
-        unique_df=self._maybe_normalize(unique_df)
-        self.plot_spectrum(unique_df,title,n_peaks=n)
-            
- 
-        
   def _on_dual_clicked(self) -> None:
       main_name = self.spectraABox.currentText()
       sub_name = self.spectraBBox.currentText()
       if not main_name or not sub_name:
             qw.QMessageBox.warning(self, "Select sheets", "Select both main and subtract sheets.")
             return
-      if main_name not in self.data_by_sheet or sub_name not in self.data_by_sheet:
+      self._when_loaded(lambda: self._start_dual(main_name, sub_name))
+
+  def _start_dual(self, main_name: str, sub_name: str) -> None:
+      if not self._is_loaded(main_name, sub_name):
             qw.QMessageBox.warning(self, "Data missing", "Selected sheets not loaded.")
             return
-
-      n = self._get_peaks_to_annotate()
-      df_main = self._maybe_normalize(self.data_by_sheet[main_name])
-      df_sub = self._maybe_normalize(self.data_by_sheet[sub_name])
-      title = f"{main_name} subtracted {sub_name}"
-      df_main = self.compare_dfs(df_main,df_sub)
-      df_main =self._maybe_normalize(df_main)
-      df_sub = self.compare_dfs(df_sub,df_main)
-      df_sub = self._maybe_normalize(df_sub)
-      self.plot_dual_spectrum(df_main, df_sub, title=title, n_peaks=n)
+      self._start(self._on_dual_ready, _live_match_task, self.workbook, self.results, main_name, sub_name,
+                  self.toggleNormalization.isChecked(), self._get_peaks_to_annotate(),
+                  self.recalibrateAction.isChecked())
+
+  def _on_dual_ready(self, result) -> None:
+      live, title, normalized, n, recalibration = result
+      # Its own tab, next to the subtraction plot of the same pair.
+      key = f"{title} (dual)"
+      self._show_live(key, title,
+                      lambda ppm_tol, min_sn, families, min_fold: [live.a_only(ppm_tol, min_sn, families, min_fold),
+                                                                   live.b_only(ppm_tol, min_sn)], normalized, n)
+      self._plot_tabs[key].match = live
+      self._report_recalibration(title, recalibration)
 
   @staticmethod
   def load_data(skip_rows: int, path: str) -> Tuple[List[str], Dict[str, pd.DataFrame]]:
-        xls = pd.ExcelFile(path)
-        names = xls.sheet_names
-        raw = pd.read_excel(xls, sheet_name=names, skiprows=skip_rows)
-        filtered: Dict[str, pd.DataFrame] = {}
-        for name, df in raw.items():
-            required = {"m/z", "Intensity", "Relative", "Resolution", "Noise"}
-            missing = required - set(df.columns)
-            if missing:
-                raise ValueError(f"Sheet '{name}' is missing columns: {sorted(missing)}")
-            keep = df.loc[df["Intensity"] > 10 * df["Noise"]].copy()
-            for col in ("m/z", "Intensity", "Relative", "Resolution", "Noise"):
-                keep[col] = pd.to_numeric(keep[col], errors="coerce")
-            keep = keep.dropna(subset=["m/z", "Relative", "Resolution"]).reset_index(drop=True)
-            filtered[name] = keep
-        return names, filtered
-
-  def _maybe_normalize(self, df: pd.DataFrame) -> pd.DataFrame:
-        normalized = df.copy()
-        if self.toggleNormalization.isChecked():
-            max_rel = normalized["Relative"].max()
-            if pd.notna(max_rel) and max_rel > 0:
-                normalized["Relative"] = normalized["Relative"] / max_rel * 100.0
-        return normalized
+        return load_data(skip_rows, path)
 
   def _get_peaks_to_annotate(self) -> int:
         return int(self.peaksAnnotate.value())
@@ -187,100 +910,87 @@ class SpectraSubtractionApp(qw.QMainWindow):
   def _should_save_graphs(self) -> bool:
         return bool(self.saveGraphBox.isChecked())
 
-  def _plot_single_sheet(self, name: str) -> None:
-        if name not in self.data_by_sheet:
+  def _thresholds(self) -> Tuple[float, float]:
+        return self.ppmSpinBox.value(), self.snSpinBox.value()
+
+  def _live_settings(self) -> LiveSettings:
+        # The fold spin box shows "Off" at its minimum.
+        min_fold = self.foldSpinBox.value() if self.foldSpinBox.value() > self.foldSpinBox.minimum() else None
+        return self.ppmSpinBox.value(), self.snSpinBox.value(), self.familiesAction.isChecked(), min_fold
+
+  def _plot_single_sheet(self, name: str, key: Optional[str] = None, save: bool = True) -> None:
+        if not self._is_loaded(name):
             qw.QMessageBox.warning(self, "Not found", f"Sheet '{name}' not loaded.")
             return
-        df = self._maybe_normalize(self.data_by_sheet[name])
-        self.plot_spectrum(df=df, title=name, n_peaks=self._get_peaks_to_annotate())
-
-  def plot_spectrum(self, df: pd.DataFrame, title: str, n_peaks: int = 10) -> None:
-        top = df.nlargest(n_peaks, "Relative") if not df.empty else df
-        fig, ax = plt.subplots(figsize=(10, 5))
-        ax.vlines(df["m/z"], 0, df["Relative"],colors="black")
-        ax.set_title(title)
-        ax.set_xlabel("m/z")
-        ax.set_ylabel("Relative")
-        ax.set_xlim(right=max(350, float(df["m/z"].max()) if not df.empty else 350))
-        ax.set_ylim(bottom=0, top=115)
-
-        for _, r in top.iterrows():
-            ax.annotate(f"{r['m/z']:.4f}", xy=(r["m/z"], r["Relative"]), xytext=(0, 5),
-                        textcoords="offset points", ha="center", va="bottom", rotation=45, fontsize=8)
-        plt.tight_layout()
-
-        if self._should_save_graphs():
-            filename = f"{title.replace(' ', '_')}.svg"
-            filepath = os.path.join(self.save_path or "", filename)
-            fig.savefig(filepath)
-            plt.close(fig)
-            qw.QMessageBox.information(self, "Saved", f"Figure saved to:\n{os.path.abspath(filepath)}")
-        else:
-          
-            plt.show()
-            
-
-  def plot_dual_spectrum(self, df_up: pd.DataFrame, df_down: pd.DataFrame, title: str, n_peaks: int = 10) -> None:
-        top_up = df_up.nlargest(n_peaks, "Relative") if not df_up.empty else df_up
-        top_down = df_down.nlargest(n_peaks, "Relative") if not df_down.empty else df_down
-
-        fig, ax = plt.subplots(figsize=(10, 5))
-        ax.vlines(df_up["m/z"], 0, df_up["Relative"],colors="#13f034")
-        ax.vlines(df_down["m/z"], 0, -df_down["Relative"], colors="#f51c0c")
-        ax.set_title(title)
-        ax.set_xlabel("m/z")
-        ax.set_ylabel("Relative")
-        xmax = max(350, float(df_up["m/z"].max()) if not df_up.empty else 0,
-                   float(df_down["m/z"].max()) if not df_down.empty else 0)
-        ax.set_xlim(right=xmax)
-        ax.set_ylim(-130, 130)
-        ax.axhline(0, linewidth=1)
-
-        for _, r in top_up.iterrows():
-            ax.annotate(f"{r['m/z']:.4f}", xy=(r["m/z"], r["Relative"]), xytext=(0, 5),
-                        textcoords="offset points", ha="center", va="bottom", rotation=45, fontsize=8)
-        for _, r in top_down.iterrows():
-            ax.annotate(f"{r['m/z']:.4f}", xy=(r["m/z"], -r["Relative"]), xytext=(0, -5),
-                        textcoords="offset points", ha="center", va="top", rotation=45, fontsize=8)
-
-        plt.tight_layout()
-        if self._should_save_graphs():
-            filename = f"{title.replace(' ', '_')}_dual.svg"
-            filepath = os.path.join(self.save_path or "", filename)
-            fig.savefig(filepath)
-            plt.close(fig)
-            qw.QMessageBox.information(self, "Saved", f"Figure saved to:\n{os.path.abspath(filepath)}")
+        if key == self.PREVIEW:
+            self._preview_name = name
+        self._start(lambda result: self._on_sheet_ready(result, key, save), _sheet_task, self.workbook, name,
+                    self.toggleNormalization.isChecked(), self._get_peaks_to_annotate())
+
+  def _on_sheet_ready(self, result, key: Optional[str] = None, save: bool = True) -> None:
+        df, name, normalized, n = result
+        if key == self.PREVIEW and name != self._preview_name:
+            # The user has already moved on to another sheet.
+            return
+        self._show_live(key or name, name, lambda _ppm_tol, min_sn, _families, _min_fold: [sn_filter(df, min_sn)],
+                        normalized, n, save)
+
+  def _live_frames(self, frames_for: LiveFrames, normalized: bool) -> Tuple[List[pd.DataFrame], List[float]]:
+        frames = frames_for(*self._live_settings())
+        return frames, [normalization_scale(df) if normalized else 1.0 for df in frames]
+
+  def _show_live(self, key: str, title: str, frames_for: LiveFrames, normalized: bool, n_peaks: int,
+                 save: bool = True) -> None:
+        # frames_for(ppm_tol, min_sn, families, min_fold) gives the table to plot, or the A-only and B-only tables
+        # of a dual plot.
+        frames, scales = self._live_frames(frames_for, normalized)
+        if len(frames) == 1:
+            self.plot_spectrum(frames[0], title, n_peaks, scales[0], key=key, save=save)
         else:
-            plt.show()
-            
+            self.plot_dual_spectrum(frames[0], frames[1], title, n_peaks, *scales, key=key, save=save)
+        tab = self._plot_tabs[key]
+        tab.live = (frames_for, normalized)
+        tab.thresholds = self._live_settings()
+
+  def _on_thresholds_changed(self, _value=None) -> None:
+        # Only the visible tab is redrawn; the others catch up when they are shown.
+        tab = self.plotTabs.currentWidget()
+        if tab is None or tab.live is None or tab.thresholds == self._live_settings():
+            return
+        with instrumentation.stage("live_update", plot=tab.title):
+            frames, scales = self._live_frames(*tab.live)
+            tab.refresh(frames, scales)
+        tab.thresholds = self._live_settings()
+        ppm_tol, min_sn, _families, min_fold = tab.thresholds
+        counts = " / ".join(str(len(df)) for df in frames)
+        fold = f", fold change >= {min_fold:g}" if min_fold is not None else ""
+        self.statusbar.showMessage(f"{tab.title}: {counts} peaks at {ppm_tol:g} ppm, S/N > {min_sn:g}{fold}", 5000)
+
+  def plot_spectrum(self, df: pd.DataFrame, title: str, n_peaks: int = 10, y_scale: float = 1.0,
+                    key: Optional[str] = None, save: bool = True) -> None:
+        if save and self._should_save_graphs():
+            self._start(self._on_figure_saved, _save_task, save_spectrum, df, title, self.save_path or "", n_peaks,
+                        y_scale)
+        self._plot_tab(key or title, title).show_spectrum(df, title, n_peaks, y_scale)
+
+  def plot_dual_spectrum(self, df_up: pd.DataFrame, df_down: pd.DataFrame, title: str, n_peaks: int = 10,
+                         up_scale: float = 1.0, down_scale: float = 1.0, key: Optional[str] = None,
+                         save: bool = True) -> None:
+        if save and self._should_save_graphs():
+            self._start(self._on_figure_saved, _save_task, save_dual_spectrum, df_up, df_down, title,
+                        self.save_path or "", n_peaks, up_scale, down_scale)
+        label = f"{title} (dual)"
+        self._plot_tab(key or label, label).show_dual_spectrum(df_up, df_down, title, n_peaks, up_scale, down_scale)
+
+  def _on_figure_saved(self, filepath: str) -> None:
+        qw.QMessageBox.information(self, "Saved", f"Figure saved to:\n{os.path.abspath(filepath)}")
+
+  def _on_table_saved(self, filepath: str, summary: str = "") -> None:
+        qw.QMessageBox.information(self, "Saved", f"Table saved to:\n{os.path.abspath(filepath)}\n\n{summary}".strip())
 
   @staticmethod
-  def compare_dfs(df1: pd.DataFrame, df2: pd.DataFrame, ppm_tol: float = 3.0) -> pd.DataFrame:
-        if df1.empty:
-            return df1.copy()
-        if df2.empty:
-            return df1.dropna(subset=["m/z"]).reset_index(drop=True)
-
-        dfB = df2.copy()
-        dfB["half_width_B"] = dfB["m/z"] / dfB["Resolution"] / 2
-
-        def peak_match(row: pd.Series) -> bool:
-            m1 = float(row["m/z"])
-            R1 = float(row["Resolution"]) if pd.notna(row["Resolution"]) else float("inf")
-            hw1 = m1 / R1 / 2 if R1 and R1 > 0 else 0.0
-            max_hwB = float(dfB["half_width_B"].max()) if not dfB.empty else 0.0
-            lo, hi = m1 - (hw1 + max_hwB), m1 + (hw1 + max_hwB)
-            cand = dfB[(dfB["m/z"] >= lo) & (dfB["m/z"] <= hi)]
-            if cand.empty:
-                return False
-            sep = (cand["m/z"] - m1).abs()
-            overlap = sep <= (hw1 + cand["half_width_B"])
-            delta_ppm = sep / ((cand["m/z"] + m1) / 2.0) * 1e6
-            return bool((overlap & (delta_ppm <= ppm_tol)).any())
-
-        dfA = df1.dropna(subset=["m/z"]).copy()
-        mask = dfA.apply(peak_match, axis=1)
-        return dfA.loc[~mask].reset_index(drop=True)
+  def compare_dfs(df1: pd.DataFrame, df2: Union[pd.DataFrame, PeakIndex], ppm_tol: float = 3.0) -> pd.DataFrame:
+        return compare_dfs(df1, df2, ppm_tol=ppm_tol)
 def main() -> int:
   if hasattr(qc.Qt, 'AA_EnableHighDpiScaling'):
       qw.QApplication.setAttribute(qc.Qt.AA_EnableHighDpiScaling, True)
@@ -295,4 +1005,6 @@ def main() -> int:
 
 
 if __name__ == "__main__":
+    # Export workers are spawned; a frozen build has to hand them over here.
+    multiprocessing.freeze_support()
     sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""Shared fixtures: small random Orbitrap-like peak lists."""
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def rng(request) -> np.random.Generator:
+    """Seeded with 0, or with the value given by ``parametrize("rng", seeds, indirect=True)``."""
+    return np.random.default_rng(getattr(request, "param", 0))
+
+
+@pytest.fixture
+def make_spectrum(rng: np.random.Generator) -> Callable[..., pd.DataFrame]:
+    """
+    make_spectrum(n) gives ``n`` random peaks; with ``near``, one peak within ``jitter_ppm`` of
+    each of those m/z values instead.
+    """
+    def make(n: int = 0, near: Optional[np.ndarray] = None, jitter_ppm: float = 2.0) -> pd.DataFrame:
+        if near is None:
+            mz = rng.uniform(100.0, 1200.0, n)
+        else:
+            mz = near * (1 + rng.normal(0.0, jitter_ppm * 1e-6, len(near)))
+        intensity = rng.uniform(1e3, 1e6, len(mz))
+        return pd.DataFrame({
+            "m/z": mz,
+            "Intensity": intensity,
+            "Relative": intensity / intensity.max() * 100.0 if len(mz) else intensity,
+            "Resolution": rng.uniform(6e4, 2.4e5, len(mz)),
+            "Noise": rng.uniform(10.0, 200.0, len(mz)),
+        })
+    return make
+
+
+@pytest.fixture
+def write_workbook(tmp_path) -> Callable[..., str]:
+    """write_workbook(sheets) saves the frames as an instrument-style .xlsx (6 header lines, then the table)."""
+    def write(sheets: Dict[str, pd.DataFrame], name: str = "book.xlsx", header_rows: int = 6) -> str:
+        path = str(tmp_path / name)
+        header = pd.DataFrame([[f"Header line {i + 1}"] for i in range(header_rows)])
+        with pd.ExcelWriter(path) as writer:
+            for sheet, df in sheets.items():
+                header.to_excel(writer, sheet_name=sheet, index=False, header=False)
+                df.to_excel(writer, sheet_name=sheet, index=False, startrow=header_rows)
+        return path
+    return write
@@ -0,0 +1,84 @@
+"""Peak alignment into a PeakMatrix and its filters."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectra.alignment import PeakMatrix, align
+
+
+def peaks(mz, values, resolution: float = 1e5) -> pd.DataFrame:
+    mz = np.asarray(mz, dtype=np.float64)
+    return pd.DataFrame({"m/z": mz, "Intensity": np.asarray(values, dtype=np.float64), "Relative": 50.0,
+                         "Resolution": resolution, "Noise": 1.0})
+
+
+@pytest.fixture
+def matrix() -> PeakMatrix:
+    # 200.0 in every sheet, 300.0 mostly in the blank, 400.0 only in C1 and C2, 500.0 only in T1.
+    return align({
+        "Blank": peaks([200.0, 300.0], [10.0, 100.0]),
+        "C1": peaks([200.0 * (1 + 1e-6), 300.0, 400.0], [50.0, 20.0, 10.0]),
+        "C2": peaks([200.0 * (1 - 1e-6), 400.0 * (1 + 5e-7)], [60.0, 11.0]),
+        "T1": peaks([200.0, 500.0], [70.0, 5.0]),
+    })
+
+
+def test_features(matrix):
+    assert matrix.shape == (4, 4) and matrix.nnz == 9
+    np.testing.assert_allclose(matrix.mz, [200.0, 300.0, 400.0, 500.0], rtol=2e-6)
+    np.testing.assert_array_equal(matrix.count(), [4, 2, 2, 1])
+    dense = matrix.to_dense(np.nan)
+    np.testing.assert_array_equal(dense[1], [100.0, 20.0, np.nan, np.nan])
+    # Consensus m/z is intensity weighted.
+    assert matrix.mz[0] == pytest.approx((10 * 200 + 50 * 200.0002 + 60 * 199.9998 + 70 * 200) / 190, rel=1e-9)
+
+
+def test_filters(matrix):
+    np.testing.assert_array_equal(matrix.present(min_count=2), [True, True, True, False])
+    np.testing.assert_array_equal(matrix.present(["C1", "C2"], 2), [True, False, True, False])
+    np.testing.assert_array_equal(matrix.above_blank(["Blank"], 3.0), [True, False, True, True])
+    controls = {"ctrl": ["C1", "C2"]}
+    np.testing.assert_array_equal(matrix.consistent(controls), [True, False, True, False])
+    np.testing.assert_array_equal(matrix.consistent(controls, max_cv=0.05), [False, False, True, False])
+    np.testing.assert_array_equal(matrix.consistent(controls, min_fraction=0.5), [True, True, True, False])
+    with pytest.raises(KeyError):
+        matrix.count(["missing"])
+
+
+def test_select_and_frames(matrix):
+    kept = matrix.select(matrix.above_blank(["Blank"]))
+    np.testing.assert_array_equal(kept.to_dense(), matrix.to_dense()[[0, 2, 3]])
+    frame = kept.to_frame()
+    assert frame.columns.tolist() == ["m/z", "Span (ppm)", "Samples", "Blank", "C1", "C2", "T1"]
+    pd.testing.assert_frame_equal(kept.to_frame(sparse=True).astype(float), frame.astype(float))
+
+
+def test_a_sample_contributes_its_largest_peak():
+    matrix = align({"A": peaks([300.0, 300.0 * (1 + 5e-7)], [5.0, 8.0]), "B": peaks([300.0], [1.0])})
+    np.testing.assert_array_equal(matrix.to_dense(), [[8.0, 1.0]])
+
+
+def test_chains_wider_than_twice_the_tolerance_are_split():
+    # Steps of 2 ppm chain at 3 ppm, but the chain spans 10 ppm.
+    mz = 500.0 * (1 + np.arange(6) * 2e-6)
+    matrix = align({f"S{i}": peaks([m], [1.0], resolution=1e4) for i, m in enumerate(mz)}, ppm_tol=3.0)
+    assert len(matrix) > 1
+    assert (matrix.span_ppm <= 6.0 + 1e-9).all()
+    assert matrix.nnz == 6
+
+
+def test_shared_peaks_line_up(make_spectrum):
+    base = make_spectrum(500)
+    frames = {f"S{i}": make_spectrum(near=base["m/z"].to_numpy()[:400 + 50 * i], jitter_ppm=0.3) for i in range(3)}
+    matrix = align(frames, ppm_tol=3.0)
+    # Random m/z rarely fall within 3 ppm of each other, so each base peak is one feature.
+    assert len(matrix) == len(base)
+    order = np.argsort(base["m/z"].to_numpy())
+    np.testing.assert_array_equal(matrix.count(), np.where(order < 400, 3, np.where(order < 450, 2, 1)))
+    np.testing.assert_allclose(matrix.mz, base["m/z"].to_numpy()[order], rtol=1e-6)
+
+
+def test_empty():
+    matrix = align({"A": peaks([], [])})
+    assert matrix.shape == (0, 1)
+    assert matrix.to_frame().empty
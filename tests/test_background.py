@@ -0,0 +1,126 @@
+"""The SQLite background database and labelled background subtraction."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectra import cli
+from spectra.background import BackgroundDB, subtract_background
+from spectra.matching import PeakIndex, compare_dfs
+
+
+@pytest.fixture
+def db(tmp_path):
+    with BackgroundDB(str(tmp_path / "bg" / "background.sqlite")) as db:
+        yield db
+
+
+@pytest.fixture
+def backgrounds(make_spectrum):
+    return {"book.xlsx:Blank": make_spectrum(200), "book.xlsx:Column": make_spectrum(150)}
+
+
+def sample(make_spectrum, backgrounds):
+    a = make_spectrum(300)
+    near = [make_spectrum(near=bg["m/z"].to_numpy()[:80], jitter_ppm=0.2) for bg in backgrounds.values()]
+    return pd.concat([a] + near, ignore_index=True)
+
+
+def test_add_list_and_remove(db, backgrounds):
+    blank = backgrounds["book.xlsx:Blank"].copy()
+    blank.loc[[0, 1], "m/z"] = np.nan
+    blank.loc[2, "Resolution"] = 0.0
+    blank.loc[3, "Resolution"] = np.nan
+    assert db.add(blank, "book.xlsx:Blank") == 196
+    assert db.add(backgrounds["book.xlsx:Column"], "book.xlsx:Column", label="column bleed") == 150
+    assert db.sources() == [("book.xlsx:Blank", 196), ("book.xlsx:Column", 150)] and len(db) == 346
+
+    # Adding a source again replaces it, unless asked to keep what is there.
+    assert db.add(blank.iloc[:50], "book.xlsx:Blank") == 46
+    assert db.add(blank.iloc[50:60], "book.xlsx:Blank", replace=False) == 10
+    assert dict(db.sources())["book.xlsx:Blank"] == 56
+
+    assert db.remove("book.xlsx:Blank") == 56
+    assert db.remove("book.xlsx:Blank") == 0
+    assert db.sources() == [("book.xlsx:Column", 150)]
+
+
+def test_reopen(tmp_path, backgrounds):
+    path = str(tmp_path / "background.sqlite")
+    with pytest.raises(FileNotFoundError):
+        BackgroundDB(path, create=False)
+    with BackgroundDB(path) as db:
+        db.add(backgrounds["book.xlsx:Blank"], "book.xlsx:Blank")
+    with BackgroundDB(path, create=False) as db:
+        assert db.sources() == [("book.xlsx:Blank", 200)]
+
+
+def test_index(db, backgrounds):
+    for source, df in backgrounds.items():
+        db.add(df, source, label=source.split(":")[1])
+    index = db.index()
+    both = pd.concat(backgrounds.values(), ignore_index=True)
+    expected = PeakIndex.from_frame(both)
+    np.testing.assert_array_equal(index.mz, expected.mz)
+    np.testing.assert_allclose(index.half_width, expected.half_width)
+    np.testing.assert_allclose(index.relative, expected.relative)
+    from_blank = index.mz[index.labels == "Blank"]
+    np.testing.assert_array_equal(from_blank, np.sort(backgrounds["book.xlsx:Blank"]["m/z"]))
+
+    ranged = db.index(300.0, 600.0)
+    np.testing.assert_array_equal(ranged.mz, index.mz[(index.mz >= 300.0) & (index.mz <= 600.0)])
+    assert len(db.index(2000.0, 3000.0)) == 0
+
+
+def test_subtract_background(db, backgrounds, make_spectrum):
+    db.add(backgrounds["book.xlsx:Blank"], "book.xlsx:Blank", label="Blank")
+    db.add(backgrounds["book.xlsx:Column"], "book.xlsx:Column", label="Column")
+    # The same ion stored twice under one label is named once.
+    db.add(backgrounds["book.xlsx:Blank"].iloc[:5], "book.xlsx:Blank again", label="Blank")
+    a = sample(make_spectrum, backgrounds)
+    a.loc[7, "m/z"] = np.nan
+
+    unique, removed = subtract_background(a, db.index())
+    expected = compare_dfs(a, pd.concat(backgrounds.values(), ignore_index=True))
+    pd.testing.assert_frame_equal(unique, expected)
+    assert len(unique) + len(removed) == a["m/z"].notna().sum()
+    assert set(removed["Removed by"]) <= {"Blank", "Column", "Blank, Column", "Column, Blank"}
+    labels = dict(zip(removed["m/z"], removed["Removed by"]))
+    assert all(labels[m] == "Blank" for m in a["m/z"].iloc[300:380] if m in labels)
+    assert all(labels[m] == "Column" for m in a["m/z"].iloc[380:460] if m in labels)
+    assert len(removed) >= 155
+
+    # Querying only the sample's m/z range gives the same result as the whole database.
+    ranged_unique, ranged_removed = db.subtract(a)
+    pd.testing.assert_frame_equal(ranged_unique, unique)
+    pd.testing.assert_frame_equal(ranged_removed, removed)
+
+
+def test_empty_database(db, make_spectrum):
+    a = make_spectrum(50)
+    unique, removed = db.subtract(a)
+    pd.testing.assert_frame_equal(unique, a)
+    assert removed.empty and "Removed by" in removed.columns
+
+
+def test_cli_add_and_subtract(tmp_path, backgrounds, make_spectrum, write_workbook, capsys):
+    blank = backgrounds["book.xlsx:Blank"]
+    run = pd.concat([make_spectrum(100), make_spectrum(near=blank["m/z"].to_numpy()[:40], jitter_ppm=0.2)],
+                    ignore_index=True)
+    book = write_workbook({"Blank": blank, "Run": run})
+    path = str(tmp_path / "background.sqlite")
+    assert cli.main(["background", "add", book, "--db", path, "--sheets", "Blank", "--no-cache"]) == 0
+    assert capsys.readouterr().out == "book.xlsx:Blank\t200\n"
+
+    out = tmp_path / "out"
+    assert cli.main(["subtract", book, "--background", path, "--target", "Run", "--no-plots", "--no-cache",
+                     "--min-sn", "0", "--out", str(out)]) == 0
+    assert capsys.readouterr().out.split() == [str(out / "Run_subtracted_background.csv"),
+                                               str(out / "Run_subtracted_background_removed.csv")]
+    unique = pd.read_csv(out / "Run_subtracted_background.csv")
+    removed = pd.read_csv(out / "Run_subtracted_background_removed.csv")
+    np.testing.assert_allclose(unique["m/z"], compare_dfs(run, blank)["m/z"])
+    assert len(removed) == 40 and set(removed["Removed by"]) == {"book.xlsx:Blank"}
+
+    assert cli.main(["background", "remove", "book.xlsx:Blank", "--db", path]) == 0
+    assert cli.main(["background", "list", "--db", path]) == 0
+    assert capsys.readouterr().out == ""
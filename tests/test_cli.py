@@ -0,0 +1,41 @@
+"""Batch subtraction from the command line."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectra import cli, matching
+from spectra.matching import compare_dfs, dual_subtract
+
+
+@pytest.fixture
+def book(make_spectrum, write_workbook):
+    blank = make_spectrum(200)
+    sheets = {"Blank": blank}
+    for name in ("S1", "S2"):
+        sheets[name] = pd.concat([make_spectrum(150), make_spectrum(near=blank["m/z"].to_numpy()[:100])],
+                                 ignore_index=True)
+    return write_workbook(sheets), sheets
+
+
+@pytest.mark.parametrize("extra", [[], ["--recalibrate"], ["--min-fold", "2"]])
+def test_dual_matches_each_pair_once(tmp_path, monkeypatch, book, extra):
+    path, sheets = book
+    calls = []
+    dual_pairs = matching.dual_pairs
+    monkeypatch.setattr(cli, "dual_pairs", lambda *a, **k: calls.append(1) or dual_pairs(*a, **k))
+    monkeypatch.setattr(cli, "compare_dfs", None)
+    monkeypatch.setattr(cli, "iter_subtractions", None)
+    out = tmp_path / "out"
+    assert cli.main(["subtract", path, "--reference", "Blank", "--dual", "--no-plots", "--no-cache", "--min-sn", "0",
+                     "--out", str(out)] + extra) == 0
+    assert len(calls) == 2
+    for target in ("S1", "S2"):
+        tables = {suffix: pd.read_csv(out / f"{target}_subtracted_Blank{suffix}.csv")
+                  for suffix in ("", "_only_B", "_matched")}
+        if extra:
+            continue
+        up, down, matched = dual_subtract(sheets[target], sheets["Blank"])
+        np.testing.assert_allclose(tables[""]["m/z"], compare_dfs(sheets[target], sheets["Blank"])["m/z"])
+        np.testing.assert_allclose(tables[""]["m/z"], up["m/z"])
+        np.testing.assert_allclose(tables["_only_B"]["m/z"], down["m/z"])
+        np.testing.assert_allclose(tables["_matched"]["ppm error"], matched["ppm error"])
@@ -0,0 +1,83 @@
+"""Isotope/adduct grouping, family subtraction, and the live families cut."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectra.families import CHARGE, PROTON, PeakFamilies, family_subtract, group_families
+from spectra.incremental import LiveMatch
+from spectra.matching import compare_dfs
+from spectra.readers import sn_filter
+
+M = 300.1234
+
+
+@pytest.fixture
+def family():
+    """[M+H]+ with two 13C peaks, Na adduct (and its 13C peak), 2+ ion (and its 13C peak), plus one unrelated peak."""
+    rows = [
+        (M, 100.0, ""),
+        (M + 1.003355, 20.0, "13C"),
+        # Linked to the M+1 peak: single 13C steps are tried first.
+        (M + 2.006710, 3.0, "13C"),
+        (M + 21.981943, 40.0, "+Na"),
+        (M + 21.981943 + 1.003355, 8.0, "13C"),
+        ((M + PROTON) / 2, 30.0, CHARGE),
+        ((M + PROTON) / 2 + 1.003355 / 2, 6.0, "13C (2+)"),
+        (455.5, 50.0, ""),
+    ]
+    df = pd.DataFrame(rows, columns=["m/z", "Relative", "Relation"])
+    df = df.sample(frac=1.0, random_state=3).reset_index(drop=True)
+    df["Intensity"] = df["Relative"] * 100.0
+    df["Resolution"] = 1e5
+    df["Noise"] = 1.0
+    return df
+
+
+def test_grouping(family):
+    families = PeakFamilies.from_frame(family)
+    root_mz = family["m/z"].to_numpy()[families.root]
+    unrelated = family["m/z"] == 455.5
+    assert np.allclose(root_mz[~unrelated], M)
+    assert families.relation.tolist() == family["Relation"].tolist()
+    assert families.n_families == 1
+
+
+def test_implausible_isotope_is_not_linked(family):
+    m2 = (family["m/z"] == M + 2.006710).to_numpy()
+    family.loc[m2, "Relative"] = 90.0
+    families = PeakFamilies.from_frame(family)
+    assert families.relation[m2] == ""
+
+
+def test_family_subtract_removes_the_family_of_a_matched_root(family):
+    reference = family.loc[family["m/z"] == M].assign(**{"m/z": M * (1 + 1e-6)})
+    unique_df, removed = family_subtract(family.drop(columns="Relation"), reference)
+    assert unique_df["m/z"].tolist() == [455.5]
+    assert len(removed) == 7
+    assert np.allclose(removed["Family m/z"], M)
+    assert removed["Matched"].sum() == 1
+
+
+def test_roots_never_loop(rng):
+    mz = np.sort(rng.uniform(100.0, 1500.0, 50_000))
+    families = group_families(mz, rng.uniform(0.0, 100.0, len(mz)))
+    assert (families.root[families.root] == families.root).all()
+    assert (families.parent[families.root] == -1).all()
+
+
+def test_family_subtract_keeps_at_most_compare_dfs(make_spectrum):
+    a = make_spectrum(2000)
+    b = a.iloc[::7]
+    unique_df, removed = family_subtract(a, b)
+    assert set(unique_df["m/z"]) <= set(compare_dfs(a, b)["m/z"])
+    assert len(unique_df) + len(removed) == len(a)
+
+
+@pytest.mark.parametrize("min_sn", (None, 10.0))
+@pytest.mark.parametrize("ppm_tol", (1.0, 3.0, 5.0, 10.0))
+def test_live_families_group_at_the_tolerance(make_spectrum, rng, ppm_tol, min_sn):
+    a = make_spectrum(3000)
+    a["Intensity"] = a["Noise"] * rng.uniform(0.0, 40.0, len(a))
+    b = make_spectrum(near=a["m/z"].to_numpy()[::5])
+    expected, _ = family_subtract(sn_filter(a, min_sn), sn_filter(b, min_sn), ppm_tol)
+    pd.testing.assert_frame_equal(LiveMatch(a, b).a_only(ppm_tol, min_sn, families=True), expected)
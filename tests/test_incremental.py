@@ -0,0 +1,82 @@
+"""LiveMatch re-cuts against matching from scratch at every threshold."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectra.incremental import LiveMatch
+from spectra.matching import compare_dfs, dual_subtract, fold_change_subtract
+from spectra.readers import sn_filter
+
+TOLERANCES = (0.5, 3.0, 10.0, 20.0)
+CUTOFFS = (None, 5.0, 10.0, 25.0)
+
+
+@pytest.fixture
+def spectra(make_spectrum, rng):
+    a = make_spectrum(600)
+    b = pd.concat([make_spectrum(400), make_spectrum(near=a["m/z"].to_numpy()[::2], jitter_ppm=5.0)],
+                  ignore_index=True)
+    for df in (a, b):
+        # S/N spread around the cutoffs.
+        df["Intensity"] = df["Noise"] * rng.uniform(0.0, 40.0, len(df))
+        df["Relative"] = df["Intensity"] / df["Intensity"].max() * 100.0
+    return a, b.sample(frac=1.0, random_state=0).reset_index(drop=True)
+
+
+@pytest.fixture
+def live(spectra):
+    return LiveMatch(*spectra)
+
+
+@pytest.mark.parametrize("min_sn", CUTOFFS)
+@pytest.mark.parametrize("ppm_tol", TOLERANCES)
+def test_a_only_and_b_only(spectra, live, ppm_tol, min_sn):
+    a, b = sn_filter(spectra[0], min_sn), sn_filter(spectra[1], min_sn)
+    pd.testing.assert_frame_equal(live.a_only(ppm_tol, min_sn), compare_dfs(a, b, ppm_tol))
+    pd.testing.assert_frame_equal(live.b_only(ppm_tol, min_sn), compare_dfs(b, a, ppm_tol))
+
+
+@pytest.mark.parametrize("min_sn", (None, 10.0))
+@pytest.mark.parametrize("ppm_tol", (1.0, 3.0))
+def test_matched(spectra, live, ppm_tol, min_sn):
+    a, b = sn_filter(spectra[0], min_sn), sn_filter(spectra[1], min_sn)
+    pd.testing.assert_frame_equal(live.matched(ppm_tol, min_sn), dual_subtract(a, b, ppm_tol=ppm_tol)[2])
+
+
+@pytest.mark.parametrize("min_fold", (1.5, 3.0, 10.0))
+@pytest.mark.parametrize("min_sn", (None, 10.0))
+def test_fold_change(spectra, live, min_sn, min_fold):
+    a, b = sn_filter(spectra[0], min_sn), sn_filter(spectra[1], min_sn)
+    expected = fold_change_subtract(a, b, ppm_tol=3.0, min_fold=min_fold)
+    pd.testing.assert_frame_equal(live.a_only(3.0, min_sn, min_fold=min_fold), expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("min_sn", (0.0, 10.0, 13.0))
+def test_sn_edge_cases_agree_with_sn_filter(spectra, min_sn):
+    a, b = (df.copy() for df in spectra)
+    for df in (a, b):
+        df.loc[0:9, "Noise"] = 0.0
+        df.loc[10:19, "Noise"] = -df.loc[10:19, "Noise"]
+        df.loc[20:24, "Noise"] = np.nan
+        df.loc[25:29, "Intensity"] = 0.0
+        # On the cut exactly, and where Intensity / Noise and Intensity > cut * Noise round differently.
+        df.loc[30:39, "Intensity"] = df.loc[30:39, "Noise"] * min_sn
+        df.loc[40:49, ["Intensity", "Noise"]] = (701.22, 53.94)
+    live = LiveMatch(a, b)
+    fa, fb = sn_filter(a, min_sn), sn_filter(b, min_sn)
+    for ppm_tol in (1.0, 3.0):
+        pd.testing.assert_frame_equal(live.a_only(ppm_tol, min_sn), compare_dfs(fa, fb, ppm_tol))
+        pd.testing.assert_frame_equal(live.b_only(ppm_tol, min_sn), compare_dfs(fb, fa, ppm_tol))
+        pd.testing.assert_frame_equal(live.matched(ppm_tol, min_sn), dual_subtract(fa, fb, ppm_tol=ppm_tol)[2])
+
+
+def test_cutoff_order_does_not_matter(live):
+    first = live.a_only(3.0, 10.0)
+    live.a_only(5.0, None)
+    live.b_only(1.0, 25.0)
+    pd.testing.assert_frame_equal(live.a_only(3.0, 10.0), first)
+
+
+def test_tolerance_above_max_ppm(live):
+    with pytest.raises(ValueError, match="above"):
+        live.a_only(live.max_ppm + 1)
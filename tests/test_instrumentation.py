@@ -0,0 +1,76 @@
+"""Stage events, and the peak memory of nested stages."""
+import pytest
+
+from spectra import cli, instrumentation
+from spectra.instrumentation import capture, stage
+
+MB = 1 << 20
+
+
+@pytest.fixture
+def events():
+    collected = []
+    instrumentation.enable(collected.append)
+    yield collected
+    instrumentation.disable(collected.append)
+
+
+def by_stage(events):
+    return {event["stage"]: event for event in events}
+
+
+def test_disabled_stage_is_a_no_op():
+    assert not instrumentation.is_enabled()
+    with stage("nothing") as ctx:
+        assert ctx is None
+
+
+def test_event_fields(events):
+    with pytest.raises(KeyError):
+        with stage("lookup", sheet="S1"):
+            raise KeyError("S1")
+    event, = events
+    assert event["stage"] == "lookup" and event["sheet"] == "S1" and event["error"] == "KeyError"
+    assert event["seconds"] >= 0 and "peak_bytes" not in event
+
+
+def test_nested_peaks(events):
+    with capture(memory=True):
+        with stage("outer"):
+            big = bytearray(8 * MB)
+            del big
+            with stage("first"):
+                small = bytearray(MB)
+                del small
+            with stage("second"):
+                kept = bytearray(2 * MB)
+        del kept
+    peaks = {name: event["peak_bytes"] for name, event in by_stage(events).items()}
+    # The outer stage keeps the peak reached before its children started; each child counts
+    # only what it allocated itself.
+    assert peaks["outer"] >= 8 * MB
+    assert 0.9 * MB < peaks["first"] < 2 * MB
+    assert 1.9 * MB < peaks["second"] < 3 * MB
+
+
+def test_peak_is_relative_to_stage_start(events):
+    with capture(memory=True):
+        held = bytearray(8 * MB)
+        with stage("after"):
+            small = bytearray(MB)
+            del small
+        del held
+    assert 0.9 * MB < events[0]["peak_bytes"] < 2 * MB
+
+
+def test_cli_writes_timings_only_when_asked(tmp_path, monkeypatch, capsys):
+    ran = []
+    monkeypatch.setattr(cli, "run", lambda args: ran.append(args.command) or 0)
+    profile = tmp_path / "run.prof"
+    assert cli.main(["store", "--profile", str(profile), "--trace-memory", "list", str(tmp_path)]) == 0
+    assert profile.exists() and capsys.readouterr().err == ""
+
+    timings = tmp_path / "timings.jsonl"
+    assert cli.main(["store", "--timings", str(timings), "--trace-memory", "list", str(tmp_path)]) == 0
+    assert '"stage": "command"' in timings.read_text() and '"peak_bytes"' in timings.read_text()
+    assert ran == ["store", "store"] and not instrumentation.is_enabled()
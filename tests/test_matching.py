@@ -0,0 +1,167 @@
+"""compare_dfs against the per-row matcher it replaced, and multi_subtract against chained compare_dfs."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectra.matching import PeakIndex, compare_dfs, multi_subtract
+
+TOLERANCES = (0.5, 3.0, 10.0)
+
+
+def reference_compare_dfs(df1: pd.DataFrame, df2: pd.DataFrame, ppm_tol: float = 3.0) -> pd.DataFrame:
+    """The original implementation: one boolean mask apply over the rows of A."""
+    if df1.empty:
+        return df1.copy()
+    if df2.empty:
+        return df1.dropna(subset=["m/z"]).reset_index(drop=True)
+
+    dfB = df2.copy()
+    dfB["half_width_B"] = dfB["m/z"] / dfB["Resolution"] / 2
+
+    def peak_match(row: pd.Series) -> bool:
+        m1 = float(row["m/z"])
+        R1 = float(row["Resolution"]) if pd.notna(row["Resolution"]) else float("inf")
+        hw1 = m1 / R1 / 2 if R1 and R1 > 0 else 0.0
+        max_hwB = float(dfB["half_width_B"].max()) if not dfB.empty else 0.0
+        lo, hi = m1 - (hw1 + max_hwB), m1 + (hw1 + max_hwB)
+        cand = dfB[(dfB["m/z"] >= lo) & (dfB["m/z"] <= hi)]
+        if cand.empty:
+            return False
+        sep = (cand["m/z"] - m1).abs()
+        overlap = sep <= (hw1 + cand["half_width_B"])
+        delta_ppm = sep / ((cand["m/z"] + m1) / 2.0) * 1e6
+        return bool((overlap & (delta_ppm <= ppm_tol)).any())
+
+    dfA = df1.dropna(subset=["m/z"]).copy()
+    mask = dfA.apply(peak_match, axis=1)
+    return dfA.loc[~mask].reset_index(drop=True)
+
+
+def assert_same(df_a: pd.DataFrame, df_b: pd.DataFrame, ppm_tol: float) -> None:
+    expected = reference_compare_dfs(df_a, df_b, ppm_tol)
+    pd.testing.assert_frame_equal(compare_dfs(df_a, df_b, ppm_tol), expected)
+    pd.testing.assert_frame_equal(compare_dfs(df_a, PeakIndex.from_frame(df_b), ppm_tol), expected)
+
+
+def pair(make_spectrum, n_a: int = 300, n_b: int = 200, shared: int = 150):
+    a = make_spectrum(n_a)
+    b = pd.concat([make_spectrum(n_b), make_spectrum(near=a["m/z"].to_numpy()[:shared])], ignore_index=True)
+    return a, b
+
+
+@pytest.mark.parametrize("ppm_tol", TOLERANCES)
+@pytest.mark.parametrize("rng", range(5), indirect=True)
+def test_random_spectra(make_spectrum, ppm_tol):
+    a, b = pair(make_spectrum)
+    assert_same(a, b, ppm_tol)
+
+
+@pytest.mark.parametrize("ppm_tol", TOLERANCES)
+def test_nan_zero_and_negative_resolution(make_spectrum, ppm_tol):
+    a, b = pair(make_spectrum)
+    a.loc[[3, 30], "Resolution"] = np.nan
+    a.loc[[4, 40], "Resolution"] = 0.0
+    a.loc[[5, 50], "Resolution"] = -5e4
+    b.loc[[1, 210], "Resolution"] = np.nan
+    b.loc[[2, 220], "Resolution"] = -5e4
+    assert_same(a, b, ppm_tol)
+
+
+@pytest.mark.parametrize("ppm_tol", TOLERANCES)
+def test_zero_resolution_in_b(make_spectrum, ppm_tol):
+    # An infinitely wide B peak overlaps everything; only the ppm test is left.
+    a, b = pair(make_spectrum)
+    b.loc[[5, 205], "Resolution"] = 0.0
+    assert_same(a, b, ppm_tol)
+
+
+@pytest.mark.parametrize("ppm_tol", TOLERANCES)
+def test_all_b_resolutions_missing(make_spectrum, ppm_tol):
+    a, b = pair(make_spectrum)
+    b["Resolution"] = np.nan
+    assert_same(a, b, ppm_tol)
+
+
+@pytest.mark.parametrize("ppm_tol", TOLERANCES)
+def test_nan_mz(make_spectrum, ppm_tol):
+    a, b = pair(make_spectrum)
+    a.loc[[0, 7, 120], "m/z"] = np.nan
+    b.loc[[3, 201], "m/z"] = np.nan
+    assert_same(a, b, ppm_tol)
+
+
+def test_empty_a(make_spectrum):
+    assert_same(make_spectrum(0), make_spectrum(50), 3.0)
+
+
+def test_empty_b(make_spectrum):
+    a = make_spectrum(50)
+    a.loc[2, "m/z"] = np.nan
+    assert_same(a, make_spectrum(0), 3.0)
+
+
+def test_identical_spectra_remove_everything(make_spectrum):
+    a = make_spectrum(100)
+    assert compare_dfs(a, a.copy()).empty
+
+
+@pytest.fixture
+def references(make_spectrum):
+    """
+    A sample and three references: Blank1 holds sample peaks 0-99 and Blank2 peaks 0-59 and
+    150-199, all within 0.2 ppm; Blank2's copy of peak 0 has no resolution, so cannot match.
+    """
+    a = make_spectrum(300)
+    a.loc[[10, 250], "m/z"] = np.nan
+    mz = a["m/z"].to_numpy()
+    refs = {
+        "Blank1": pd.concat([make_spectrum(100), make_spectrum(near=mz[:100], jitter_ppm=0.2)], ignore_index=True),
+        "Blank2": pd.concat([make_spectrum(near=mz[:60], jitter_ppm=0.2),
+                             make_spectrum(near=mz[150:200], jitter_ppm=0.2)], ignore_index=True),
+        "Solvent": make_spectrum(80),
+    }
+    refs["Blank2"].loc[0, "Resolution"] = np.nan
+    return a, refs
+
+
+@pytest.mark.parametrize("ppm_tol", TOLERANCES)
+def test_multi_subtract_equals_chained_compare_dfs(references, ppm_tol):
+    a, refs = references
+    expected = a
+    for ref in refs.values():
+        expected = compare_dfs(expected, ref, ppm_tol)
+    for given in (refs, {name: PeakIndex.from_frame(ref) for name, ref in refs.items()}):
+        unique, removed, counts = multi_subtract(a, given, ppm_tol)
+        pd.testing.assert_frame_equal(unique, expected)
+        assert len(unique) + len(removed) == a["m/z"].notna().sum()
+        assert set(removed["m/z"]).isdisjoint(unique["m/z"])
+        # Each reference counts every peak it matches, whether or not another one matched it too.
+        assert counts == {name: a["m/z"].notna().sum() - len(compare_dfs(a, ref, ppm_tol))
+                          for name, ref in refs.items()}
+
+
+def test_multi_subtract_names_every_matching_reference(references):
+    a, refs = references
+    unique, removed, counts = multi_subtract(a, refs)
+    expected = {}
+    for row, m in enumerate(a["m/z"]):
+        names = [name for name, rows in (("Blank1", range(100)), ("Blank2", range(1, 60))) if row in rows]
+        names += ["Blank2"] if 150 <= row < 200 else []
+        if names and row != 10:
+            expected[m] = ", ".join(names)
+    # A peak both blanks match is claimed by both, named in the order the references were given.
+    assert dict(zip(removed["m/z"], removed["Removed by"])) == expected
+    assert counts == {"Blank1": 99, "Blank2": 108, "Solvent": 0}
+    # Swapping the references swaps the names, not the peaks removed.
+    _, swapped, _ = multi_subtract(a, {"Blank2": refs["Blank2"], "Blank1": refs["Blank1"]})
+    np.testing.assert_array_equal(swapped["m/z"], removed["m/z"])
+    assert "Blank2, Blank1" in set(swapped["Removed by"])
+
+
+def test_multi_subtract_empty(make_spectrum):
+    unique, removed, counts = multi_subtract(make_spectrum(0), {"Blank": make_spectrum(50)})
+    assert unique.empty and removed.empty and "Removed by" in removed.columns and counts == {"Blank": 0}
+    a = make_spectrum(40)
+    unique, removed, counts = multi_subtract(a, {"Blank": make_spectrum(0)})
+    pd.testing.assert_frame_equal(unique, a)
+    assert removed.empty and counts == {"Blank": 0}
@@ -0,0 +1,31 @@
+"""The process-pool runner against plain compare_dfs."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectra.matching import compare_dfs
+from spectra.parallel import iter_subtractions
+
+
+@pytest.fixture
+def sheets(make_spectrum):
+    blank = make_spectrum(400)
+    data = {"Blank": blank}
+    for i in range(1, 4):
+        data[f"S{i}"] = pd.concat([make_spectrum(300), make_spectrum(near=blank["m/z"].to_numpy()[:200])],
+                                  ignore_index=True)
+    data["S1"].loc[5, "m/z"] = np.nan
+    return data
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_matches_compare_dfs_in_order(sheets, workers):
+    pairs = [(t, "Blank") for t in ("S1", "S2", "S3")] + [("Blank", "S2"), ("S3", "S1")]
+    results = list(iter_subtractions(sheets, pairs, 3.0, workers))
+    assert [pair for pair, _ in results] == pairs
+    for (target, reference), unique_df in results:
+        pd.testing.assert_frame_equal(unique_df, compare_dfs(sheets[target], sheets[reference], 3.0))
+
+
+def test_no_pairs(sheets):
+    assert list(iter_subtractions(sheets, [], 3.0, 2)) == []
@@ -0,0 +1,148 @@
+"""Peak-list readers: every format gives the same filtered table."""
+import base64
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectra import readers
+from spectra.readers import MIN_SN, DelimitedReader, ExcelReader, MzmlReader, filter_sheet, open_reader
+
+
+@pytest.fixture
+def peaks(make_spectrum):
+    df = make_spectrum(40)
+    # A quarter of the peaks under the S/N cut.
+    df.loc[::4, "Intensity"] = df.loc[::4, "Noise"] * 5
+    df["Relative"] = df["Intensity"] / df["Intensity"].max() * 100.0
+    return df
+
+
+def expected(df: pd.DataFrame, min_sn=MIN_SN) -> pd.DataFrame:
+    keep = df if min_sn is None else df.loc[df["Intensity"] > min_sn * df["Noise"]]
+    return keep.reset_index(drop=True)
+
+
+def write_delimited(path, df: pd.DataFrame, sep: str, header_rows: int = 6) -> str:
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.writelines(f"Header line {i + 1}\n" for i in range(header_rows))
+        df.to_csv(fh, sep=sep, index=False)
+    return str(path)
+
+
+def _array(values: np.ndarray, accession: str, name: str = "", float32: bool = False, compress: bool = False) -> str:
+    raw = np.asarray(values, dtype="<f4" if float32 else "<f8").tobytes()
+    if compress:
+        raw = zlib.compress(raw)
+    params = [f'<cvParam accession="{"MS:1000521" if float32 else "MS:1000523"}"/>',
+              f'<cvParam accession="{accession}" value="{name}"/>']
+    if compress:
+        params.append('<cvParam accession="MS:1000574"/>')
+    return (f"<binaryDataArray>{''.join(params)}<binary>{base64.b64encode(raw).decode()}</binary>"
+            "</binaryDataArray>")
+
+
+def write_mzml(path, spectra) -> str:
+    body = []
+    for spectrum_id, df in spectra.items():
+        arrays = [
+            _array(df["m/z"], "MS:1000514"),
+            _array(df["Intensity"], "MS:1000515", compress=True),
+            _array(df["Noise"], "MS:1002742", float32=True),
+            _array(df["Resolution"], "MS:1000786", "resolution", compress=True),
+        ]
+        body.append(f'<spectrum id="{spectrum_id}"><binaryDataArrayList>{"".join(arrays)}'
+                    "</binaryDataArrayList></spectrum>")
+    path.write_text('<?xml version="1.0"?><mzML xmlns="http://psi.hupo.org/ms/mzml"><run><spectrumList>'
+                    + "".join(body) + "</spectrumList></run></mzML>")
+    return str(path)
+
+
+def test_excel(write_workbook, peaks):
+    reader = open_reader(write_workbook({"S1": peaks, "S2": peaks.iloc[:10]}))
+    assert isinstance(reader, ExcelReader)
+    assert reader.sheet_names == ["S1", "S2"]
+    pd.testing.assert_frame_equal(reader.read("S1", 6), expected(peaks))
+    pd.testing.assert_frame_equal(reader.read("S1", 6, min_sn=None), expected(peaks, None))
+
+
+@pytest.mark.parametrize("ext, sep", [(".csv", ","), (".tsv", "\t")])
+def test_delimited_in_chunks(tmp_path, monkeypatch, peaks, ext, sep):
+    monkeypatch.setattr(readers, "CSV_CHUNK_ROWS", 7)
+    reader = open_reader(write_delimited(tmp_path / f"run1{ext}", peaks, sep))
+    assert isinstance(reader, DelimitedReader)
+    assert reader.sheet_names == ["run1"]
+    pd.testing.assert_frame_equal(reader.read("run1", 6), expected(peaks))
+    with pytest.raises(KeyError):
+        reader.read("other", 6)
+
+
+def test_mzml(tmp_path, peaks):
+    reader = open_reader(write_mzml(tmp_path / "run.mzML", {"scan=1": peaks, "scan=2": peaks.iloc[:5]}))
+    assert isinstance(reader, MzmlReader)
+    assert reader.sheet_names == ["scan=1", "scan=2"]
+    df = reader.read("scan=1")
+    want = expected(peaks)
+    # Noise went through float32; Relative is recomputed from the intensities, as the reader does.
+    keep = peaks["Intensity"].to_numpy() > MIN_SN * peaks["Noise"].to_numpy(dtype=np.float32)
+    assert len(df) == int(keep.sum()) == len(want)
+    np.testing.assert_array_equal(df["m/z"], want["m/z"])
+    np.testing.assert_array_equal(df["Resolution"], want["Resolution"])
+    np.testing.assert_allclose(df["Noise"], want["Noise"], rtol=1e-6)
+    np.testing.assert_allclose(df["Relative"], want["Relative"])
+
+
+def test_mzml_reads_only_the_requested_spectrum(tmp_path, monkeypatch, make_spectrum):
+    spectra = {f"scan={i}": make_spectrum(20 + i) for i in range(1, 13)}
+    path = write_mzml(tmp_path / "run.mzML", spectra)
+    reader = open_reader(path)
+    assert reader.sheet_names == list(spectra)
+    parsed = []
+    fromstring = readers.ET.fromstring
+    monkeypatch.setattr(readers.ET, "fromstring", lambda text: parsed.append(len(text)) or fromstring(text))
+    monkeypatch.setattr(readers.ET, "iterparse", None)
+    for name in reversed(reader.sheet_names):
+        np.testing.assert_array_equal(reader.read(name, min_sn=None)["m/z"], spectra[name]["m/z"])
+    # Each read parses the bytes of one spectrum, not the whole file.
+    assert len(parsed) == len(spectra) and max(parsed) < (tmp_path / "run.mzML").stat().st_size / 5
+    with pytest.raises(KeyError):
+        reader.read("scan=99")
+
+
+def test_mzml_prefixed_namespace_and_escaped_ids(tmp_path, peaks):
+    plain = tmp_path / "plain.mzML"
+    write_mzml(plain, {"scan=1": peaks})
+    text = plain.read_text()
+    spectrum = text[text.index("<spectrum "):text.index("</spectrumList>")]
+    text = ('<?xml version="1.0"?><indexedmzML xmlns="http://psi.hupo.org/ms/mzml"><mzML><run>'
+            '<ms:spectrumList xmlns:ms="http://psi.hupo.org/ms/mzml">'
+            + spectrum.replace('<spectrum id="scan=1">', """<ms:spectrum index="0" id='a &amp; b'>""")
+                      .replace("</spectrum>", "</ms:spectrum>").replace("<binaryDataArray", "<ms:binaryDataArray")
+                      .replace("</binaryDataArray", "</ms:binaryDataArray")
+            + '<spectrum id="empty"/></ms:spectrumList></run></mzML></indexedmzML>')
+    path = tmp_path / "prefixed.mzML"
+    path.write_text(text)
+    reader = open_reader(str(path))
+    assert reader.sheet_names == ["a & b", "empty"]
+    pd.testing.assert_frame_equal(reader.read("a & b"), MzmlReader(str(plain)).read("scan=1"))
+    with pytest.raises(ValueError, match="missing arrays"):
+        reader.read("empty")
+
+
+def test_mzml_missing_arrays(tmp_path, peaks):
+    path = tmp_path / "run.mzML"
+    path.write_text('<mzML><spectrum id="s"><binaryDataArrayList>' + _array(peaks["m/z"], "MS:1000514")
+                    + "</binaryDataArrayList></spectrum></mzML>")
+    with pytest.raises(ValueError, match="missing arrays"):
+        open_reader(str(path)).read("s")
+
+
+def test_missing_columns(peaks):
+    with pytest.raises(ValueError, match="missing columns"):
+        filter_sheet("S1", peaks.drop(columns="Noise"))
+
+
+def test_unsupported_extension(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported file type"):
+        open_reader(str(tmp_path / "peaks.json"))
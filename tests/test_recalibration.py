@@ -0,0 +1,61 @@
+"""Mass-drift fitting and correction."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectra.matching import compare_dfs
+from spectra.recalibration import MIN_ANCHORS, fit_drift, recalibrate
+
+
+def drifted(df: pd.DataFrame, ppm, rng, noise_ppm: float = 0.3) -> pd.DataFrame:
+    """``df`` with its m/z moved by ``ppm(mz)`` plus some scatter."""
+    mz = df["m/z"].to_numpy()
+    return df.assign(**{"m/z": mz * (1 + (ppm(mz) + rng.normal(0.0, noise_ppm, len(mz))) * 1e-6)})
+
+
+@pytest.fixture
+def sample(make_spectrum):
+    # Sparse enough that most peaks have a single partner within the 20 ppm window.
+    return make_spectrum(1500)
+
+
+def test_linear_drift_is_recovered(sample, make_spectrum, rng):
+    shift = lambda mz: 2.0 + 4.0 * (mz - 100.0) / 1100.0  # noqa: E731
+    b = pd.concat([drifted(sample, shift, rng), make_spectrum(300)], ignore_index=True)
+    recalibration = fit_drift(sample, b)
+    assert recalibration.applied and recalibration.anchors >= MIN_ANCHORS
+    grid = np.linspace(150.0, 1150.0, 5)
+    np.testing.assert_allclose(recalibration.ppm_at(grid), shift(grid), atol=0.2)
+    assert recalibration.rms_after < recalibration.rms_before
+
+
+def test_quadratic_drift_is_recovered(sample, rng):
+    shift = lambda mz: 3.0 - 6e-6 * (mz - 600.0) ** 2  # noqa: E731
+    recalibration = fit_drift(sample, drifted(sample, shift, rng), degree=2)
+    grid = np.linspace(150.0, 1150.0, 5)
+    np.testing.assert_allclose(recalibration.ppm_at(grid), shift(grid), atol=0.3)
+
+
+def test_correction_restores_matches(sample, rng):
+    b = drifted(sample, lambda mz: np.full(len(mz), 6.0), rng, noise_ppm=0.2)
+    assert len(compare_dfs(sample, b, 3.0)) > 0.9 * len(sample)
+    corrected, recalibration = recalibrate(sample, b)
+    assert recalibration.applied
+    assert len(compare_dfs(sample, corrected, 3.0)) < 0.02 * len(sample)
+    # Only m/z changes, and the input is left alone.
+    pd.testing.assert_frame_equal(corrected.drop(columns="m/z"), b.drop(columns="m/z"))
+    assert not np.array_equal(corrected["m/z"], b["m/z"])
+
+
+def test_too_few_anchors_changes_nothing(sample, rng):
+    b = drifted(sample.iloc[:MIN_ANCHORS - 1], lambda mz: np.full(len(mz), 5.0), rng)
+    corrected, recalibration = recalibrate(sample, b)
+    assert not recalibration.applied
+    assert corrected is b
+    assert "not recalibrated" in recalibration.summary()
+    assert recalibration.as_row()["Applied"] is False
+
+
+def test_degree_is_checked(sample):
+    with pytest.raises(ValueError, match="degree"):
+        fit_drift(sample, sample, degree=3)
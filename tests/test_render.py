@@ -0,0 +1,93 @@
+"""Max-per-pixel decimation of StickCollection."""
+import numpy as np
+import pytest
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from spectra.render import STICKS_PER_PIXEL, StickCollection, max_per_bin
+
+
+@pytest.fixture
+def ax():
+    fig = Figure(figsize=(4, 3), dpi=100)
+    FigureCanvasAgg(fig)
+    return fig.add_subplot()
+
+
+@pytest.fixture
+def sticks(rng):
+    mz = rng.uniform(100.0, 1000.0, 50_000)
+    # Negative heights as in the dual plot; decimation keeps the largest magnitude.
+    heights = rng.uniform(-100.0, 100.0, len(mz))
+    return mz, heights
+
+
+def shown(stick: StickCollection):
+    segments = np.asarray(stick.collection.get_segments())
+    return segments[:, 0, 0], segments[:, 1, 1]
+
+
+def column_maxima(mz, heights, x0, x1, bins):
+    column = ((mz - x0) * (bins / (x1 - x0))).astype(np.int64)
+    out = {}
+    for c, h in zip(column, np.abs(heights)):
+        out[c] = max(out.get(c, 0.0), h)
+    return out
+
+
+@pytest.mark.parametrize("rng", range(3), indirect=True)
+def test_max_per_bin(sticks):
+    mz, heights = sticks
+    order = np.argsort(mz)
+    mz, heights = mz[order], heights[order]
+    keep = max_per_bin(mz, heights, 100.0, 1000.0, 300)
+    assert np.all(np.diff(keep) > 0)
+    expected = column_maxima(mz, heights, 100.0, 1000.0, 300)
+    assert column_maxima(mz[keep], heights[keep], 100.0, 1000.0, 300) == expected and len(keep) == len(expected)
+    assert len(max_per_bin(mz[:0], heights[:0], 100.0, 1000.0, 300)) == 0
+
+
+def test_decimation_keeps_every_pixel_maximum(ax, sticks):
+    mz, heights = sticks
+    stick = StickCollection(ax, mz, heights)
+    x0, x1 = sorted(ax.get_xlim())
+    pixels = int(ax.bbox.width)
+    got_mz, got_heights = shown(stick)
+    assert len(got_mz) <= pixels + 1 < len(mz)
+    assert column_maxima(got_mz, got_heights, x0, x1, pixels) == column_maxima(mz, heights, x0, x1, pixels)
+
+
+def test_zoom_restores_sticks(ax, sticks):
+    mz, heights = sticks
+    stick = StickCollection(ax, mz, heights)
+
+    # Few enough sticks in view to draw them all.
+    ax.set_xlim(500.0, 500.5)
+    visible = (mz >= 500.0) & (mz <= 500.5)
+    assert 0 < visible.sum() <= STICKS_PER_PIXEL * ax.bbox.width
+    got_mz, got_heights = shown(stick)
+    np.testing.assert_array_equal(np.sort(got_mz), np.sort(mz[visible]))
+    np.testing.assert_array_equal(np.sort(got_heights), np.sort(heights[visible]))
+
+    # Still too many: decimated again, within the new limits only.
+    ax.set_xlim(400.0, 600.0)
+    got_mz, got_heights = shown(stick)
+    inside = (mz >= 400.0) & (mz <= 600.0)
+    assert len(got_mz) < inside.sum() and got_mz.min() >= 400.0 and got_mz.max() <= 600.0
+    pixels = int(ax.bbox.width)
+    assert (column_maxima(got_mz, got_heights, 400.0, 600.0, pixels)
+            == column_maxima(mz[inside], heights[inside], 400.0, 600.0, pixels))
+
+    ax.set_xlim(100.0, 1000.0)
+    assert len(shown(stick)[0]) <= int(ax.bbox.width) + 1
+
+    stick.remove()
+    ax.set_xlim(500.0, 500.5)
+    assert stick.collection not in ax.collections
+
+
+def test_without_decimation_every_stick_is_drawn(ax, sticks):
+    mz, heights = sticks
+    stick = StickCollection(ax, mz, heights, decimate=False)
+    ax.set_xlim(500.0, 500.5)
+    assert len(shown(stick)[0]) == len(mz)
@@ -0,0 +1,101 @@
+"""Memoized matching: keys, LRU eviction and the .npz spill."""
+import os
+
+import numpy as np
+import pytest
+
+from spectra.matching import dual_pairs
+from spectra.results_cache import ResultCache, frame_digest
+
+
+@pytest.fixture
+def frames(make_spectrum):
+    a = make_spectrum(200)
+    return a, make_spectrum(near=a["m/z"].to_numpy()[:120])
+
+
+def masks(i: int):
+    return np.arange(i, i + 3), np.arange(3), np.full(3, float(i))
+
+
+def assert_same_pairs(got, expected):
+    assert len(got) == len(expected)
+    for g, e in zip(got, expected):
+        np.testing.assert_array_equal(g, e)
+
+
+def test_pairs_match_dual_pairs_and_hit(frames):
+    a, b = frames
+    cache = ResultCache()
+    expected = dual_pairs(a, b, ppm_tol=3.0)
+    assert_same_pairs(cache.pairs(a, b, ppm_tol=3.0), expected)
+    assert_same_pairs(cache.pairs(a, b, ppm_tol=3.0), expected)
+    assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+    cache.pairs(a, b, ppm_tol=5.0)
+    cache.pairs(b, a, ppm_tol=3.0)
+    assert (cache.hits, cache.misses, len(cache)) == (1, 3, 3)
+
+
+def test_changed_spectrum_misses(frames):
+    a, b = frames
+    cache = ResultCache()
+    cache.pairs(a, b)
+    # Same sheet name, same row count, one peak moved: the key follows the content, not the name.
+    moved = b.copy()
+    moved.loc[0, "m/z"] += 0.01
+    assert frame_digest(moved) != frame_digest(b)
+    assert_same_pairs(cache.pairs(a, moved), dual_pairs(a, moved))
+    assert cache.misses == 2 and cache.hits == 0
+    # Columns matching does not look at leave the key alone.
+    louder = b.copy()
+    louder["Intensity"] *= 2
+    cache.pairs(a, louder)
+    assert cache.hits == 1
+
+
+def test_key():
+    key = ResultCache.key("dual", "a", "b", 3)
+    assert key == ResultCache.key("dual", "a", "b", 3.0)
+    assert len({key, ResultCache.key("dual", "b", "a", 3.0), ResultCache.key("dual", "a", "b", 3.5),
+                ResultCache.key("other", "a", "b", 3.0)}) == 4
+
+
+def test_lru_eviction():
+    cache = ResultCache(max_entries=2)
+    cache.put("k1", masks(1))
+    cache.put("k2", masks(2))
+    assert cache.get("k1") is not None
+    cache.put("k3", masks(3))
+    # k2 was the least recently used.
+    assert cache.get("k2") is None
+    assert cache.get("k1") is not None and cache.get("k3") is not None and len(cache) == 2
+
+
+def test_spill_and_reload(tmp_path):
+    spill = str(tmp_path / "spill")
+    cache = ResultCache(max_entries=1, spill_dir=spill)
+    cache.put("k1", masks(1))
+    assert not os.path.exists(spill)
+    cache.put("k2", masks(2))
+    assert os.listdir(spill) == ["k1.npz"]
+    assert_same_pairs(cache.get("k1"), masks(1))
+    # Reading k1 back pushed k2 out to disk in turn.
+    assert sorted(os.listdir(spill)) == ["k1.npz", "k2.npz"] and len(cache) == 1
+    assert_same_pairs(ResultCache(spill_dir=spill).get("k2"), masks(2))
+
+    (tmp_path / "spill" / "k3.npz").write_bytes(b"not a zip file")
+    assert cache.get("k3") is None
+
+
+def test_clear(tmp_path):
+    spill = str(tmp_path / "spill")
+    cache = ResultCache(max_entries=1, spill_dir=spill)
+    cache.put("k1", masks(1))
+    cache.put("k2", masks(2))
+    cache.clear(spilled=False)
+    assert len(cache) == 0 and os.listdir(spill) == ["k1.npz"]
+    assert cache.get("k2") is None and cache.get("k1") is not None
+    cache.clear()
+    assert len(cache) == 0 and os.listdir(spill) == []
+    assert cache.get("k1") is None
+    ResultCache().clear()
@@ -0,0 +1,57 @@
+"""The on-disk sheet cache: round trip, invalidation, and cached loads equal to parsed ones."""
+import os
+
+import numpy as np
+import pandas as pd
+
+from spectra.sheet_cache import SheetCache, cache_dir_for
+from spectra.workbook import LazyWorkbook
+
+
+def test_round_trip(tmp_path, make_spectrum):
+    path = tmp_path / "book.xlsx"
+    path.write_bytes(b"not parsed")
+    df = make_spectrum(50)
+    df["Label"] = ["peak"] * 50
+    cache = SheetCache(str(path), 6)
+    cache.put_all(["A", "B"], {"A": df})
+    assert not cache.is_complete()
+
+    again = SheetCache(str(path), 6)
+    assert again.sheet_names == ["A", "B"]
+    got = again.get("A")
+    pd.testing.assert_frame_equal(got.drop(columns="Label"), df.drop(columns="Label"))
+    assert got["Label"].tolist() == df["Label"].tolist()
+    assert again.get("B") is None
+
+
+def test_changed_file_or_skip_rows_invalidates(tmp_path, make_spectrum):
+    path = tmp_path / "book.xlsx"
+    path.write_bytes(b"one")
+    SheetCache(str(path), 6).put_all(["A"], {"A": make_spectrum(5)})
+    assert SheetCache(str(path), 7).sheet_names is None
+    path.write_bytes(b"longer contents")
+    assert SheetCache(str(path), 6).sheet_names is None
+
+
+def test_corrupt_meta_is_ignored(tmp_path, make_spectrum):
+    path = tmp_path / "book.xlsx"
+    path.write_bytes(b"one")
+    SheetCache(str(path), 6).put_all(["A"], {"A": make_spectrum(5)})
+    with open(os.path.join(cache_dir_for(str(path)), "meta.json"), "w") as fh:
+        fh.write("{")
+    assert SheetCache(str(path), 6).get("A") is None
+
+
+def test_cached_workbook_loads_like_a_parsed_one(write_workbook, make_spectrum):
+    path = write_workbook({"Blank": make_spectrum(80), "S1": make_spectrum(60)})
+    parsed = LazyWorkbook(path, 6, use_cache=False).frames()
+    LazyWorkbook(path, 6).frames()
+    assert SheetCache(path, 6).is_complete()
+    cached = LazyWorkbook(path, 6)
+    assert cached._reader is None
+    for name, df in cached.frames().items():
+        pd.testing.assert_frame_equal(df, parsed[name])
+    # The cache holds every peak; the S/N cut is applied after it.
+    everything = LazyWorkbook(path, 6, min_sn=None).frame("S1")
+    assert len(everything) == 60 and np.all(everything["Intensity"] > 0)
@@ -0,0 +1,101 @@
+"""The memory-mapped spectrum store, and subtracting against it from the CLI."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectra import cli
+from spectra.matching import PeakIndex, compare_dfs
+from spectra.readers import REQUIRED_COLUMNS
+from spectra.store import SpectrumStore
+
+
+def sorted_frame(df: pd.DataFrame) -> pd.DataFrame:
+    return df[list(REQUIRED_COLUMNS)].sort_values("m/z", kind="stable").reset_index(drop=True)
+
+
+@pytest.fixture
+def spectra(make_spectrum):
+    return {"Blank": make_spectrum(300), "S1": make_spectrum(200), "S2": make_spectrum(100)}
+
+
+@pytest.fixture
+def store(tmp_path, spectra):
+    store = SpectrumStore(str(tmp_path / "library"))
+    store.import_data(spectra)
+    return store
+
+
+def test_append_sorts_and_persists(store, spectra):
+    reopened = SpectrumStore(store.path, create=False)
+    assert reopened.names() == ["Blank", "S1", "S2"] and len(reopened) == 3
+    for name, df in spectra.items():
+        pd.testing.assert_frame_equal(reopened.frame(name), sorted_frame(df))
+    with pytest.raises(ValueError, match="already in the store"):
+        store.append("S1", spectra["S2"])
+    store.append("S1", spectra["S2"], replace=True)
+    pd.testing.assert_frame_equal(store.frame("S1"), sorted_frame(spectra["S2"]))
+
+
+def test_missing_store(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        SpectrumStore(str(tmp_path / "nowhere"), create=False)
+
+
+def test_views_are_zero_copy(store, spectra):
+    arrays = store.arrays("S1")
+    assert all(isinstance(arr.base, np.memmap) or isinstance(arr, np.memmap) for arr in arrays.values())
+    frame = store.frame("S1")
+    assert all(np.shares_memory(frame[col].to_numpy(), arrays[col]) for col in REQUIRED_COLUMNS)
+    index = store.index("S1")
+    assert np.shares_memory(index.mz, arrays["m/z"]) and np.shares_memory(index.half_width, arrays["half_width"])
+    built = PeakIndex.from_frame(spectra["S1"])
+    np.testing.assert_array_equal(index.mz, built.mz)
+    np.testing.assert_array_equal(index.half_width, built.half_width)
+
+
+def test_stored_index_matches_like_a_frame(store, spectra, make_spectrum):
+    target = pd.concat([make_spectrum(150), make_spectrum(near=spectra["Blank"]["m/z"].to_numpy()[:100])],
+                       ignore_index=True)
+    pd.testing.assert_frame_equal(compare_dfs(target, store.index("Blank")), compare_dfs(target, spectra["Blank"]))
+
+
+def test_delete_and_compact(store, spectra):
+    store.delete("S2")
+    assert "S2" not in store and store._dead == 100
+    store.compact()
+    assert store._rows == 500 and store._dead == 0
+    reopened = SpectrumStore(store.path, create=False)
+    for name in ("Blank", "S1"):
+        pd.testing.assert_frame_equal(reopened.frame(name), sorted_frame(spectra[name]))
+    assert sorted(os.listdir(store.path)) == sorted(["index.json"] + [
+        f"{stem}.1.f64" for stem in ("mz", "intensity", "relative", "resolution", "noise", "half_width")])
+
+
+def test_auto_compact_keeps_handed_out_views(store, spectra):
+    held = store.frame("S2")
+    store.delete("Blank")
+    assert store._dead == 300 and store._rows == 600
+    store.delete("S1")
+    # Deleted rows now outnumber live ones.
+    assert store._rows == 100 and store._dead == 0 and store.names() == ["S2"]
+    pd.testing.assert_frame_equal(held, sorted_frame(spectra["S2"]))
+    pd.testing.assert_frame_equal(store.frame("S2"), sorted_frame(spectra["S2"]))
+    store.append("S1", spectra["S1"])
+    pd.testing.assert_frame_equal(SpectrumStore(store.path).frame("S1"), sorted_frame(spectra["S1"]))
+
+
+def test_subtract_against_library(tmp_path, store, spectra, make_spectrum, write_workbook, capsys):
+    run = pd.concat([make_spectrum(80), make_spectrum(near=spectra["Blank"]["m/z"].to_numpy()[:50])],
+                    ignore_index=True)
+    book = write_workbook({"Run": run, "Other": make_spectrum(40)})
+    out = tmp_path / "out"
+    argv = ["subtract", book, "--library", store.path, "--reference", "Blank", "--target", "Run",
+            "--no-plots", "--no-cache", "--min-sn", "0", "--ppm", "3", "-j", "1", "--out", str(out)]
+    assert cli.main(argv) == 0
+    got = pd.read_csv(out / "Run_subtracted_Blank.csv")
+    np.testing.assert_allclose(got["m/z"], compare_dfs(run, spectra["Blank"])["m/z"])
+
+    assert cli.main(argv[:5] + ["Nowhere"] + argv[6:]) == 2
+    assert "Unknown sheets: ['Nowhere']" in capsys.readouterr().err
@@ -0,0 +1,78 @@
+"""Result table export in every format."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spectra import tables
+from spectra.tables import TableWriter
+
+
+@pytest.fixture
+def result() -> pd.DataFrame:
+    return pd.DataFrame({"m/z": [100.5, 200.25, np.nan], "Count": [1, 2, 3],
+                         "Fold change": [2.0, np.inf, -np.inf], "Removed by": ["Blank", "Blank, S2", ""]})
+
+
+def test_csv(tmp_path, result):
+    with TableWriter(str(tmp_path), "csv") as writer:
+        path = writer.write(result, "S1 subtracted Blank", "_matched")
+    assert path == os.path.join(str(tmp_path), "S1_subtracted_Blank_matched.csv")
+    pd.testing.assert_frame_equal(pd.read_csv(path, keep_default_na=False, na_values=[""]).fillna({"Removed by": ""}),
+                                  result)
+
+
+@pytest.mark.parametrize("engine", ["openpyxl", "xlsxwriter"])
+def test_xlsx(tmp_path, monkeypatch, result, engine):
+    pytest.importorskip(engine)
+    monkeypatch.setattr(tables, "xlsx_engine", lambda: engine)
+    with TableWriter(str(tmp_path), "xlsx", workbook_name="book_subtractions") as writer:
+        first = writer.write(result, "S1 subtracted Blank")
+        writer.write(result.iloc[:0], "S1 subtracted Blank", "_only_B")
+        long = writer.write(result, "Sample with a long name: run [2] subtracted Blank")
+        again = writer.write(result, "Sample with a long name: run [2] subtracted Blank")
+    path = os.path.join(str(tmp_path), "book_subtractions.xlsx")
+    assert first == f"{path} [S1_subtracted_Blank]"
+    sheets = pd.read_excel(path, sheet_name=None)
+    names = list(sheets)
+    assert names[-1] == "Contents"
+    assert all(len(name) <= 31 and not set(name) & set("[]:*?/\\") for name in names)
+    assert long != again and len(set(names)) == len(names) == 5
+    got = sheets["S1_subtracted_Blank"]
+    np.testing.assert_array_equal(got["m/z"], result["m/z"])
+    assert np.isinf(got["Fold change"][1:]).all()
+    book = pytest.importorskip("openpyxl").load_workbook(path, read_only=True)
+    cells = [row[2] for row in book["S1_subtracted_Blank"].iter_rows(min_row=2, values_only=True)]
+    book.close()
+    assert cells == [2.0, "inf", "-inf"]
+    assert sheets["S1_subtracted_Blank_only_B"].columns.tolist() == result.columns.tolist()
+    contents = sheets["Contents"]
+    assert contents["Table"].tolist()[:2] == ["S1 subtracted Blank", "S1 subtracted Blank only B"]
+    assert contents["Rows"].tolist() == [3, 0, 3, 3]
+
+
+def test_xlsx_splits_tall_tables(tmp_path, monkeypatch, result):
+    monkeypatch.setattr(tables, "MAX_SHEET_ROWS", 2)
+    with TableWriter(str(tmp_path), "xlsx") as writer:
+        written = writer.write(result, "big")
+    assert written.endswith("[big, big~2]")
+    sheets = pd.read_excel(writer.path, sheet_name=None)
+    assert len(sheets["big"]) == 2 and len(sheets["big~2"]) == 1
+
+
+def test_parquet(tmp_path, result):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        with pytest.raises(ImportError, match="pyarrow"):
+            TableWriter(str(tmp_path), "parquet")
+        return
+    with TableWriter(str(tmp_path), "parquet") as writer:
+        path = writer.write(result, "S1 subtracted Blank")
+    pd.testing.assert_frame_equal(pd.read_parquet(path), result)
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError, match="Unknown table format"):
+        TableWriter(str(tmp_path), "json")